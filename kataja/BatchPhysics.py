@@ -0,0 +1,170 @@
+# coding=utf-8
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class BatchPhysics:
+    """ Packs visible nodes and their edges into NumPy arrays so that a visualization can
+    compute movement for whole frame in one vectorized pass.
+
+    Visualizations that support this implement calculate_batch_movement(batch), which returns
+    arrays of x and y velocities, one for each packed node. Scalar calculate_movement is the
+    reference implementation: batch step computes all forces from positions at the start of
+    the frame, where scalar step sees the nodes that have already moved during this frame.
+
+    Repulsion is computed only between nodes in neighbouring cells of a uniform grid, like
+    SpatialIndex does for scalar calculate_movement. Cells are large enough that nodes further
+    apart can't affect each other.
+
+    BatchPhysics doesn't save its state, it is purely derivative from nodes.
+    """
+    # Up to this many nodes all pairs are computed in one block, it is cheaper than the grid.
+    block_size = 512
+    min_cell_size = 20
+
+    def __init__(self, visualization):
+        self.visualization = visualization
+        self.nodes = []
+        self.index = {}
+        self.x = self.y = None
+        self.width = self.height = None
+        self.physics_x = self.physics_y = None
+        self.locked_to = None
+        self.gravity = None
+        self.has_edges_up = self.has_edges_down = None
+        self.edge_start = self.edge_end = self.edge_pull = None
+        self.edge_start_x = self.edge_start_y = self.edge_end_x = self.edge_end_y = None
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    def pack(self, nodes):
+        """ Read node positions, sizes, physics flags and edges into arrays.
+        :param nodes: iterable of visible nodes
+        :return: None
+        """
+        vis = self.visualization
+        self.nodes = list(nodes)
+        self.index = index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        positions = [vis.repulsion_position(node) for node in self.nodes]
+        self.x = np.fromiter((p[0] for p in positions), dtype=float, count=n)
+        self.y = np.fromiter((p[1] for p in positions), dtype=float, count=n)
+        self.width = np.fromiter((node.width for node in self.nodes), dtype=float, count=n)
+        self.height = np.fromiter((node.height for node in self.nodes), dtype=float, count=n)
+        self.physics_x = np.fromiter((bool(node.physics_x) for node in self.nodes), dtype=bool,
+                                     count=n)
+        self.physics_y = np.fromiter((bool(node.physics_y) for node in self.nodes), dtype=bool,
+                                     count=n)
+        self.gravity = np.fromiter((node._gravity for node in self.nodes), dtype=float, count=n)
+        self.has_edges_up = np.fromiter((bool(node.edges_up) for node in self.nodes), dtype=bool,
+                                        count=n)
+        self.has_edges_down = np.fromiter((bool(node.edges_down) for node in self.nodes),
+                                          dtype=bool, count=n)
+        self.locked_to = np.fromiter((index.get(node.locked_to_node, -1) for node in self.nodes),
+                                     dtype=int, count=n)
+        starts = []
+        ends = []
+        pulls = []
+        points = []
+        for i, node in enumerate(self.nodes):
+            for edge in node.edges_down:
+                j = index.get(edge.end, -1)
+                if j < 0:
+                    continue
+                starts.append(i)
+                ends.append(j)
+                pulls.append(edge.pull)
+                points.append(edge.start_point + edge.end_point)
+        self.edge_start = np.array(starts, dtype=int)
+        self.edge_end = np.array(ends, dtype=int)
+        self.edge_pull = np.array(pulls, dtype=float)
+        points = np.array(points, dtype=float).reshape(-1, 4)
+        self.edge_start_x, self.edge_start_y, self.edge_end_x, self.edge_end_y = points.T
+
+    def reach(self):
+        """ Distance beyond which nodes don't repulse each other: repulsion range of
+        visualization and the largest node extents, with some room for distances that
+        visualizations truncate to integers.
+        :return: float
+        """
+        return self.visualization.repulsion_range + self.width.max() + self.height.max() + 2
+
+    def pairs(self):
+        """ Generate blocks of pairwise distances for repulsion. Each block has nodes of one
+        grid cell as rows and nodes of that and the neighbouring cells as columns. Pairs of a
+        node with itself and pairs where one node is locked to other are masked out.
+        :return: iterator of (rows, cols, dist_x, dist_y, mask), where rows and cols are arrays
+        of node indices and dist arrays have shape (rows, cols).
+        """
+        n = len(self.nodes)
+        if n <= self.block_size:
+            everything = np.arange(n)
+            yield self._block(everything, everything)
+            return
+        cell_size = max(self.min_cell_size, self.reach())
+        cell_x = np.floor(self.x / cell_size).astype(int).tolist()
+        cell_y = np.floor(self.y / cell_size).astype(int).tolist()
+        cells = defaultdict(list)
+        for i, key in enumerate(zip(cell_x, cell_y)):
+            cells[key].append(i)
+        cells = {key: np.array(members, dtype=int) for key, members in cells.items()}
+        for (cx, cy), rows in cells.items():
+            cols = [cells[key] for key in ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in
+                                           (-1, 0, 1)) if key in cells]
+            yield self._block(rows, np.concatenate(cols))
+
+    def _block(self, rows, cols):
+        row_ids = rows[:, None]
+        col_ids = cols[None, :]
+        dist_x = self.x[rows][:, None] - self.x[cols][None, :]
+        dist_y = self.y[rows][:, None] - self.y[cols][None, :]
+        mask = (row_ids != col_ids) & \
+               (self.locked_to[cols][None, :] != row_ids) & \
+               (self.locked_to[rows][:, None] != col_ids)
+        return rows, cols, dist_x, dist_y, mask
+
+    def step(self, nodes):
+        """ Compute movement for all given nodes.
+        :param nodes: iterable of visible nodes
+        :return: dict of node -> (xvel, yvel, 0), or None if visualization can't do batch
+        movement.
+        """
+        self.pack(nodes)
+        if not self.nodes:
+            return {}
+        result = self.visualization.calculate_batch_movement(self)
+        if result is None:
+            return None
+        xvel, yvel = result
+        xvel = np.where(self.physics_x, xvel, 0.0)
+        yvel = np.where(self.physics_y, yvel, 0.0)
+        return {node: (float(xv), float(yv), 0) for node, xv, yv in zip(self.nodes, xvel,
+                                                                          yvel)}
@@ -0,0 +1,297 @@
+# coding=utf-8
+""" Structural diffs for container-type SavedFields. Undo stack stores only the changed part of a
+list, dict or set instead of copies of the whole container before and after the change.
+
+Containers changed with SavedObject.poke are copied before the change and compared after it.
+Containers changed with SavedObject.set_item, del_item, append_item, insert_item or remove_item
+have their changes recorded as they are done, see ContainerRecorder.
+"""
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+
+
+class Missing:
+    """ Marker for dict keys that don't exist. Pickles as a reference to MISSING so that
+    identity checks work after undo data has been written to disk and read back. """
+
+    def __reduce__(self):
+        return 'MISSING'
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = Missing()
+
+
+class ContainerDiff:
+    """ Base class for diffs. Diffs are applied to copies of the current value, so the
+    containers themselves are never modified in place. """
+
+    def apply(self, value):
+        """ Return a new container where this change is done to value (redo).
+        :param value: container in the state before the change
+        :return: container in the state after the change
+        """
+        raise NotImplementedError
+
+    def revert(self, value):
+        """ Return a new container where this change is undone from value (undo).
+        :param value: container in the state after the change
+        :return: container in the state before the change
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        """ Size of the diff as count of stored elements """
+        raise NotImplementedError
+
+
+class ListDiff(ContainerDiff):
+    """ Lists are compared by trimming common items from both ends, the remaining slice is the
+    change. This makes append, insert, pop and single replacements cheap to store. """
+
+    def __init__(self, start, old_items, new_items):
+        self.start = start
+        self.old_items = old_items
+        self.new_items = new_items
+
+    @staticmethod
+    def compute(old, new):
+        lo = len(old)
+        ln = len(new)
+        shorter = min(lo, ln)
+        start = 0
+        while start < shorter and (old[start] is new[start] or old[start] == new[start]):
+            start += 1
+        end = 0
+        while end < shorter - start and \
+                (old[lo - 1 - end] is new[ln - 1 - end] or old[lo - 1 - end] == new[ln - 1 - end]):
+            end += 1
+        return ListDiff(start, old[start:lo - end], new[start:ln - end])
+
+    def apply(self, value):
+        value = list(value)
+        value[self.start:self.start + len(self.old_items)] = self.new_items
+        return value
+
+    def revert(self, value):
+        value = list(value)
+        value[self.start:self.start + len(self.new_items)] = self.old_items
+        return value
+
+    def __len__(self):
+        return len(self.old_items) + len(self.new_items)
+
+    def __repr__(self):
+        return 'ListDiff(%s, %r, %r)' % (self.start, self.old_items, self.new_items)
+
+
+class DictDiff(ContainerDiff):
+    """ Dicts store old and new values only for keys that were added, removed or replaced. Missing
+    keys are marked with MISSING. """
+
+    def __init__(self, old_items, new_items):
+        self.old_items = old_items
+        self.new_items = new_items
+
+    @staticmethod
+    def compute(old, new):
+        old_items = {}
+        new_items = {}
+        for key, old_value in old.items():
+            new_value = new.get(key, MISSING)
+            if new_value is not old_value and new_value != old_value:
+                old_items[key] = old_value
+                new_items[key] = new_value
+        for key, new_value in new.items():
+            if key not in old:
+                old_items[key] = MISSING
+                new_items[key] = new_value
+        return DictDiff(old_items, new_items)
+
+    @staticmethod
+    def _set_items(value, items):
+        value = value.copy()
+        for key, item in items.items():
+            if item is MISSING:
+                value.pop(key, None)
+            else:
+                value[key] = item
+        return value
+
+    def apply(self, value):
+        return self._set_items(value, self.new_items)
+
+    def revert(self, value):
+        return self._set_items(value, self.old_items)
+
+    def __len__(self):
+        return len(self.new_items)
+
+    def __repr__(self):
+        return 'DictDiff(%r, %r)' % (self.old_items, self.new_items)
+
+
+class SetDiff(ContainerDiff):
+    """ Sets store removed and added members. """
+
+    def __init__(self, removed, added):
+        self.removed = removed
+        self.added = added
+
+    @staticmethod
+    def compute(old, new):
+        return SetDiff(old - new, new - old)
+
+    def apply(self, value):
+        return (value - self.removed) | self.added
+
+    def revert(self, value):
+        return (value - self.added) | self.removed
+
+    def __len__(self):
+        return len(self.removed) + len(self.added)
+
+    def __repr__(self):
+        return 'SetDiff(%r, %r)' % (self.removed, self.added)
+
+
+class ListEdits(ContainerDiff):
+    """ Sequence of slice replacements (ListDiffs) in the order they were done. Used for list
+    changes that were recorded one operation at a time. """
+
+    def __init__(self, edits):
+        self.edits = edits
+
+    def apply(self, value):
+        value = list(value)
+        for edit in self.edits:
+            value[edit.start:edit.start + len(edit.old_items)] = edit.new_items
+        return value
+
+    def revert(self, value):
+        value = list(value)
+        for edit in reversed(self.edits):
+            value[edit.start:edit.start + len(edit.new_items)] = edit.old_items
+        return value
+
+    def __len__(self):
+        return sum(len(edit) for edit in self.edits)
+
+    def __repr__(self):
+        return 'ListEdits(%r)' % self.edits
+
+
+class ContainerRecorder:
+    """ Records changes to a container when they are done, so that the container doesn't have
+    to be copied before the change or compared after it. Work done is proportional to the
+    number of changes, not to the size of the container. See SavedObject.set_item and others.
+    """
+    kind = None
+
+    def __init__(self, container):
+        self.container = container
+
+    def diff(self):
+        """
+        :return: ContainerDiff of recorded changes
+        """
+        raise NotImplementedError
+
+    def original(self):
+        """
+        :return: copy of the container as it was before the recorded changes
+        """
+        return self.diff().revert(self.container)
+
+
+class DictRecorder(ContainerRecorder):
+    """ Remembers the old value for each key that is set or deleted """
+    kind = dict
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.old_items = {}
+
+    def record(self, key):
+        """ Call before setting or deleting key.
+        :param key:
+        """
+        if key not in self.old_items:
+            self.old_items[key] = self.container.get(key, MISSING)
+
+    def diff(self):
+        old_items = {}
+        new_items = {}
+        for key, old_value in self.old_items.items():
+            new_value = self.container.get(key, MISSING)
+            if new_value is not old_value and new_value != old_value:
+                old_items[key] = old_value
+                new_items[key] = new_value
+        return DictDiff(old_items, new_items)
+
+
+class ListRecorder(ContainerRecorder):
+    """ Remembers inserted and removed items with their positions """
+    kind = list
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.edits = []
+
+    def insert(self, index, item):
+        """ Call before inserting item.
+        :param index: position of item after insertion, 0 <= index <= len(container)
+        :param item:
+        """
+        self.edits.append(ListDiff(index, [], [item]))
+
+    def remove(self, index):
+        """ Call before removing item.
+        :param index: position of item, 0 <= index < len(container)
+        """
+        self.edits.append(ListDiff(index, [self.container[index]], []))
+
+    def diff(self):
+        return ListEdits(list(self.edits))
+
+
+def container_diff(old, new):
+    """ Return structural diff between two containers of same type, or None if they are not
+    of a type that can be diffed (subclasses of containers are not, as they may have their own
+    rules for copying).
+    :param old: value before change
+    :param new: value after change
+    :return: ContainerDiff or None
+    """
+    t = type(new)
+    if type(old) is not t:
+        return None
+    elif t is list:
+        return ListDiff.compute(old, new)
+    elif t is dict:
+        return DictDiff.compute(old, new)
+    elif t is set:
+        return SetDiff.compute(old, new)
+    return None
@@ -38,6 +38,7 @@ from kataja.parser.LatexToINode import LatexFieldToINode
 from kataja.parser.HTMLToINode import HTMLToINode
 from kataja.parser.PlainTextToINode import PlainTextToINode
 from kataja.parser.QDocumentToINode import QDocumentToINode
+from kataja.LabelLayoutCache import LabelLayoutCache
 
 
 class Controller:
@@ -101,6 +102,7 @@ class Controller:
         self.html_field_parser = HTMLToINode(rows_mode=False)
         self.plain_field_parser = PlainTextToINode(rows_mode=False)
         self.qdocument_parser = QDocumentToINode()
+        self.label_layouts = LabelLayoutCache()
         # -- After user action, should the visualization be redrawn and
         # should it make an undo savepoint
         # these are True by default, but action method may toggle them off
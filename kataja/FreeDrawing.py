@@ -139,6 +139,7 @@ class FreeDrawing:
             node.set_original_position(pos)
             # node.update_position(pos)
         self.f.add_to_scene(node)
+        self.f.tree_manager.nodes_changed(node)
         return node
 
     def create_feature_node(self, label='feature', value='', family='', host=None):
@@ -267,6 +268,7 @@ class FreeDrawing:
             return
         else:
             self._marked_for_deletion.add(node)
+        self.f.tree_manager.nodes_changed(node)
 
         # -- connections to other nodes --
         if touch_edges:
@@ -294,8 +296,8 @@ class FreeDrawing:
 
         # -- dictionaries --
         if node.uid in self.nodes:
-            self.poke('nodes')
-            del self.nodes[node.uid]
+            self.f.del_item('nodes', node.uid)
+            self.f.structure_edits += 1
         if node.syntactic_object:
             if node.syntactic_object.uid in self.f.nodes_from_synobs:
                 del self.f.nodes_from_synobs[node.syntactic_object.uid]
@@ -351,26 +353,23 @@ class FreeDrawing:
         # -- selections --
         ctrl.remove_from_selection(edge)
         if touch_nodes:
+            self.f.tree_manager.nodes_changed(start_node, end_node)
             if start_node:
                 if edge in start_node.edges_down:
-                    start_node.poke('edges_down')
-                    start_node.edges_down.remove(edge)
+                    start_node.remove_item('edges_down', edge)
                 if edge in start_node.edges_up:  # shouldn't happen
-                    start_node.poke('edges_up')
-                    start_node.edges_up.remove(edge)
+                    start_node.remove_item('edges_up', edge)
             if end_node:
                 if edge in end_node.edges_down:  # shouldn't happen
-                    end_node.poke('edges_down')
-                    end_node.edges_down.remove(edge)
+                    end_node.remove_item('edges_down', edge)
                 if edge in end_node.edges_up:
-                    end_node.poke('edges_up')
-                    end_node.edges_up.remove(edge)
+                    end_node.remove_item('edges_up', edge)
         # -- ui_support elements --
         ctrl.ui.remove_ui_for(edge)
         # -- dictionaries --
         if edge.uid in self.edges:
-            self.poke('edges')
-            del self.edges[edge.uid]
+            self.f.del_item('edges', edge.uid)
+            self.f.structure_edits += 1
         # -- check if it is last of its type --
         found = False
         my_type = edge.edge_type
@@ -414,12 +413,12 @@ class FreeDrawing:
         :param new_start:
         """
         assert new_start.uid in self.nodes
+        self.f.tree_manager.nodes_changed(edge.start, new_start, edge.end)
         if edge.start:
-            edge.start.poke('edges_down')
-            edge.start.edges_down.remove(edge)
+            edge.start.remove_item('edges_down', edge)
         edge.connect_end_points(new_start, edge.end)
-        new_start.poke('edges_down')
-        new_start.edges_down.append(edge)
+        new_start.append_item('edges_down', edge)
+        self.f.structure_edits += 1
 
     def set_edge_end(self, edge, new_end):
         """
@@ -429,12 +428,12 @@ class FreeDrawing:
         """
 
         assert new_end.uid in self.nodes
+        self.f.tree_manager.nodes_changed(edge.end, new_end, edge.start)
         if edge.end:
-            edge.end.poke('edges_up')
-            edge.end.edges_up.remove(edge)
+            edge.end.remove_item('edges_up', edge)
         edge.connect_end_points(edge.start, new_end)
-        new_end.poke('edges_up')
-        new_end.edges_up.append(edge)
+        new_end.append_item('edges_up', edge)
+        self.f.structure_edits += 1
 
     def add_feature_to_node(self, feature, node):
         self.connect_node(parent=node, child=feature)
@@ -512,47 +511,45 @@ class FreeDrawing:
                                     end=child,
                                     edge_type=edge_type,
                                     fade=fade_in)
-        child.poke('edges_up')
-        parent.poke('edges_down')
+        self.f.tree_manager.nodes_changed(parent, child)
         if direction == g.LEFT:
-            child.edges_up.insert(0, new_edge)
-            parent.edges_down.insert(0, new_edge)
+            child.insert_item('edges_up', 0, new_edge)
+            parent.insert_item('edges_down', 0, new_edge)
         else:
-            child.edges_up.append(new_edge)
-            parent.edges_down.append(new_edge)
+            child.append_item('edges_up', new_edge)
+            parent.append_item('edges_down', new_edge)
         if hasattr(child, 'on_connect'):
             child.on_connect(parent)
         return new_edge
 
     def partial_disconnect(self, edge, start=True, end=True):
         print('partial disconnect called, start: %s, end: %s' % (start, end))
+        self.f.tree_manager.nodes_changed(edge.start, edge.end)
         if start and edge.start:
-            edge.start.poke('edges_down')
-            edge.start.edges_down.remove(edge)
+            edge.start.remove_item('edges_down', edge)
             bx, by = edge.start.bottom_center_magnet()
             edge.start = None
             edge.set_start_point(bx, by + 10)
         if end and edge.end:
-            edge.end.poke('edges_up')
             bx, by = edge.end.top_center_magnet()
-            edge.end.edges_up.remove(edge)
+            edge.end.remove_item('edges_up', edge)
             edge.end = None
             edge.set_end_point(bx, by - 10)
         edge.update_end_points()
+        self.f.structure_edits += 1
 
     def disconnect_edge(self, edge):
         """ Does the local mechanics of edge removal
         :param edge:
         :return:
         """
+        self.f.tree_manager.nodes_changed(edge.start, edge.end)
         if edge.start:
             if edge in edge.start.edges_down:
-                edge.start.poke('edges_down')
-                edge.start.edges_down.remove(edge)
+                edge.start.remove_item('edges_down', edge)
         if edge.end:
             if edge in edge.end.edges_up:
-                edge.end.poke('edges_up')
-                edge.end.edges_up.remove(edge)
+                edge.end.remove_item('edges_up', edge)
         self.delete_edge(edge)
 
     def disconnect_node(self, parent=None, child=None, edge_type='', edge=None):
@@ -851,6 +848,8 @@ class FreeDrawing:
             root.poke('triangle_stack')
             root.triangle_stack.append(root)
         fold_scope = self.f.list_nodes_once(root)[1:]
+        # folding hides nodes, so nodes whose parents are hidden are now roots
+        self.f.tree_manager.nodes_changed(root, *fold_scope)
         folded = []
         bad_mothers = set()
         if not fold_scope: # triangle is just visual addition to label
@@ -902,6 +901,7 @@ class FreeDrawing:
         :param node:
         """
         fold_scope = [f for f in self.f.list_nodes_once(root)]
+        self.f.tree_manager.nodes_changed(*fold_scope)
         for node in fold_scope:
             if (not node.triangle_stack) or node.triangle_stack[-1] is not root:
                 print('node in triangles fold scope doesnt have triangle root in triangle_stack:',
@@ -937,16 +937,16 @@ class FreeDrawing:
     def create_group(self):
         group = Group(selection=[], persistent=True)
         self.f.add_to_scene(group)
-        self.poke('groups')
-        self.groups[group.uid] = group
+        self.f.set_item('groups', group.uid, group)
+        self.f.structure_edits += 1
         return group
 
     def remove_group(self, group):
         self.f.remove_from_scene(group)
         ctrl.ui.remove_ui_for(group)
         if group.uid in self.groups:
-            self.poke('groups')
-            del self.groups[group.uid]
+            self.f.del_item('groups', group.uid)
+            self.f.structure_edits += 1
 
     def get_group_color_suggestion(self):
         color_keys = set()
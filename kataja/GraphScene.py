@@ -32,7 +32,7 @@ from PyQt5.QtCore import Qt
 
 import kataja.globals as g
 from kataja.singletons import ctrl, prefs, qt_prefs
-from kataja.utils import to_tuple, sub_xy, div_xy, open_symbol_data, time_me
+from kataja.utils import to_tuple, open_symbol_data, time_me
 from kataja.saved.Edge import Edge
 from kataja.saved.movables.Node import Node
 
@@ -220,7 +220,7 @@ class GraphScene(QtWidgets.QGraphicsScene):
         :param path:
         :param forest:
         """
-        pass
+        forest.settle_layout()
         # export_visible_items(path = path, scene = self, forest = forest,
         # prefs = prefs)
 
@@ -585,11 +585,8 @@ class GraphScene(QtWidgets.QGraphicsScene):
         # n_time = time.time()
         # print((n_time - self.prev_time) * 1000, prefs._fps_in_msec)
         # self.prev_time = n_time
-        items_have_moved = False
         frame_has_moved = False
         background_fade = False
-        can_normalize = True
-        md = {'sum': (0, 0), 'nodes': []}
         ctrl.items_moving = True
         if self._fade_steps:
             self.setBackgroundBrush(self._fade_steps_list[self._fade_steps - 1])
@@ -602,35 +599,16 @@ class GraphScene(QtWidgets.QGraphicsScene):
 
         if ctrl.pressed:
             return
-        for node in chain(f.nodes.values(), f.trees):
-            if not node.isVisible():
-                continue
-            # Computed movement
-            moved, normalizable = node.move(md)
-            if moved:
-                items_have_moved = True
-            if not normalizable:
-                can_normalize = False
-
-        # normalize movement so that the trees won't glide away
-        ln = len(md['nodes'])
-        if ln and can_normalize:
-            avg = div_xy(md['sum'], ln)
-            for node in md['nodes']:
-                node.current_position = sub_xy(node.current_position, avg)
-
-        if items_have_moved:
-            for e in f.edges.values():
-                e.make_path()
+        items_have_moved, _ = f.move_nodes()
 
-        if items_have_moved and (not self.manual_zoom) and (not ctrl.dragged_focus):
-            self.fit_to_window()
         if items_have_moved:
+            # edges and groups are updated only for the items that moved, see f.paths_rebuilt
+            f.update_moved_paths()
+            if (not self.manual_zoom) and (not ctrl.dragged_focus):
+                self.fit_to_window()
             #self.main.ui_manager.get_activity_marker().show()
             # for area in f.touch_areas:
             # area.update_position()
-            for group in f.groups.values():
-                group.update_shape()
         elif not (items_have_moved or frame_has_moved or background_fade):
             self.stop_animations()
             self.main.ui_manager.get_activity_marker().hide()
@@ -0,0 +1,187 @@
+# coding=utf-8
+""" Indexed save file format where each forest is a separately compressed record.
+
+File layout:
+    MAGIC
+    header record: save data of the objects outside forests (KatajaMain, KatajaDocument...)
+    forest records: save data of each forest and everything it contains, e.g. derivation steps
+    index: uids, offsets and lengths of records
+    8 bytes: offset of the index
+
+Records are zlib-compressed pickles of the same dicts that SavedObject.save_object produces.
+When opening a file only the header is restored, forests are created as empty placeholders and
+KatajaDocument loads their records when they are shown. Forest records refer to objects in the
+header by their uids, so the objects restored from the header are kept for loading forests.
+"""
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+import os
+import pickle
+import struct
+import zlib
+
+from kataja.SavedObject import SaveError, save_objects
+from kataja.saved.Forest import Forest
+
+MAGIC = b'KATAJAPACK'
+VERSION = 1
+pickle_format = 4
+
+
+def pack_record(data):
+    return zlib.compress(pickle.dumps(data, protocol=pickle_format))
+
+
+def unpack_record(raw):
+    return pickle.loads(zlib.decompress(raw))
+
+
+def collect_save_data(objects, savedata, skip=(), forests=None):
+    """ Save given objects and everything they refer to into savedata. Objects with uids in
+    skip are left out. Referred forests are left out and collected into forests -dict.
+    :param objects: list of SavedObjects to start from
+    :param savedata: dict where save data of objects goes
+    :param skip: uids of objects that are stored elsewhere
+    :param forests: dict to collect referred forests, uid -> forest
+    :return: None
+    """
+
+    def _stored_elsewhere(obj):
+        if obj.uid in skip:
+            return True
+        elif isinstance(obj, Forest):
+            if forests is not None:
+                forests[obj.uid] = obj
+            return True
+        return False
+
+    save_objects(objects, savedata, skip=_stored_elsewhere)
+
+
+def save_pack(filename, main):
+    """ Write current document of main into an indexed save file.
+    :param filename:
+    :param main: KatajaMain
+    :return: None
+    """
+    header = {'save_scheme_version': 0.4}
+    forests = {}
+    collect_save_data([main], header, forests=forests)
+    lazy = main.forest_keeper.lazy_forests if main.forest_keeper else {}
+    records = [pack_record(header)]
+    forest_uids = []
+    for uid, forest in forests.items():
+        reader = lazy.get(forest, None)
+        if reader:
+            # not loaded yet, copy the record as it is
+            records.append(reader.raw_forest(uid))
+        else:
+            savedata = {}
+            collect_save_data([forest], savedata, skip=header, forests={})
+            records.append(pack_record(savedata))
+        forest_uids.append(uid)
+
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<H', VERSION))
+        positions = []
+        for record in records:
+            positions.append((f.tell(), len(record)))
+            f.write(record)
+        index = {'header': positions[0], 'forests': list(zip(forest_uids, positions[1:]))}
+        index_offset = f.tell()
+        f.write(pickle.dumps(index, protocol=pickle_format))
+        f.write(struct.pack('<Q', index_offset))
+    os.replace(temp_filename, filename)
+
+
+class PackReader:
+    """ Reads records from indexed save file. Only the index is read when created, records are
+    read when asked. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise SaveError('not a Kataja pack file: %s' % filename)
+            version, = struct.unpack('<H', f.read(2))
+            if version > VERSION:
+                raise SaveError('pack file version %s is too new' % version)
+            f.seek(-8, os.SEEK_END)
+            index_offset, = struct.unpack('<Q', f.read(8))
+            end = f.seek(0, os.SEEK_END) - 8
+            f.seek(index_offset)
+            index = pickle.loads(f.read(end - index_offset))
+        self.header_position = index['header']
+        self.forest_positions = dict(index['forests'])
+        self.forest_uids = [uid for uid, position in index['forests']]
+        self.header_objects = {}  # uid -> object restored from header
+
+    def _read(self, position):
+        offset, length = position
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read_header(self):
+        return unpack_record(self._read(self.header_position))
+
+    def raw_forest(self, uid):
+        return self._read(self.forest_positions[uid])
+
+    def read_forest(self, uid):
+        return unpack_record(self.raw_forest(uid))
+
+    def restore_header(self, main):
+        """ Restore objects outside forests into main. Forests are empty placeholders.
+        :param main: KatajaMain
+        :return: dict of uid -> placeholder Forest
+        """
+        placeholders = self.create_placeholders()
+        restored = dict(placeholders)
+        main.load_objects(self.read_header(), main, restored=restored)
+        self.header_objects = restored
+        return placeholders
+
+    def restore_forest(self, forest, main):
+        """ Load data of placeholder forest. References to objects in the header get the objects
+        that were restored from it.
+        :param forest: placeholder Forest
+        :param main: KatajaMain
+        :return: None
+        """
+        restored = dict(self.header_objects)
+        restored.pop(forest.uid, None)
+        forest.load_objects(self.read_forest(forest.uid), main, restored=restored)
+
+    def create_placeholders(self):
+        """ Create empty forests to stand for forests that are not loaded yet.
+        :return: dict of uid -> Forest
+        """
+        placeholders = {}
+        for uid in self.forest_uids:
+            forest = Forest()
+            forest.uid = uid
+            placeholders[uid] = forest
+        return placeholders
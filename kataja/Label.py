@@ -144,6 +144,7 @@ class Label(QtWidgets.QGraphicsItem):
         self._recursion_block = False
         self._last_blockpos = ()
         self._previous_values = None
+        self._layout_key = None  # key for shared layout in ctrl.label_layouts, if it is used
         self.editable = {}
         self.prepare_template()  # !<----
         self.editable_doc = LabelDocument()
@@ -177,12 +178,16 @@ class Label(QtWidgets.QGraphicsItem):
             self.lower_part.setFont(self._font)
 
     def remove_lower_part(self):
+        if self._layout_key:
+            self.lower_part.setDocument(self.lower_doc)
         self.lower_part.setParentItem(None)
         self.lower_part.setParent(None)
         self.lower_part = None
         self.lower_doc = None
 
     def set_font(self, font):
+        # setting font for shared documents would change them for other labels too
+        self.use_own_documents()
         self.editable_part.setFont(font)
         if self.lower_part:
             self.lower_part.setFont(font)
@@ -191,6 +196,31 @@ class Label(QtWidgets.QGraphicsItem):
     def update_font(self):
         self.set_font(self._host.get_font())
 
+    def uses_shared_layout(self) -> bool:
+        """ Labels that are not edited show shared documents from ctrl.label_layouts. Cards
+        adjust their font size to fit, so they need their own documents.
+        :return: bool
+        """
+        return not self._quick_editing and self.label_shape != CARD
+
+    def use_own_documents(self):
+        """ Switch from shared documents to label's own documents, e.g. for editing.
+        :return: None
+        """
+        if not self._layout_key:
+            return
+        self._layout_key = None
+        self.editable_part.setDocument(self.editable_doc)
+        self.editable_doc.blockSignals(True)
+        self.editable_doc.setTextWidth(-1)
+        self.editable_part.setHtml(self.editable_html)
+        self.editable_doc.blockSignals(False)
+        if self.lower_part:
+            self.lower_part.setDocument(self.lower_doc)
+            self.lower_doc.setTextWidth(-1)
+            self.lower_part.setHtml(self.lower_html)
+        self._previous_values = None
+
     def update_label(self, force_update=False):
         """ Asks for node/host to give text and update if changed """
         force_update = True
@@ -217,7 +247,20 @@ class Label(QtWidgets.QGraphicsItem):
                 html = '[<sub>' + html + '</sub>'
             if lower_html:
                 html += lower_html.replace('<br/>', '')
-        if force_update or (self.label_shape, html, lower_html, is_card) != self._previous_values:
+        if self.uses_shared_layout():
+            if not (lower_html and self.label_shape not in [g.SCOPEBOX, g.BRACKETED]):
+                lower_html = ''
+            if lower_html and not self.lower_part:
+                self.init_lower_part()
+            elif self.lower_part and not lower_html:
+                self.remove_lower_part()
+            self.editable_html = html
+            self.lower_html = lower_html
+            self._layout_key = (html, lower_html, self._font.key(), self.label_shape,
+                                self.editable_doc.align)
+        elif force_update or (self.label_shape, html, lower_html, is_card) != \
+                self._previous_values:
+            self.use_own_documents()
             if self.editable_html != html:
                 self.editable_doc.blockSignals(True)
                 if is_card:
@@ -228,7 +271,6 @@ class Label(QtWidgets.QGraphicsItem):
                 self.editable_part.setHtml(html)
                 self.editable_doc.blockSignals(False)
 
-            ctrl.qdocument_parser.process(self.editable_doc)
             if lower_html and self.label_shape not in [g.SCOPEBOX, g.BRACKETED]:
                 if not self.lower_part:
                     self.init_lower_part()
@@ -239,7 +281,6 @@ class Label(QtWidgets.QGraphicsItem):
                     else:
                         self.lower_doc.setTextWidth(-1)
                     self.lower_part.setHtml(self.lower_html)
-                ctrl.qdocument_parser.process(self.lower_doc)
             else:
                 self.lower_html = ''
                 if self.lower_part:
@@ -317,6 +358,7 @@ class Label(QtWidgets.QGraphicsItem):
         if value:
             if self._quick_editing:
                 return
+            self.use_own_documents()
             self._quick_editing = True
             self._host.update_label_visibility()
             if ctrl.text_editor_focus:
@@ -412,7 +454,14 @@ class Label(QtWidgets.QGraphicsItem):
         if self.is_card():
             width = self.card_size[0]
         else:
-            if self.lower_html:
+            if self._layout_key:
+                ideal_width, lower_ideal_width = \
+                    ctrl.label_layouts.get_ideal_widths(self._layout_key, self._font)
+                if self.lower_html:
+                    ideal_width = max(ideal_width, lower_ideal_width)
+                elif triangle_host:
+                    ideal_width = max(ideal_width, self.triangle_width)
+            elif self.lower_html:
                 self.editable_part.setTextWidth(-1)
                 self.lower_part.setTextWidth(-1)
                 ideal_width = max((self.editable_doc.idealWidth(), self.lower_doc.idealWidth()))
@@ -432,25 +481,37 @@ class Label(QtWidgets.QGraphicsItem):
                 width = 20
             elif width > Label.max_width:
                 width = Label.max_width
-        self.editable_part.setTextWidth(width)
-        if self.lower_html:
-            self.lower_part.setTextWidth(width)
+        if self._layout_key:
+            # documents shared with identical labels are already laid out with this width
+            layout = ctrl.label_layouts.get_layout(self._layout_key, self._font, width)
+            if self.editable_part.document() is not layout.doc:
+                self.editable_part.setDocument(layout.doc)
+            if self.lower_html and self.lower_part.document() is not layout.lower_doc:
+                self.lower_part.setDocument(layout.lower_doc)
+            editable_height = layout.height
+            lower_height = layout.lower_height
+        else:
+            self.editable_part.setTextWidth(width)
+            if self.lower_html:
+                self.lower_part.setTextWidth(width)
+            editable_height = self.editable_doc.size().height()
+            lower_height = self.lower_doc.size().height() if self.lower_html else 0
 
         # ------------------- Height -------------------
         if self.is_card():
             total_height = self.card_size[1]
         elif self.draw_triangle:
             if self.editable_html:
-                eh = self.editable_doc.size().height()
+                eh = editable_height
             else:
                 eh = 0
             if self.lower_html:
-                lh = self.lower_doc.size().height()
+                lh = lower_height
             else:
                 lh = 0
             total_height = eh + self.triangle_height + lh
         else:
-            total_height = self.editable_doc.size().height()
+            total_height = editable_height
         half_height = total_height / 2.0
         self.top_y = -half_height
         self.bottom_y = half_height
@@ -462,7 +523,7 @@ class Label(QtWidgets.QGraphicsItem):
             # the combination of leaves alone
             self.upper_part_y = 0
             if self.editable_html:
-                self.triangle_y = self.editable_doc.size().height()
+                self.triangle_y = editable_height
             else:
                 self.triangle_y = 0
             self.lower_part_y = self.triangle_y + self.triangle_height
@@ -470,7 +531,7 @@ class Label(QtWidgets.QGraphicsItem):
             # no lower part, no triangle
             self.upper_part_y = 0
             self.triangle_y = 0
-            self.lower_part_y = self.editable_doc.size().height()
+            self.lower_part_y = editable_height
             # reduce font size until it fits
             if self.lower_part and self.lower_html:
                 font = self.lower_part.font()
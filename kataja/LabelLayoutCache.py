@@ -0,0 +1,119 @@
+# coding=utf-8
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+
+from kataja.LabelDocument import LabelDocument
+
+
+class LabelLayout:
+    """ Laid out documents for labels that have the same content, font, shape and width. Labels
+    that are not being edited show these documents instead of their own. """
+
+    def __init__(self, doc, lower_doc, width):
+        self.doc = doc
+        self.lower_doc = lower_doc
+        self.width = width
+        if lower_doc:
+            lower_doc.setTextWidth(width)
+        doc.setTextWidth(width)
+        self.height = doc.size().height()
+        self.lower_height = lower_doc.size().height() if lower_doc else 0
+
+
+class LabelLayoutCache:
+    """ Shared layouts of labels. Many labels in a document are identical ('D', 'v*',
+    traces...), so each distinct label is laid out once and its measurements and documents are
+    reused by all labels like it.
+
+    Key for layout is (html, lower_html, font key, label shape, text alignment). For each key
+    the ideal widths are measured once, and for each key and final width there is one
+    LabelLayout.
+    """
+
+    def __init__(self):
+        self.ideal_widths = {}  # key -> (ideal width, ideal width of lower part)
+        self.layouts = {}  # (key, width) -> LabelLayout
+        self._unused_docs = {}  # key -> (doc, lower_doc) used for measuring ideal widths
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """ Forget layouts, e.g. when document changes.
+        :return: None
+        """
+        self.ideal_widths = {}
+        self.layouts = {}
+        self._unused_docs = {}
+
+    @staticmethod
+    def _create_doc(html, font, align):
+        doc = LabelDocument()
+        doc.set_align(align)
+        doc.setDefaultFont(font)
+        doc.setTextWidth(-1)
+        doc.setHtml(html)
+        return doc
+
+    def get_ideal_widths(self, key, font):
+        """ Ideal widths of upper and lower part of label, when it is not limited in width.
+        :param key: (html, lower_html, font key, label shape, text alignment)
+        :param font: QFont that font key stands for
+        :return: (ideal width, ideal width of lower part or 0)
+        """
+        widths = self.ideal_widths.get(key, None)
+        if widths is None:
+            html, lower_html, font_key, label_shape, align = key
+            doc = self._create_doc(html, font, align)
+            lower_doc = self._create_doc(lower_html, font, align) if lower_html else None
+            widths = doc.idealWidth(), lower_doc.idealWidth() if lower_doc else 0
+            self.ideal_widths[key] = widths
+            self._unused_docs[key] = doc, lower_doc
+        return widths
+
+    def get_layout(self, key, font, width):
+        """ Laid out documents for label with given content and width.
+        :param key: (html, lower_html, font key, label shape, text alignment)
+        :param font: QFont that font key stands for
+        :param width: final width of label
+        :return: LabelLayout
+        """
+        layout = self.layouts.get((key, width), None)
+        if layout:
+            self.hits += 1
+            return layout
+        self.misses += 1
+        docs = self._unused_docs.pop(key, None)
+        if docs:
+            doc, lower_doc = docs
+        else:
+            html, lower_html, font_key, label_shape, align = key
+            doc = self._create_doc(html, font, align)
+            lower_doc = self._create_doc(lower_html, font, align) if lower_html else None
+        layout = LabelLayout(doc, lower_doc, width)
+        self.layouts[(key, width)] = layout
+        return layout
+
+    def report(self):
+        total = self.hits + self.misses
+        return 'label layouts: %s, hits: %s, misses: %s (%.1f%% hits)' % (
+            len(self.layouts), self.hits, self.misses, 100.0 * self.hits / total if total else 0)
@@ -292,6 +292,23 @@ class Preferences(object):
                           'help': 'Easing curve used to compute the intermediate steps in '
                                   'animations. Some options are just silly.'}
 
+        self.undo_memory_budget = 16
+        self._undo_memory_budget_ui = {'tab': 'Performance', 'range': (1, 256),
+                                       'label': 'Undo memory (MB)',
+                                       'help': 'Older undo steps are compressed and moved to '
+                                               'disk when they take more memory than this.'}
+
+        self.derivation_step_cache = 32
+        self._derivation_step_cache_ui = {'tab': 'Performance', 'range': (0, 500),
+                                          'label': 'Cached derivation steps',
+                                          'help': 'How many restored derivation steps are kept '
+                                                  'ready for browsing.'}
+
+        self.batch_physics = True
+        self._batch_physics_ui = {'tab': 'Performance', 'label': 'Batch physics',
+                                  'help': 'Compute physics for all nodes at once. Requires '
+                                          'NumPy, otherwise nodes are moved one by one.'}
+
         self.move_effect = False
         self._move_effect_ui = {'tab': 'Performance',
                                 'help': "Highlight moving nodes. "}
@@ -44,6 +44,12 @@ class SavedField(object):
     Poke is needed only once per container if there are multiple changes in a row.
     Be careful to not put it in a loop where it would be called several times.
 
+    Poke copies the container. For single changes in large lists and dicts, SavedObject has
+    methods that make the change and record only it: set_item, del_item, append_item,
+    insert_item and remove_item, e.g.
+
+    >self.set_item("d", "oh", "my")
+
     == Watchers ==
 
     The descriptor also supports announcing the changes in values to arbitrary Kataja objects.
@@ -6,10 +6,12 @@ from collections import Iterable
 from PyQt5 import QtGui, QtCore
 from PyQt5.QtCore import QPointF, QPoint
 
+from kataja.ContainerDiff import ContainerDiff, ContainerRecorder, DictRecorder, ListRecorder, \
+    container_diff
 from kataja.SavedField import SavedField
 from kataja.globals import CREATED, DELETED
 from kataja.parser.INodes import ITextNode
-from kataja.singletons import ctrl, classes
+from kataja.singletons import ctrl, classes, log
 from kataja.utils import to_tuple, time_me
 from kataja.uniqueness_generator import next_available_uid
 
@@ -25,6 +27,225 @@ class SaveError(Exception):
     # return repr(self.value)
 
 
+# ############################################################################
+#
+# Save/restore engine
+#
+# Saving turns object fields into plain python data and references to other saved objects into
+# '*r*|uid' -strings. Restoring does the reverse. Nested containers are walked with an explicit
+# stack and objects are followed through worklists, so deep constituent trees are not limited by
+# recursion limit. Conversions are picked from type dispatch tables instead of isinstance-chains.
+#
+# ############################################################################
+
+
+class _Frame:
+    """ Container being rebuilt in _rebuild """
+    __slots__ = ('kind', 'keys', 'items', 'results')
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        if kind is dict:
+            self.keys = list(data.keys())
+            self.items = iter(list(data.values()))
+        else:
+            self.keys = None
+            self.items = iter(data)
+        self.results = []
+
+    def close(self):
+        if self.kind is dict:
+            return dict(zip(self.keys, self.results))
+        elif self.kind is list:
+            return self.results
+        return self.kind(self.results)
+
+
+def _rebuild(data, kind_of, leaf):
+    """ Rebuild nested dicts, lists, tuples and sets, replacing leaves with leaf(item).
+    :param data:
+    :param kind_of: function that returns the container type (dict, list, tuple or set) an item is
+    rebuilt as, or None if the item is a leaf
+    :param leaf: function to convert leaf items
+    :return: rebuilt data
+    """
+    kind = kind_of(data)
+    if kind is None:
+        return leaf(data)
+    stack = [_Frame(kind, data)]
+    while True:
+        frame = stack[-1]
+        for item in frame.items:
+            item_kind = kind_of(item)
+            if item_kind is None:
+                frame.results.append(leaf(item))
+            else:
+                stack.append(_Frame(item_kind, item))
+                break
+        else:
+            stack.pop()
+            value = frame.close()
+            if not stack:
+                return value
+            stack[-1].results.append(value)
+
+
+def _find_in_mro(table, cache, cls):
+    """ Find handler for class or its closest ancestor from table. Results are cached, so
+    isinstance-like lookup is done only once per class.
+    """
+    try:
+        return cache[cls]
+    except KeyError:
+        pass
+    handler = None
+    for base in cls.__mro__:
+        if base in table:
+            handler = table[base]
+            break
+    cache[cls] = handler
+    return handler
+
+
+# Saving
+
+def _keep(data, owner):
+    return data
+
+
+def _simplify_inode(data, owner):
+    r = data.as_latex()
+    if r:
+        return 'INode', r
+    else:
+        return ''
+
+
+def _simplify_function(data, owner):
+    # if functions are stored in the dict, there should be some original version of the same
+    # dict, where these are in their original form.
+    raise SaveError('trying to save a function at object ', owner)
+
+
+def _simplify_qfont(data, owner):
+    raise SaveError("We shouldn't save QFonts!: ", data)
+
+
+def _simplify_qpen(data, owner):
+    return None
+
+
+simplifiers = {int: _keep, float: _keep, str: _keep, type(None): _keep,
+               ITextNode: _simplify_inode,
+               types.FunctionType: _simplify_function,
+               QPointF: lambda data, owner: ('QPointF',) + to_tuple(data),
+               QPoint: lambda data, owner: ('QPoint',) + to_tuple(data),
+               QtGui.QColor: lambda data, owner: ('QColor', data.red(), data.green(),
+                                                  data.blue(), data.alpha()),
+               QtGui.QPen: _simplify_qpen,
+               QtCore.QRectF: lambda data, owner: ('QRectF', data.x(), data.y(), data.width(),
+                                                   data.height()),
+               QtCore.QRect: lambda data, owner: ('QRect', data.x(), data.y(), data.width(),
+                                                  data.height()),
+               QtGui.QFont: _simplify_qfont}
+_simplifier_cache = {}
+
+container_kinds = {dict: dict, list: list, tuple: tuple, set: set}
+_container_cache = {}
+
+
+def _container_kind(data):
+    return _find_in_mro(container_kinds, _container_cache, type(data))
+
+
+def save_objects(objects, saved_objs, skip=None):
+    """ Save given objects and everything they refer to. Objects waiting to be saved are kept in
+    open_refs -dict, which is used as a worklist until it is empty.
+    :param objects: SavedObjects to start from
+    :param saved_objs: dict where saved objects are stored.
+    :param skip: optional function, referred objects for which it returns True are left unsaved,
+    e.g. when they are stored elsewhere
+    :return: None
+    """
+    open_refs = {}
+    for obj in objects:
+        obj.save_object(saved_objs, open_refs)
+    while open_refs:
+        uid, obj = open_refs.popitem()
+        if uid in saved_objs or (skip and skip(obj)):
+            continue
+        elif not hasattr(obj, 'save_object'):
+            raise SaveError('cannot save open reference object ', obj)
+        obj.save_object(saved_objs, open_refs)
+
+
+# Restoring
+
+def _inflate_tagged(data):
+    """ Tuples starting with a type tag, e.g. ('QPointF', x, y), are restored as the type """
+    inflater = tagged_inflaters.get(data[0], None)
+    if inflater:
+        return inflater(data)
+    raise SaveError('unknown QObject: %s' % str(data))
+
+
+def _inflate_qfont(data):
+    f = QtGui.QFont()
+    f.fromString(data[1])
+    return f
+
+
+tagged_inflaters = {'INode': lambda data: ctrl.latex_field_parser.process(data[1]),
+                    'QPointF': lambda data: QPointF(data[1], data[2]),
+                    'QPoint': lambda data: QPoint(data[1], data[2]),
+                    'QRectF': lambda data: QtCore.QRectF(data[1], data[2], data[3], data[4]),
+                    'QRect': lambda data: QtCore.QRect(data[1], data[2], data[3], data[4]),
+                    'QColor': lambda data: QtGui.QColor(data[1], data[2], data[3], data[4]),
+                    'QFont': _inflate_qfont}
+
+
+def _is_tagged(data):
+    if data and type(data[0]) is str:
+        tag = data[0]
+        return tag in tagged_inflaters or tag.startswith('Q')
+    return False
+
+
+def _inflatable_kind(data):
+    t = type(data)
+    if t is tuple:
+        return None if _is_tagged(data) else tuple
+    elif t is dict or t is list or t is set:
+        return t
+    return None
+
+
+def _uid_key(uid):
+    if isinstance(uid, str) and uid.isdigit():
+        return int(uid)
+    return uid
+
+
+def find_refs(data):
+    """ Return uids of objects referred in saved data, in the order they appear.
+    :param data: saved data of one field
+    :return: list of uids
+    """
+    refs = []
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        t = type(item)
+        if t is str:
+            if item.startswith('*r*'):
+                refs.append(_uid_key(item.split('|', 1)[1]))
+        elif t is dict:
+            stack.extend(reversed(list(item.values())))
+        elif t is list or t is set or (t is tuple and not _is_tagged(item)):
+            stack.extend(reversed(list(item)))
+    return refs
+
+
 class SavedObject(object):
     """ Make the object to have internal .saved -object where saved data
     should go.
@@ -98,6 +319,102 @@ class SavedObject(object):
             self._history[attribute] = copy.copy(self._saved[attribute])
         elif attribute not in self._history:
             self._history[attribute] = copy.copy(self._saved[attribute])
+        elif isinstance(self._history[attribute], ContainerRecorder):
+            # changes after this are not recorded, so keep the value before recorded changes
+            self._history[attribute] = self._history[attribute].original()
+
+    def _recorder(self, attribute, recorder_class):
+        """ Return recorder for changes in container attribute, or None if changes don't need to
+        be recorded: undo is disabled or the old value is already stored.
+        :param attribute: string, name of the attribute
+        :param recorder_class: DictRecorder or ListRecorder
+        :return: ContainerRecorder or None
+        """
+        if ctrl.undo_disabled:
+            return None
+        container = self._saved[attribute]
+        if type(container) is not recorder_class.kind:
+            self.poke(attribute)
+            return None
+        if not self._history:
+            ctrl.undo_pile.add(self)
+        elif attribute in self._history:
+            recorder = self._history[attribute]
+            if isinstance(recorder, recorder_class) and recorder.container is container:
+                return recorder
+            elif isinstance(recorder, ContainerRecorder):
+                # attribute has been given a new container, compare to the value before
+                self._history[attribute] = recorder.original()
+            return None
+        recorder = recorder_class(container)
+        self._history[attribute] = recorder
+        return recorder
+
+    def set_item(self, attribute, key, value):
+        """ Set item in dict attribute and record the change for undo. Unlike with poke, the
+        dict is not copied.
+        :param attribute: string, name of the attribute
+        :param key:
+        :param value:
+        :return: None
+        """
+        recorder = self._recorder(attribute, DictRecorder)
+        if recorder:
+            recorder.record(key)
+        self._saved[attribute][key] = value
+
+    def del_item(self, attribute, key):
+        """ Delete item from dict attribute and record the change for undo.
+        :param attribute: string, name of the attribute
+        :param key:
+        :return: None
+        """
+        recorder = self._recorder(attribute, DictRecorder)
+        if recorder:
+            recorder.record(key)
+        del self._saved[attribute][key]
+
+    def append_item(self, attribute, item):
+        """ Append item to list attribute and record the change for undo. Unlike with poke, the
+        list is not copied.
+        :param attribute: string, name of the attribute
+        :param item:
+        :return: None
+        """
+        recorder = self._recorder(attribute, ListRecorder)
+        if recorder:
+            recorder.insert(len(self._saved[attribute]), item)
+        self._saved[attribute].append(item)
+
+    def insert_item(self, attribute, index, item):
+        """ Insert item into list attribute and record the change for undo.
+        :param attribute: string, name of the attribute
+        :param index: position like in list.insert
+        :param item:
+        :return: None
+        """
+        container = self._saved[attribute]
+        recorder = self._recorder(attribute, ListRecorder)
+        if recorder:
+            n = len(container)
+            if index < 0:
+                index = max(0, index + n)
+            recorder.insert(min(index, n), item)
+        container.insert(index, item)
+
+    def remove_item(self, attribute, item):
+        """ Remove first occurrence of item from list attribute and record the change for undo.
+        :param attribute: string, name of the attribute
+        :param item:
+        :return: None
+        :raise ValueError: if item is not in list
+        """
+        container = self._saved[attribute]
+        index = container.index(item)
+        recorder = self._recorder(attribute, ListRecorder)
+        if recorder:
+            recorder.remove(index)
+        del container[index]
 
     def announce_creation(self):
         """ Flag object to have been created in this undo cycle.
@@ -133,7 +450,8 @@ class SavedObject(object):
     def transitions(self):
         """ Create a dict of changes based on modified attributes of the item.
         result dict has tuples as value, where the first item is value
-        before, and second item is value after the change.
+        before, and second item is value after the change. For lists, dicts and sets the value
+        is a ContainerDiff with only the changed elements.
         :return: (dict of changed attributes, 0=EDITED(default) | 1=CREATED |
         2=DELETED)
         """
@@ -141,7 +459,19 @@ class SavedObject(object):
         #print('item %s history: %s' % (self.uid, self._history))
         for key, old_value in self._history.items():
             new_value = self._saved[key]
-            if old_value != new_value:
+            if isinstance(old_value, ContainerRecorder):
+                if old_value.container is new_value:
+                    diff = old_value.diff()
+                    if len(diff):
+                        transitions[key] = diff
+                    continue
+                old_value = old_value.original()
+            # lists, dicts and sets store only the changed elements
+            diff = container_diff(old_value, new_value)
+            if diff is not None:
+                if len(diff):
+                    transitions[key] = diff
+            elif old_value != new_value:
                 if isinstance(new_value, Iterable):
                     transitions[key] = old_value, copy.copy(new_value)
                 else:
@@ -164,34 +494,58 @@ class SavedObject(object):
     def revert_to_earlier(self, transitions, transition_type):
         """ Restore to earlier version with a given changes -dict
         :param transitions: dict of changes, values are tuples of (old,
-        new) -pairs
+        new) -pairs or ContainerDiffs
+        :return: None
+        """
+        self.set_earlier_values(transitions)
+        transition_type = -transition_type  # revert transition
+        self.after_model_update(transitions.keys(), transition_type)
+
+    def set_earlier_values(self, transitions):
+        """ Set fields to their earlier values without computing derived effects. When
+        several objects are restored together, all should have their values set before any
+        after_model_update is run, as those may edit other restored objects.
+        :param transitions: dict of changes, values are tuples of (old,
+        new) -pairs or ContainerDiffs
         :return: None
         """
         #print('--- restore to earlier for ', self, ' ----------')
         for key, value in transitions.items():
+            if isinstance(value, ContainerDiff):
+                setattr(self, key, value.revert(self._saved[key]))
+                continue
             old, new = value
             if isinstance(old, Iterable):
                 setattr(self, key, copy.copy(old))
             else:
                 setattr(self, key, old)
-        transition_type = -transition_type  # revert transition
-        self.after_model_update(transitions.keys(), transition_type)
-
 
     def move_to_later(self, transitions, transition_type):
         """ Move to later version with a given changes -dict
         :param transitions: dict of changes, values are tuples of (old,
-        new) -pairs
+        new) -pairs or ContainerDiffs
+        :return: None
+        """
+        self.set_later_values(transitions)
+        self.after_model_update(transitions.keys(), transition_type)
+
+    def set_later_values(self, transitions):
+        """ Set fields to their later values without computing derived effects, see
+        set_earlier_values.
+        :param transitions: dict of changes, values are tuples of (old,
+        new) -pairs or ContainerDiffs
         :return: None
         """
         # print('--- move to later for ', self, ' ----------')
         for key, value in transitions.items():
+            if isinstance(value, ContainerDiff):
+                setattr(self, key, value.apply(self._saved[key]))
+                continue
             old, new = value
             if isinstance(new, Iterable):
                 setattr(self, key, copy.copy(new))
             else:
                 setattr(self, key, new)
-        self.after_model_update(transitions.keys(), transition_type)
 
     def after_model_update(self, changed_fields, transition_type):
         """ Compute derived effects of updated values in sensible order.
@@ -210,261 +564,154 @@ class SavedObject(object):
         self.announce_creation()
 
     def save_object(self, saved_objs, open_refs):
-        """ Flatten the object to saveable dict and recursively save the
-        objects it contains
+        """ Flatten the object to saveable dict. Objects it refers to are not saved here,
+        but added to open references, see save_objects.
         :param saved_objs: dict where saved objects are stored.
-        :param open_refs: set of open references. We cannot go jumping to
+        :param open_refs: dict of open references. We cannot go jumping to
         save each referred object when one is
         met, as it would soon lead to circular references. Open references
-        are stored and cyclically reduced.
+        are stored and reduced by the caller.
         :return: None
         """
 
         def _simplify(data):
-            """ Goes through common iterable datatypes and if common Qt types
-            are found, replaces them
-            with basic python tuples.
-
-            If object is one of Kataja's own data classes, then save its uid
+            """ Common Qt types are replaced with basic python tuples. If object is one of
+            Kataja's own data classes, then save its uid.
             """
-
-            if isinstance(data, (int, float, str)):
-                return data
-            elif isinstance(data, ITextNode):
-                r = data.as_latex()
-                if r:
-                    return 'INode', r
-                else:
-                    return ''
-
-            elif isinstance(data, dict):
-                result = {}
-                for k, value in data.items():
-                    value = _simplify(value)
-                    result[k] = value
-                return result
-            elif isinstance(data, list):
-                result = []
-                for o in data:
-                    result.append(_simplify(o))
-                return result
-            elif isinstance(data, tuple):
-                result = []
-                for o in data:
-                    result.append(_simplify(o))
-                result = tuple(result)
-                return result
-            elif isinstance(data, set):
-                result = set()
-                for o in data:
-                    result.add(_simplify(o))
-                return result
-            elif isinstance(data, types.FunctionType):
-                # if functions are stored in the dict, there should be some
-                # original
-                # version of the same dict, where these
-                # are in their original form.
-                raise SaveError('trying to save a function at object ', self)
-            elif data is None:
-                return data
-            elif isinstance(data, QPointF):
-                return 'QPointF', to_tuple(QPointF)
-            elif isinstance(data, QPoint):
-                return 'QPoint', to_tuple(QPoint)
-            elif isinstance(data, QtGui.QColor):
-                return 'QColor', data.red(), data.green(), data.blue(), \
-                       data.alpha()
-            elif isinstance(data, QtGui.QPen):
-                pass
-            elif isinstance(data, QtCore.QRectF):
-                return 'QRectF', data.x(), data.y(), data.width(), data.height()
-            elif isinstance(data, QtCore.QRect):
-                return 'QRect', data.x(), data.y(), data.width(), data.height()
-            elif isinstance(data, QtGui.QFont):
-                raise SaveError("We shouldn't save QFonts!: ", data)
+            simplifier = _find_in_mro(simplifiers, _simplifier_cache, type(data))
+            if simplifier:
+                return simplifier(data, self)
             elif hasattr(data, 'uid'):
-                k = getattr(data, 'uid')
+                k = data.uid
                 if k not in saved_objs and k not in open_refs:
-                    # print('in %s adding open reference %s' % (
-                    # self.uid, k))
                     open_refs[k] = data
-                return '|'.join(('*r*', str(k)))
-            else:
-                raise SaveError("simplifying unknown data type:", data,
-                                type(data))
+                return '*r*|%s' % k
+            raise SaveError("simplifying unknown data type:", data, type(data))
 
         if self.uid in saved_objs:
             return
 
         obj_data = {}
         for key, item in self._saved.items():
-            obj_data[key] = _simplify(item)
+            obj_data[key] = _rebuild(item, _container_kind, _simplify)
 
-        # print('saving obj: ', self.uid, obj_data)
         saved_objs[self.uid] = obj_data
         if self.uid in open_refs:
             del open_refs[self.uid]
 
     @time_me
-    def load_objects(self, data, kataja_main):
+    def load_objects(self, data, kataja_main, restored=None):
         """ Load and restore objects starting from given obj (probably Forest
         or KatajaMain instance)
         :param data:
         :param kataja_main:
+        :param restored: optional dict of uid -> object for objects that are used as they are,
+        without restoring their data (e.g. placeholders for forests that are loaded later)
         :param self:
         """
         full_map = {}
-        restored = {}
-        full_data = data
+        if restored is None:
+            restored = {}
 
         # First we need a full index of objects that already exist within the
         #  existing objects.
         # This is to avoid recreating those objects. We just want to modify them
-        def map_existing(obj):
-            """ Take note of existing objects, as undo? will overwrite these.
-            :param obj:
-            :return:
-            """
-            if isinstance(obj, dict):
-                for item in obj.values():
-                    map_existing(item)
-                return
-            elif isinstance(obj, (list, tuple, set)):
-                for item in obj:
-                    map_existing(item)
-                return
+        stack = [self]
+        while stack:
+            obj = stack.pop()
+            t = type(obj)
+            if t is dict:
+                stack.extend(obj.values())
+                continue
+            elif t is list or t is tuple or t is set:
+                stack.extend(obj)
+                continue
             # objects that support saving
-
             key = getattr(obj, 'uid', '')
-            if key and key not in full_map:
+            if key and key not in full_map and hasattr(obj, '_saved'):
                 full_map[key] = obj
-                for item in obj._saved.values():
-                    map_existing(item)
+                stack.extend(obj._saved.values())
 
         # Restore either takes existing object or creates a new 'stub' object
         #  and then loads it with given data
-        map_existing(self)
-        self.restore(self.uid, full_data, full_map, restored, kataja_main, root=True)
-
-    def restore(self, obj_key, full_data, full_map, restored, kataja_main, root=False):
-        """ Recursively restore objects inside the scope of current obj. Used
-        for loading kataja files.
-        :param obj_key:
-        :param root:
-        :return:
+        new_objects = self.restore(self.uid, data, full_map, restored, kataja_main)
+        # objects need to be finalized after setting values, do this only once per load.
+        for item in new_objects:
+            if hasattr(item, 'after_init'):
+                item.after_init()
+
+    def restore(self, obj_key, full_data, full_map, restored, kataja_main):
+        """ Restore object and the objects it refers to. Used for loading kataja files.
+        Objects are walked depth first with an explicit stack: an object gets its values after
+        the objects it refers to have been restored, apart from circular references, which get
+        the object that is still being restored.
+        :param obj_key: uid of the object to start from
+        :param full_data: save data, uid -> dict of values
+        :param full_map: existing objects, uid -> object. These are updated instead of
+        creating new ones.
+        :param restored: dict of uid -> object for objects that are already restored
+        :param kataja_main:
+        :return: list of objects restored here, in order of creation
         """
 
-        if isinstance(obj_key, str):
-            if obj_key.isdigit():
-                obj_key = int(obj_key)
-
-        def inflate(data):
-            """ Recursively turn QObject descriptions back into actual
-            objects and object references
-            back into real objects
-            :param data:
-            :return:
+        def _inflate(data):
+            """ Turn QObject descriptions back into actual objects and object references
+            back into real objects.
             """
-            # print('inflating %s in %s' % (str(data), self))
-            if data is None:
-                return data
-            elif isinstance(data, (int, float)):
-                return data
-            elif isinstance(data, dict):
-                result = {}
-                for k, value in data.items():
-                    result[k] = inflate(value)
-                return result
-            elif isinstance(data, list):
-                result = []
-                for item in data:
-                    result.append(inflate(item))
-                return result
-            elif isinstance(data, str):
+            t = type(data)
+            if t is str:
                 if data.startswith('*r*'):
                     r, uid = data.split('|', 1)
-                    return self.restore(uid, full_data, full_map, restored, kataja_main)
-                else:
-                    return data
-            elif isinstance(data, tuple):
-                if data and isinstance(data[0], str):
-                    data_type = data[0]
-                    if data_type == 'INode':
-                        return ctrl.latex_field_parser.process(data[1])
-                    elif data_type == 'QPointF':
-                        return QPointF(data[1], data[2])
-                    elif data_type == 'QPoint':
-                        return QPoint(data[1], data[2])
-                    elif data_type == 'QRectF':
-                        return QtCore.QRectF(data[1], data[2], data[3], data[4])
-                    elif data_type == 'QRect':
-                        return QtCore.QRect(data[1], data[2], data[3], data[4])
-                    elif data_type == 'QColor':
-                        return QtGui.QColor(data[1], data[2], data[3], data[4])
-                    elif data_type == 'QFont':
-                        f = QtGui.QFont()
-                        f.fromString(data[1])
-                        return f
-                    elif data_type.startswith('Q'):
-                        raise SaveError('unknown QObject: %s' % str(data))
-                    else:
-                        result = []
-                        for item in data:
-                            result.append(inflate(item))
-                        result = tuple(result)
-                        return result
-                else:
-                    result = []
-                    for item in data:
-                        result.append(inflate(item))
-                    result = tuple(result)
-                    return result
-            elif isinstance(data, set):
-                result = set()
-                for item in data:
-                    result.add(inflate(item))
-                return result
+                    return restored.get(_uid_key(uid), None)
+            elif t is tuple:
+                return _inflate_tagged(data)
             return data
 
-        # print('restoring %s , %s ' % (obj_key, class_key))
-        # Don't restore object several times, even if the object is referred
-        # in several places
-        if obj_key in restored:
-            return restored[obj_key]
-        # If the object already exists (e.g. we are doing undo), the loaded
-        # values overwrite existing values.
-        obj = full_map.get(obj_key, None)
-
-        # new data that the object should have
-        new_data = full_data.get(obj_key, None)
-        if not (obj or new_data):
-            return None
-        elif obj and not new_data:
-            print(obj, " is not present in save data")
-        class_key = new_data['class_name']
-
-        if not obj:
-            obj = classes.create(class_key)
-        # when creating/modifying values inside forests, they may refer back
-        # to ctrl.forest. That has to be the current
-
-        # forest, or otherwise things go awry
-        if class_key == 'Forest':
-            kataja_main.forest = obj
-
-        # keep track of which objects have been restored
-        restored[obj_key] = obj
-
-        for key, old_value in obj._saved.items():
-            new_value = new_data.get(key, None)
-            if new_value is not None:
-                new_value = inflate(new_value)
-            setattr(obj, key, new_value)
-
-        # objects need to be finalized after setting values, do this only once per load.
-        if root:
-            for item in restored.values():
-                if hasattr(item, 'after_init'):
-                    #print('restoring item, calling after_init for ', type(item), item)
-                    item.after_init()
-        return obj
+        new_objects = []
+        # stack items are (uid, None, None) for objects to restore, and (uid, obj, new_data)
+        # for objects waiting for their values.
+        stack = [(_uid_key(obj_key), None, None)]
+        while stack:
+            key, obj, new_data = stack.pop()
+            if new_data is not None:
+                for field in list(obj._saved.keys()):
+                    value = new_data.get(field, None)
+                    if value is not None:
+                        value = _rebuild(value, _inflatable_kind, _inflate)
+                    setattr(obj, field, value)
+                continue
+            # Don't restore object several times, even if the object is referred
+            # in several places
+            if key in restored:
+                continue
+            # If the object already exists (e.g. we are doing undo), the loaded
+            # values overwrite existing values.
+            obj = full_map.get(key, None)
+            # new data that the object should have
+            new_data = full_data.get(key, None)
+            if new_data is None:
+                if obj is not None:
+                    log.warning('%s is not present in save data' % obj)
+                    restored[key] = obj
+                continue
+            class_key = new_data['class_name']
+            if obj is None:
+                obj = classes.create(class_key)
+            # when creating/modifying values inside forests, they may refer back
+            # to ctrl.forest. That has to be the current
+            # forest, or otherwise things go awry
+            if class_key == 'Forest':
+                kataja_main.forest = obj
+            # keep track of which objects have been restored
+            restored[key] = obj
+            new_objects.append(obj)
+            stack.append((key, obj, new_data))
+            refs = []
+            for field in obj._saved.keys():
+                value = new_data.get(field, None)
+                if value is not None:
+                    refs += find_refs(value)
+            for ref in reversed(refs):
+                if ref not in restored:
+                    stack.append((ref, None, None))
+        return new_objects
@@ -0,0 +1,95 @@
+# coding=utf-8
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+import math
+from collections import defaultdict
+
+
+class SpatialIndex:
+    """ Uniform grid of nodes for neighbour lookups in force-directed visualizations.
+
+    The grid is rebuilt once per animation frame from the positions the nodes have at the start
+    of the frame. Nodes keep moving during the frame, so queries are padded with 'slack', which
+    should be at least the largest step a node can take in one frame.
+
+    SpatialIndex doesn't save its state, it is purely derivative from node positions.
+    """
+
+    def __init__(self, slack=10, min_cell_size=20):
+        self.slack = slack
+        self.min_cell_size = min_cell_size
+        self.cell_size = min_cell_size
+        self.max_extent = 0
+        self.cells = {}
+        self.size = 0
+
+    def clear(self):
+        self.cells = {}
+        self.size = 0
+        self.max_extent = 0
+
+    def rebuild(self, nodes, position, reach=0):
+        """ Put nodes into grid cells.
+        :param nodes: iterable of nodes
+        :param position: function that returns (x, y) for a node, the same coordinates the
+        visualization uses when computing forces.
+        :param reach: additional distance beyond node extents where nodes still affect each
+        other.
+        :return: None
+        """
+        placed = []
+        max_extent = 0
+        for node in nodes:
+            extent = (node.width + node.height) / 2
+            if extent > max_extent:
+                max_extent = extent
+            placed.append((node, position(node)))
+        self.max_extent = max_extent
+        self.cell_size = max(self.min_cell_size, max_extent + reach)
+        cs = self.cell_size
+        cells = defaultdict(list)
+        for node, (x, y) in placed:
+            cells[(int(math.floor(x / cs)), int(math.floor(y / cs)))].append(node)
+        self.cells = cells
+        self.size = len(placed)
+
+    def nearby(self, x, y, radius):
+        """ Generate nodes whose cell is within radius (+slack) of given point. Caller is
+        responsible of doing the exact distance check.
+        :param x:
+        :param y:
+        :param radius:
+        :return: iterator of nodes
+        """
+        cs = self.cell_size
+        radius += self.slack
+        x0 = int(math.floor((x - radius) / cs))
+        x1 = int(math.floor((x + radius) / cs))
+        y0 = int(math.floor((y - radius) / cs))
+        y1 = int(math.floor((y + radius) / cs))
+        cells = self.cells
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    yield from cell
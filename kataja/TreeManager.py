@@ -1,56 +1,125 @@
-from collections import Counter, defaultdict
-
 from kataja.saved.movables.Tree import Tree
 from kataja.utils import time_me
 
 
 class TreeManager:
+    """ Keeps trees in sync with the node graph. Each tree maps its root (tree.top) to its
+    members (tree.sorted_nodes, and node.trees in the other direction).
+
+    FreeDrawing reports the nodes whose edges change with nodes_changed, and update_trees
+    recomputes only the trees where those nodes belong and the trees of new roots among them.
+    Changes that don't go through FreeDrawing, e.g. undo, call invalidate to have all trees
+    recomputed in the next update.
+    """
 
     def __init__(self, forest):
         self.f = forest
+        self.changed_nodes = set()
+        self.full_update_needed = True
 
-    @time_me
-    def update_trees(self):
-        def count_top_nodes_for_each_node(top, n, btrees):
-            tops_for_node[n].append(top)
-            for tree in n.trees:
-                if tree not in btrees:
-                    btrees.append(tree)
-            for child in n.get_children(similar=False, visible=False):
-                count_top_nodes_for_each_node(top, child, btrees)
+    def nodes_changed(self, *nodes):
+        """ Mark nodes whose edges have been changed, created or deleted since the last update.
+        :param nodes: Nodes, None:s are ignored
+        :return: None
+        """
+        for node in nodes:
+            if node:
+                self.changed_nodes.add(node)
 
-        tree_candidates = []
-        used_trees = set()
-        tops_for_node = defaultdict(list)
+    def invalidate(self):
+        """ Have all trees recomputed in the next update.
+        :return: None
+        """
+        self.full_update_needed = True
+        self.changed_nodes = set()
 
-        for node in self.f.nodes.values():
-            if not node.get_parents(similar=True, visible=True):
-                if len(node.trees) > 1:
-                    for tree in list(node.trees):
-                        if tree.top is not node:
-                            node.trees.remove(tree)
-                best_trees = list(node.trees)
-                count_top_nodes_for_each_node(node, node, best_trees)
-                tree_candidates.append((node, best_trees))
+    @time_me
+    def update_trees(self):
+        """ Find roots and make sure that each root has a tree with all of the nodes dominated by
+        it. Only trees that have changed nodes are checked, unless full update is needed.
+        :return: None
+        """
+        if self.full_update_needed:
+            self.full_update_needed = False
+            self.changed_nodes = set()
+            self._update_trees_for(list(self.f.nodes.values()), list(self.f.trees))
+        elif self.changed_nodes:
+            changed = self.changed_nodes
+            self.changed_nodes = set()
+            affected_trees = set()
+            candidates = []
+            for node in changed:
+                affected_trees |= node.trees
+                if self.f.nodes.get(node.uid, None) is node:
+                    candidates.append(node)
+            for tree in self.f.trees:
+                if tree in affected_trees and tree.top and tree.top not in changed and \
+                        self.f.nodes.get(tree.top.uid, None) is tree.top:
+                    candidates.append(tree.top)
+            self._update_trees_for(candidates,
+                                   [tree for tree in self.f.trees if tree in affected_trees])
 
-        for top, best_trees in tree_candidates:
-            available_trees = [t for t in best_trees if t not in used_trees]
-            if available_trees:
-                tree = available_trees[0]
-                used_trees.add(tree)
-                tree.top = top
+    def _update_trees_for(self, candidates, trees):
+        """ Give each root among candidates a tree, reusing given trees where possible, update
+        their items and remove given trees that are not needed anymore.
+        :param candidates: nodes that may be roots
+        :param trees: trees that can be reused or removed, other trees are left as they are
+        :return: None
+        """
+        available = set(trees)
+        roots = [node for node in candidates if not node.get_parents(similar=True, visible=True)]
+        trees_for_roots = {}
+        # roots keep the trees they are already top of
+        for root in roots:
+            if len(root.trees) > 1:
+                for tree in list(root.trees):
+                    if tree.top is not root:
+                        root.trees.remove(tree)
+            for tree in root.trees:
+                if tree.top is root and tree in available:
+                    available.remove(tree)
+                    trees_for_roots[root] = tree
+                    break
+        # new roots take a tree from the nodes under them, e.g. when two trees are merged
+        for root in roots:
+            if root in trees_for_roots:
+                continue
+            for tree in self._trees_below(root):
+                if tree in available:
+                    available.remove(tree)
+                    trees_for_roots[root] = tree
+                    break
+        for root in roots:
+            tree = trees_for_roots.get(root, None)
+            if tree:
+                tree.top = root
                 tree.update_items()
             else:
-                tree = self.create_tree_for(top)
-                used_trees.add(tree)
-        for node, tops in tops_for_node.items():
-            for tree in list(node.trees):
-                if tree.top not in tops:
-                    tree.remove_node(node)
-        for tree in self.f.trees:
-            if tree not in used_trees:
+                self.create_tree_for(root)
+        for tree in trees:
+            if tree in available:
                 self.remove_tree(tree)
 
+    @staticmethod
+    def _trees_below(top):
+        """ Trees of nodes dominated by top, in the order they are met in left-first walk.
+        :param top:
+        :return: list of trees
+        """
+        found = []
+        done = {top}
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            for tree in node.trees:
+                if tree not in found:
+                    found.append(tree)
+            for child in reversed(node.get_children(similar=False, visible=False)):
+                if child and child not in done:
+                    done.add(child)
+                    stack.append(child)
+        return found
+
     @time_me
     def create_tree_for(self, node):
         """ Create new trees around given node.
@@ -74,4 +143,4 @@ class TreeManager:
             tree.remove_node(node)
         if tree in self.f.trees:
             self.f.trees.remove(tree)
-        self.f.remove_from_scene(tree)
\ No newline at end of file
+        self.f.remove_from_scene(tree)
@@ -23,10 +23,16 @@
 # along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
 #
 # ############################################################################
+import io
+import pickle
 import pprint
+import sys
+import tempfile
+import zlib
 
+from kataja.SavedObject import SavedObject
 from kataja.utils import time_me
-from kataja.singletons import ctrl, log
+from kataja.singletons import ctrl, log, prefs
 
 # Creation/Deletion flags
 CREATED = 1
@@ -35,14 +41,106 @@ DELETED = 2
 max_stack = 24
 
 
+def estimate_size(data, seen=None):
+    """ Approximate memory use of undo data in bytes. Referred Kataja objects are counted as
+    references only, they are not owned by the undo stack.
+    :param data:
+    :param seen: set of ids of objects already counted
+    :return: int
+    """
+    if seen is None:
+        seen = set()
+    if id(data) in seen:
+        return 0
+    seen.add(id(data))
+    if isinstance(data, SavedObject):
+        return 0
+    size = sys.getsizeof(data, 64)
+    if isinstance(data, dict):
+        for key, value in data.items():
+            size += estimate_size(key, seen) + estimate_size(value, seen)
+    elif isinstance(data, (list, tuple, set, frozenset)):
+        for item in data:
+            size += estimate_size(item, seen)
+    elif hasattr(data, '__dict__'):
+        size += estimate_size(vars(data), seen)
+    return size
+
+
+class StackEntry:
+    """ One undo step in undo stack. Snapshot is either kept in memory or written into the
+    journal file, where offset and length tell where to find it. A snapshot that is read back
+    keeps its place in journal, so it can be released again without writing it again. While
+    the snapshot is only in journal, refs holds the Kataja objects it refers to. """
+    __slots__ = ('msg', 'snapshot', 'size', 'offset', 'length', 'refs', 'can_spill')
+
+    def __init__(self, msg, snapshot, size):
+        self.msg = msg
+        self.snapshot = snapshot
+        self.size = size
+        self.offset = 0
+        self.length = 0  # 0 if snapshot is not in journal
+        self.refs = None
+        self.can_spill = True
+
+    @property
+    def in_memory(self):
+        return self.snapshot is not None
+
+    @property
+    def in_journal(self):
+        return self.length > 0
+
+
+class JournalPickler(pickle.Pickler):
+    """ Kataja objects in snapshots are stored as references to their uids, they are not copied
+    into journal. """
+
+    def __init__(self, file, refs):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = refs
+
+    def persistent_id(self, obj):
+        if isinstance(obj, SavedObject):
+            self.refs[obj.uid] = obj
+            return obj.uid
+        return None
+
+
+class NullWriter:
+    """ File that ignores what is written into it """
+
+    @staticmethod
+    def write(data):
+        return len(data)
+
+
+class JournalUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, refs):
+        super().__init__(file)
+        self.refs = refs
+
+    def persistent_load(self, pid):
+        return self.refs[pid]
+
+
 class UndoManager:
-    """ Holds the undo stack and manages the undo- and redo-activities. """
+    """ Holds the undo stack and manages the undo- and redo-activities.
+
+    Stack is limited by count (max_stack) and by memory (prefs.undo_memory_budget, in
+    megabytes). When snapshots in memory exceed the budget, the oldest ones are compressed and
+    written to a temporary journal file, and read back when undo or redo reaches them. When
+    dropped entries leave more unused than used space in journal, it is compacted.
+    """
 
     def __init__(self, forest):
         self.forest = forest
         self.full_state = {}
         self._stack = []
         self._current = 0
+        self._journal = None
+        self._journal_size = 0
 
     def can_undo(self):
         return self._current >= 0
@@ -50,6 +148,15 @@ class UndoManager:
     def can_redo(self):
         return self._current < len(self._stack) - 1
 
+    def _report_edits(self, snapshot):
+        """ Tell derivation steps of the forest which objects have changed, so that their
+        restored states are not reused.
+        :param snapshot: dict of uid -> (obj, transitions, transition_type)
+        :return: None
+        """
+        self.forest.derivation_steps.note_edits(obj for obj, transitions, transition_type in
+                                                snapshot.values())
+
     def flush_pile(self):
         """ Clear undo_pile for non-undoable big changes (e.g. loading new document) """
         for obj in ctrl.undo_pile:
@@ -72,19 +179,123 @@ class UndoManager:
                 snapshot[obj.uid] = (obj, transitions, transition_type)
             obj.flush_history()
         # ...
+        dropped = False
         if snapshot:
+            self._report_edits(snapshot)
+            dropped = len(self._stack) > self._current + 1
             self._stack = self._stack[:self._current + 1]
-            self._stack.append((msg, snapshot))
+            self._stack.append(StackEntry(msg, snapshot, estimate_size(snapshot)))
             self._current = len(self._stack) - 1
         ctrl.undo_pile = set()
         if len(self._stack) > max_stack:
             self._stack.pop(0)
             self._current -= 1
+            dropped = True
+        if dropped:
+            self._compact_journal()
+        if snapshot:
+            self.keep_in_budget()
+            log.debug('undo stack: %s steps, %s kB in memory, %s kB in journal' % (
+                len(self._stack), self.memory_use() // 1024, self.journal_use() // 1024))
 
         #log.info('took snapshot of size: %s, undo stack size: %s items %s chars' % (
         #    len(str(snapshot)), len(self._stack), len(str(self._stack))))
         #print('stack len:', len(str(self._stack)))
 
+    def memory_use(self):
+        """ Approximate size of snapshots kept in memory, in bytes """
+        return sum(entry.size for entry in self._stack if entry.in_memory)
+
+    def journal_use(self):
+        """ Size of compressed snapshots in journal file, in bytes """
+        return sum(entry.length for entry in self._stack)
+
+    def keep_in_budget(self):
+        """ Write oldest snapshots into journal until the snapshots in memory fit the memory
+        budget. Snapshots next to the current position in stack are always kept in memory.
+        :return: None
+        """
+        budget = prefs.undo_memory_budget * 1024 * 1024
+        in_memory = self.memory_use()
+        for i, entry in enumerate(self._stack):
+            if in_memory <= budget:
+                break
+            if abs(i - self._current) <= 1 or not (entry.in_memory and entry.can_spill):
+                continue
+            if self._spill(entry):
+                in_memory -= entry.size
+
+    def _spill(self, entry):
+        """ Compress snapshot of given entry into journal file and release it from memory. If
+        the snapshot was read back from journal, it is already there and only its references
+        are collected again.
+        :param entry: StackEntry
+        :return: True if successful
+        """
+        refs = {}
+        if entry.in_journal:
+            JournalPickler(NullWriter(), refs).dump(entry.snapshot)
+            entry.refs = refs
+            entry.snapshot = None
+            return True
+        buffer = io.BytesIO()
+        try:
+            JournalPickler(buffer, refs).dump(entry.snapshot)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            log.debug('cannot write undo step "%s" to journal: %s' % (entry.msg, e))
+            entry.can_spill = False
+            return False
+        data = zlib.compress(buffer.getvalue())
+        if not self._journal:
+            self._journal = tempfile.TemporaryFile(prefix='kataja_undo_')
+            self._journal_size = 0
+        self._journal.seek(self._journal_size)
+        self._journal.write(data)
+        entry.offset = self._journal_size
+        entry.length = len(data)
+        entry.refs = refs
+        entry.snapshot = None
+        self._journal_size += len(data)
+        return True
+
+    def _get_snapshot(self, i):
+        """ Return snapshot at given stack position, reading it back from journal if necessary.
+        :param i: position in stack
+        :return: snapshot dict
+        """
+        entry = self._stack[i]
+        if not entry.in_memory:
+            self._journal.seek(entry.offset)
+            data = zlib.decompress(self._journal.read(entry.length))
+            entry.snapshot = JournalUnpickler(io.BytesIO(data), entry.refs).load()
+            entry.refs = None
+        return entry.msg, entry.snapshot
+
+    def _compact_journal(self):
+        """ Remove space left by dropped entries from journal. Journal is closed when no entry
+        uses it, and rewritten when less than half of it is in use.
+        :return: None
+        """
+        if not self._journal:
+            return
+        entries = sorted((entry for entry in self._stack if entry.in_journal),
+                         key=lambda entry: entry.offset)
+        used = sum(entry.length for entry in entries)
+        if not used:
+            self._journal.close()
+            self._journal = None
+            self._journal_size = 0
+        elif used * 2 < self._journal_size:
+            journal = tempfile.TemporaryFile(prefix='kataja_undo_')
+            for entry in entries:
+                self._journal.seek(entry.offset)
+                data = self._journal.read(entry.length)
+                entry.offset = journal.tell()
+                journal.write(data)
+            self._journal.close()
+            self._journal = journal
+            self._journal_size = used
+
     def undo(self):
         """ Move backward in the undo stack
         :return: None
@@ -97,9 +308,14 @@ class UndoManager:
         ctrl.disable_undo()
         ctrl.multiselection_start()
         ctrl.forest.halt_drawing = True
-        msg, snapshot = self._stack[self._current]
+        msg, snapshot = self._get_snapshot(self._current)
+        # all values are restored before derived effects are computed: deleting an edge in
+        # after_model_update would otherwise edit edge lists that are yet to be restored
         for obj, transitions, transition_type in snapshot.values():
-            obj.revert_to_earlier(transitions, transition_type)
+            obj.set_earlier_values(transitions)
+        for obj, transitions, transition_type in snapshot.values():
+            obj.after_model_update(transitions.keys(), -transition_type)
+        self._report_edits(snapshot)
         ctrl.forest.edge_visibility_check()
         ctrl.forest.flush_and_rebuild_temporary_items()
         log.info('undo [%s]: %s' % (self._current, msg))
@@ -107,6 +323,7 @@ class UndoManager:
         ctrl.resume_undo()
         self._current -= 1
         ctrl.forest.halt_drawing = False
+        self.keep_in_budget()
 
         print('-------undo finished', self._current)
 
@@ -177,15 +394,19 @@ class UndoManager:
         ctrl.disable_undo()
         ctrl.multiselection_start()
         ctrl.forest.halt_drawing = True
-        msg, snapshot = self._stack[self._current]
+        msg, snapshot = self._get_snapshot(self._current)
+        for obj, transitions, transition_type in snapshot.values():
+            obj.set_later_values(transitions)
         for obj, transitions, transition_type in snapshot.values():
-            obj.move_to_later(transitions, transition_type)
+            obj.after_model_update(transitions.keys(), transition_type)
+        self._report_edits(snapshot)
         ctrl.forest.edge_visibility_check()
         ctrl.forest.flush_and_rebuild_temporary_items()
         log.info('redo [%s]: %s' % (self._current, msg))
         ctrl.multiselection_end()
         ctrl.resume_undo()
         ctrl.forest.halt_drawing = False
+        self.keep_in_budget()
         print('------redo finished: ', msg, self._current)
 
     @staticmethod
@@ -27,7 +27,14 @@ from kataja.utils import caller, time_me
 import kataja.globals as g
 import sys
 
-from kataja.singletons import ctrl
+from kataja.singletons import ctrl, prefs
+from kataja.SpatialIndex import SpatialIndex
+from kataja.BatchPhysics import BatchPhysics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 LEFT = 1
 NO_ALIGN = 0
@@ -39,6 +46,13 @@ class BaseVisualization:
     name = 'BaseVisualization base class'
     banned_node_shapes = ()
     hide_edges_if_nodes_overlap = True
+    # Distance beyond node extents where repulsion is still computed, and the largest step a
+    # node can take in one frame. These decide how many grid cells are visited for each node.
+    repulsion_range = 0
+    max_step = 50
+    # Visualizations that override calculate_movement without providing
+    # calculate_batch_movement should set this False.
+    batch_physics = True
 
     def __init__(self):
         """ This is called once when building Kataja. Set up properties for this kind of 
@@ -50,6 +64,8 @@ class BaseVisualization:
         self.use_gravity = True
         self._stored_top_node_positions = []
         self.traces_to_draw = {}
+        self.spatial_index = SpatialIndex(slack=self.max_step)
+        self._batch = None
 
     def prepare(self, forest, reset=True):
         """ If loading a state, don't reset.
@@ -57,6 +73,7 @@ class BaseVisualization:
         :param reset:boolean
         """
         self.forest = forest
+        self.spatial_index.clear()
         self._directed = False
         self._hits = {}
         self._max_hits = {}
@@ -71,6 +88,55 @@ class BaseVisualization:
         """
         pass
 
+    def prepare_frame(self):
+        """ This is called once in the beginning of each animation frame, before nodes compute
+        their movement. Either computes the movement for all nodes in one batch or rebuilds the
+        neighbour index used by scalar calculate_movement.
+        :return: dict of node -> movement if batch physics was used, otherwise None
+        """
+        batch = self.batch_movement()
+        if batch is None:
+            self.spatial_index.rebuild(self.forest.visible_nodes(), self.repulsion_position,
+                                       reach=self.repulsion_range)
+        else:
+            self.spatial_index.clear()
+        return batch
+
+    def batch_movement(self):
+        """ Compute movement for all visible nodes in one vectorized pass, if NumPy is
+        available, preferences allow it and this visualization supports it. If no node uses
+        physics, e.g. when visualization places all nodes itself, nothing is computed.
+        :return: dict of node -> (xvel, yvel, 0) or None
+        """
+        if not (self.batch_physics and prefs.batch_physics and BatchPhysics.available()):
+            return None
+        nodes = list(self.forest.visible_nodes())
+        if not any(node.use_physics() for node in nodes):
+            return {}
+        if not self._batch:
+            self._batch = BatchPhysics(self)
+        return self._batch.step(nodes)
+
+    def repulsion_position(self, node):
+        """ Position of node in the same coordinates that calculate_movement uses for
+        repulsion. Subclasses that measure from another point should override this.
+        :param node:
+        :return: x, y
+        """
+        return node.current_position
+
+    def nearby_nodes(self, x, y, radius):
+        """ Visible nodes that may be within radius from given point. If the index hasn't been
+        prepared for this frame, return all visible nodes.
+        :param x:
+        :param y:
+        :param radius:
+        :return: iterator of nodes
+        """
+        if not self.spatial_index.cells:
+            return self.forest.visible_nodes()
+        return self.spatial_index.nearby(x, y, radius)
+
     def validate_node_shapes(self):
         ls = ctrl.settings.get('label_shape')
         if ls in self.banned_node_shapes:
@@ -254,8 +320,10 @@ class BaseVisualization:
             node_y += node._gravity
 
 
-        # repulse
-        for other in self.forest.visible_nodes():
+        # repulse, only nodes whose safe zone can reach this node
+        node_extent = (node.width + node.height) / 4
+        radius = node_extent + self.spatial_index.max_extent / 2
+        for other in self.nearby_nodes(node_x, node_y, radius):
             if other is node:
                 continue
             elif other.locked_to_node is node or node.locked_to_node is other:
@@ -311,6 +379,56 @@ class BaseVisualization:
             yvel = 0
         return xvel, yvel, 0
 
+    def calculate_batch_movement(self, batch):
+        """ Vectorized calculate_movement for all nodes in batch. Forces are computed from
+        positions at the start of the frame.
+        :param batch: BatchPhysics with packed nodes
+        :return: xvel array, yvel array
+        """
+        alpha = 0.2
+        x, y, w, h = batch.x, batch.y, batch.width, batch.height
+        xvel = np.zeros(len(x))
+        yvel = np.zeros(len(x))
+        # attract
+        s, e = batch.edge_start, batch.edge_end
+        valid = batch.locked_to[e] != s
+        dist_x = x[s] - x[e]
+        dist_y = y[s] - y[e]
+        dist = np.hypot(dist_x, dist_y)
+        radius = (w[e] + w[s] + h[e] + h[s]) / 4
+        pulls = valid & (dist != 0) & (dist - radius > 0)
+        pulling_force = np.where(pulls, (dist - radius) * batch.edge_pull * alpha /
+                                 np.where(dist == 0, 1, dist), 0)
+        pushes = valid & ~pulls
+        # edge start is pulled towards end and vice versa, if they overlap they are pushed apart
+        np.add.at(xvel, s, -dist_x * pulling_force + pushes)
+        np.add.at(yvel, s, -dist_y * pulling_force)
+        np.add.at(xvel, e, dist_x * pulling_force - pushes)
+        np.add.at(yvel, e, dist_y * pulling_force)
+
+        free = ~(batch.has_edges_up | batch.has_edges_down)
+        xvel[free] += x[free] * -0.009
+        yvel[free] += y[free] * -0.009
+        if self.use_gravity:
+            falls = batch.has_edges_up & ~batch.has_edges_down
+            yvel[falls] += batch.gravity[falls]
+
+        # repulse
+        for rows, cols, dist_x, dist_y, mask in batch.pairs():
+            dist = np.hypot(dist_x, dist_y)
+            safe_zone = (w[rows][:, None] + w[cols][None, :] + h[rows][:, None] +
+                         h[cols][None, :]) / 4
+            xvel[rows] += 5 * np.count_nonzero(mask & (dist == 0), axis=1)
+            pushed = mask & (dist > 0) & (dist < safe_zone)
+            safe_dist = np.where(pushed, dist, 1)
+            pushing_force = np.where(pushed, (safe_zone - dist) / (safe_dist * safe_dist * alpha),
+                                     0)
+            xvel[rows] += (pushing_force * dist_x).sum(axis=1)
+            xvel[rows] -= np.count_nonzero(pushed & (dist_x == 0), axis=1)
+            yvel[rows] += (pushing_force * dist_y).sum(axis=1)
+
+        return np.clip(xvel, -50, 50), np.clip(yvel, -50, 50)
+
     # def calculateFeatureMovement(self, feat, node):
     # """ Create a cloud of features around the node """
     # xvel = 0.0
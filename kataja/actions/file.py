@@ -12,6 +12,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QKeySequence
 
 from kataja.KatajaAction import KatajaAction
+from kataja.KatajaPack import save_pack, PackReader
 
 from kataja.singletons import ctrl, prefs, log
 from kataja.ui_support.PreferencesDialog import PreferencesDialog
@@ -47,7 +48,7 @@ from kataja.ui_support.PreferencesDialog import PreferencesDialog
 
 file_extensions = {'pickle': '.kataja', 'pickle.zipped': '.zkataja',
                    'dict': '.dict', 'dict.zipped': '.zdict', 'json': '.json',
-                   'json.zipped': '.zjson', }
+                   'json.zipped': '.zjson', 'pack': '.kpack'}
 # Not sure if we need a separate set for
 # windows, if they still use three-letter extensions
 
@@ -113,8 +114,9 @@ class Open(KatajaAction):
         # fileName  = QtGui.QFileDialog.getOpenFileName(self,
         # self.tr("Open File"),
         # QtCore.QDir.currentPath())
-        file_help = """All (*.kataja *.zkataja *.dict *.zdict *.json *.zjson);;
+        file_help = """All (*.kataja *.zkataja *.kpack *.dict *.zdict *.json *.zjson);;
     Kataja files (*.kataja);; Packed Kataja files (*.zkataja);;
+    Indexed Kataja files (*.kpack);;
     Python dict dumps (*.dict);; Packed python dicts (*.zdict);;
     JSON dumps (*.json);; Packed JSON (*.zjson);;
     Text files containing bracket trees (*.txt, *.tex)"""
@@ -140,6 +142,9 @@ class Open(KatajaAction):
                 break
 
         m.clear_all()
+        if save_format == 'pack':
+            self.open_pack(filename)
+            return
         if zipped:
             if save_format == 'json' or save_format == 'dict':
                 f = gzip.open(filename, 'rt')
@@ -179,6 +184,22 @@ class Open(KatajaAction):
         m.change_forest()
         log.info("Loaded '%s'." % filename)
 
+    def open_pack(self, filename):
+        """ Indexed files are opened by restoring only the objects outside forests. Forests
+        are placeholders that are loaded when they are shown.
+        :param filename:
+        :return: None
+        """
+        m = ctrl.main
+        reader = PackReader(filename)
+        ctrl.disable_undo()
+        placeholders = reader.restore_header(m)
+        m.forest_keeper.lazy_forests = {forest: reader for forest in placeholders.values()}
+        ctrl.resume_undo()
+        ctrl.call_watchers(self.forest_keeper, 'document_changed')
+        m.change_forest()
+        log.info("Loaded '%s'." % filename)
+
 
 class Save(KatajaAction):
     k_action_uid = 'save'
@@ -188,8 +209,9 @@ class Save(KatajaAction):
 
     def save_as(self):
         ctrl.main.action_finished()
-        file_help = """"All (*.kataja *.zkataja *.dict *.zdict *.json *.zjson);;
+        file_help = """"All (*.kataja *.zkataja *.kpack *.dict *.zdict *.json *.zjson);;
     Kataja files (*.kataja);; Packed Kataja files (*.zkataja);;
+    Indexed Kataja files (*.kpack);;
     Python dict dumps (*.dict);; Packed python dicts (*.zdict);;
     JSON dumps (*.json);; Packed JSON (*.zjson)
     """
@@ -211,6 +233,13 @@ class Save(KatajaAction):
                 save_format = i[0]
                 break
 
+        if save_format == 'pack':
+            t = time.time()
+            save_pack(filename, ctrl.main)
+            log.info("Saved to '%s'. Took %s seconds." % (filename, time.time() - t))
+            return
+        # other formats need the forests that haven't been loaded from pack file yet
+        ctrl.main.forest_keeper.load_lazy_forests()
         all_data = ctrl.main.create_save_data()
         t = time.time()
         pickle_format = 4
@@ -280,8 +309,8 @@ class PrintToFile(KatajaAction):
 
     def method(self):
         """ Starts the printing process.
-         1st step is to clean the scene for a printing and display the printed
-         area -frame.
+         1st step is to settle the layout, clean the scene for a printing and display the
+         printed area -frame.
          2nd step: after 50ms remove printed area -frame and prints to pdf,
          and write the file.
 
@@ -303,6 +332,8 @@ class PrintToFile(KatajaAction):
                 return
 
         sc = ctrl.graph_scene
+        # don't print a layout that is still moving
+        ctrl.forest.settle_layout()
         # hide unwanted components
         no_brush = QtGui.QBrush(Qt.NoBrush)
         sc.setBackgroundBrush(no_brush)
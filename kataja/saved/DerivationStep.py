@@ -23,9 +23,15 @@
 # ############################################################################
 
 ### NEED TO RETHINK DERIVATION STEP SYSTEM  -- PEN AND PAPER TIME ###
+import hashlib
+import pickle
+import sys
+from collections import defaultdict, OrderedDict
 
-from kataja.singletons import ctrl, log
-from kataja.SavedObject import SavedObject
+from PyQt5 import QtCore
+
+from kataja.singletons import ctrl, log, prefs
+from kataja.SavedObject import SavedObject, save_objects, find_refs
 from kataja.SavedField import SavedField
 from kataja.utils import time_me
 
@@ -38,6 +44,14 @@ from kataja.utils import time_me
 from kataja.synobjs_to_nodes import synobjs_to_nodes
 
 
+def state_hash(obj_data):
+    """ Content address for frozen object: same object in same state gets the same hash.
+    :param obj_data: save data of one object
+    :return: str
+    """
+    return sys.intern(hashlib.sha1(pickle.dumps(obj_data, protocol=4)).hexdigest())
+
+
 class DerivationStep(SavedObject):
     """ Packed state of syntactic objects for stepwise animation of trees growth.
      """
@@ -75,7 +89,18 @@ class DerivationStep(SavedObject):
 
 class DerivationStepManager(SavedObject):
     """ Stores derivation steps for one forest and takes care of related
-    logic """
+    logic.
+
+    Frozen objects are stored by their content in frozen_objects, hash -> save data, and a
+    derivation step is a dict of uid -> hash. Consecutive steps usually share most of their
+    objects, so each state of an object is stored only once. When moving between steps, objects
+    that are in the same state in both steps are reused and only the rest are restored.
+
+    Restored steps are kept in a LRU cache, and steps next to the current one are restored into
+    the cache while the current step is shown. Reused objects are the very same objects, so when
+    showing a step only nodes of the objects that are not the same as in the shown step need to
+    be updated.
+    """
 
     def __init__(self, forest=None):
         super().__init__()
@@ -84,6 +109,12 @@ class DerivationStepManager(SavedObject):
         self.current = None
         self.derivation_steps = []
         self.derivation_step_index = 0
+        self.frozen_objects = {}
+        self._restored = {}
+        self._refs_cache = {}
+        self._step_cache = OrderedDict()
+        self._shown = None  # ShownSynobjs of the shown step
+        self._edited = {}  # uid -> object, objects reported as changed since the last restore
 
     def save_and_create_derivation_step(self, synobjs, numeration=None, other=None, msg='',
                                         gloss='', transferred=None, mover=None):
@@ -102,36 +133,165 @@ class DerivationStepManager(SavedObject):
         # Use Kataja's save system to freeze objects into form where they can be stored and restored
         # without further changes affecting them.
         savedata = {}
-        open_references = {}
-        d_step.save_object(savedata, open_references)
-        c = 0
-        max_depth = 100 # constituent trees can be surprisingly deep, and we don't have any
-        # general dict about them.
-        while open_references and c < max_depth:
-            c += 1
-            for obj in list(open_references.values()):
-                if hasattr(obj, 'uid'):
-                    #print('saving obj ', obj.uid)
-                    obj.save_object(savedata, open_references)
-                else:
-                    print('cannot save open reference object ', obj)
-        assert(c < max_depth) # please raise the max depth if this is reached
-        self.derivation_steps.append((d_step.uid, savedata, msg))
+        save_objects([d_step], savedata)
+        frozen = self.frozen_objects
+        hashes = {}
+        for obj_uid, obj_data in savedata.items():
+            h = state_hash(obj_data)
+            if h not in frozen:
+                frozen[h] = obj_data
+            hashes[obj_uid] = h
+        self.derivation_steps.append((d_step.uid, hashes, msg))
+
+    def _refs(self, h):
+        refs = self._refs_cache.get(h, None)
+        if refs is None:
+            refs = find_refs(self.frozen_objects[h])
+            self._refs_cache[h] = refs
+        return refs
+
+    def _reusable_objects(self, hashes, current):
+        """ Find objects of a restored step that can be used as they are in the step
+        described by hashes. Object can be reused if it has the same state in both steps and
+        all objects it refers to can be reused too.
+        :param hashes: dict of uid -> hash
+        :param current: dict of uid -> (hash, object) of the restored step
+        :return: dict of uid -> object
+        """
+        reusable = {}
+        for obj_uid, h in hashes.items():
+            old = current.get(obj_uid, None)
+            if old and old[0] == h:
+                reusable[obj_uid] = old[1]
+        if not reusable:
+            return reusable
+        referrers = defaultdict(list)
+        for obj_uid in reusable:
+            for ref in self._refs(hashes[obj_uid]):
+                referrers[ref].append(obj_uid)
+        dirty = [obj_uid for obj_uid in hashes if obj_uid not in reusable]
+        while dirty:
+            for referrer in referrers.get(dirty.pop(), ()):
+                if referrer in reusable:
+                    del reusable[referrer]
+                    dirty.append(referrer)
+        return reusable
+
+    def note_edits(self, objects):
+        """ Undo manager reports objects that actions, undo or redo have changed. If they are
+        objects of the shown step, they are checked before the step is left.
+        :param objects: iterable of SavedObjects
+        :return: None
+        """
+        for obj in objects:
+            self._edited[obj.uid] = obj
+
+    def _drop_edited_objects(self):
+        """ Objects of the shown step may have been edited. Forget edited objects and cached
+        steps that use them, so that they are restored again from their frozen state. Only
+        objects reported by note_edits or waiting in undo pile are checked, so changes made
+        while undo is disabled are not noticed.
+        :return: None
+        """
+        candidates = self._edited
+        self._edited = {}
+        for obj in ctrl.undo_pile:
+            candidates[obj.uid] = obj
+        edited = {}
+        for obj_uid, candidate in candidates.items():
+            h, obj = self._restored.get(obj_uid, (None, None))
+            if obj is not candidate:
+                continue
+            data = {}
+            obj.save_object(data, {})
+            if state_hash(data[obj.uid]) != h:
+                edited[obj_uid] = obj
+        if not edited:
+            return
+        # shown objects have changed after they were put on display
+        self._shown = None
+        for key, (d_step, restored) in list(self._step_cache.items()):
+            for obj_uid, obj in edited.items():
+                if obj_uid in restored and restored[obj_uid][1] is obj:
+                    del self._step_cache[key]
+                    break
+        # cache entry of the shown step was dropped above, so this can be edited in place
+        for obj_uid in edited:
+            del self._restored[obj_uid]
+
+    def _restore_step(self, step, current):
+        """ Restore objects of a derivation step, reusing objects from another restored step.
+        :param step: (uid, dict of uid -> hash, msg) -tuple from derivation_steps
+        :param current: dict of uid -> (hash, object) of the restored step
+        :return: (DerivationStep, dict of uid -> (hash, object))
+        """
+        uid, hashes, msg = step
+        frozen = self.frozen_objects
+        frozen_data = {obj_uid: frozen[h] for obj_uid, h in hashes.items()}
+        restored = self._reusable_objects(hashes, current)
+        restored.pop(uid, None)
+        d_step = DerivationStep(uid=uid)
+        d_step.load_objects(frozen_data, ctrl.main, restored=restored)
+        return d_step, {obj_uid: (hashes[obj_uid], obj) for obj_uid, obj in restored.items()
+                        if obj_uid in hashes}
+
+    @staticmethod
+    def _is_old_format(step):
+        step_data = step[1]
+        return step_data and isinstance(next(iter(step_data.values())), dict)
+
+    def _trim_cache(self):
+        while len(self._step_cache) > prefs.derivation_step_cache:
+            self._step_cache.popitem(last=False)
+
+    def _prefetch_neighbours(self):
+        """ Restore steps before and after the current step into cache, so that they are ready
+        when user moves to them.
+        :return: None
+        """
+        i = self.derivation_step_index
+        ctrl.disable_undo()
+        try:
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(self.derivation_steps):
+                    step = self.derivation_steps[j]
+                    if step[0] in self._step_cache or self._is_old_format(step):
+                        continue
+                    self._step_cache[step[0]] = self._restore_step(step, self._restored)
+        finally:
+            ctrl.resume_undo()
+        self._trim_cache()
 
     @time_me
     def restore_derivation_step(self):
         if self.derivation_steps:
-            uid, frozen_data, msg = self.derivation_steps[self.derivation_step_index]
-            d_step = DerivationStep(uid=uid)
-            d_step.load_objects(frozen_data, ctrl.main)
+            step = self.derivation_steps[self.derivation_step_index]
+            uid, step_data, msg = step
+            if self._is_old_format(step):
+                # derivation steps from older files have full save data for each step
+                d_step = DerivationStep(uid=uid)
+                d_step.load_objects(step_data, ctrl.main)
+                self._restored = {}
+                self._shown = None
+            else:
+                self._drop_edited_objects()
+                entry = self._step_cache.pop(uid, None)
+                if entry is None:
+                    entry = self._restore_step(step, self._restored)
+                self._step_cache[uid] = entry
+                self._trim_cache()
+                d_step, self._restored = entry
             self.activated = True
             self.current = d_step
 
-            synobjs_to_nodes(self.forest, d_step.synobjs, d_step.numeration, d_step.other,
-                             d_step.msg, d_step.gloss, d_step.transferred,
-                             d_step.mover)
+            self._shown = synobjs_to_nodes(self.forest, d_step.synobjs, d_step.numeration,
+                                           d_step.other, d_step.msg, d_step.gloss,
+                                           d_step.transferred, d_step.mover, shown=self._shown)
             if msg:
                 log.info(msg)
+            # prefetching is done when Qt gets back to its event loop, after the step is drawn
+            if prefs.derivation_step_cache > 2 and QtCore.QCoreApplication.instance():
+                QtCore.QTimer.singleShot(0, self._prefetch_neighbours)
 
     def next_derivation_step(self):
         """
@@ -171,5 +331,6 @@ class DerivationStepManager(SavedObject):
     # ############## #
 
     derivation_steps = SavedField("derivation_steps")
+    frozen_objects = SavedField("frozen_objects")
     derivation_step_index = SavedField("derivation_step_index", watcher="forest_changed")
     forest = SavedField("forest")
@@ -177,6 +177,8 @@ class Edge(QtWidgets.QGraphicsObject, SavedObject):
         elif transition_type == g.DELETED:
             ctrl.free_drawing.delete_edge(self, fade=False)
             return
+        if 'start' in updated_fields or 'end' in updated_fields:
+            ctrl.forest.structure_edits += 1
         self.connect_end_points(self.start, self.end)
         self.update_visibility()
         #self.update_end_points()
@@ -23,6 +23,8 @@
 # ############################################################################
 import string
 import time
+from itertools import chain
+
 from PyQt5 import QtWidgets
 from kataja.saved.movables.nodes.AttributeNode import AttributeNode
 
@@ -42,7 +44,7 @@ from kataja.saved.movables.Tree import Tree
 from kataja.saved.movables.nodes.ConstituentNode import ConstituentNode
 from kataja.saved.movables.nodes.FeatureNode import FeatureNode
 from kataja.singletons import ctrl, classes
-from kataja.utils import time_me
+from kataja.utils import time_me, div_xy, sub_xy
 
 
 class Forest(SavedObject):
@@ -94,6 +96,9 @@ class Forest(SavedObject):
         self.gloss_text = ''
         self.ongoing_animations = set()
         self.halt_drawing = False
+        self.moved_items = []  # items that moved during the last frame
+        self.paths_rebuilt = 0  # edges whose paths were updated in the last frame
+        self.structure_edits = 0  # nodes, edges and groups added, removed or reconnected
         self.gloss_text = gloss_text
         self.comments = comments
 
@@ -107,12 +112,16 @@ class Forest(SavedObject):
         :param transition_type: 0:edit, 1:CREATED, -1:DELETED
         :return: None
         """
+        if 'nodes' in updated_fields or 'edges' in updated_fields or \
+                'groups' in updated_fields:
+            self.structure_edits += 1
         if 'nodes' in updated_fields:
             # rebuild from-syntactic_object-to-node -dict
             self.nodes_from_synobs = {}
             for node in self.nodes.values():
                 if node.syntactic_object:
                     self.nodes_from_synobs[node.syntactic_object.uid] = node
+            self.tree_manager.invalidate()
             for tree in self.trees:
                 tree.update_items()
         if 'vis_data' in updated_fields:
@@ -225,10 +234,32 @@ class Forest(SavedObject):
         def _iterate(node):
             yield node
             for child in node.get_children(similar=False, visible=False):
-                _iterate(child)
+                yield from _iterate(child)
 
         return _iterate(first)
 
+    @staticmethod
+    def _list_once(first, similar, visible):
+        """ Left-first (pre-order) walk where each node is listed only once. Walk uses an
+        explicit stack and a set of visited nodes, so it works for deep structures and is linear
+        to the number of edges.
+        :param first: Node to start from
+        :param similar: passed to get_children
+        :param visible: passed to get_children
+        :return: list of nodes
+        """
+        result = []
+        visited = set()
+        stack = [first]
+        while stack:
+            node = stack.pop()
+            if node in visited:
+                continue
+            visited.add(node)
+            result.append(node)
+            stack.extend(reversed(node.get_children(similar=similar, visible=visible)))
+        return result
+
     @staticmethod
     def list_visible_nodes_once(first):
         """
@@ -238,16 +269,7 @@ class Forest(SavedObject):
         :param first: Node, can be started from a certain point in structure
         :return: iterator through nodes
         """
-        result = []
-
-        def _iterate(node):
-            if node not in result:
-                result.append(node)
-                for child in node.get_children(visible=True, similar=True):
-                    _iterate(child)
-
-        _iterate(first)
-        return result
+        return Forest._list_once(first, similar=True, visible=True)
 
     @staticmethod
     def list_nodes_once(first):
@@ -258,16 +280,7 @@ class Forest(SavedObject):
         :param first: Node, start from a certain point in structure
         :return: iterator through nodes
         """
-        result = []
-
-        def _iterate(node):
-            if node not in result:
-                result.append(node)
-                for child in node.get_children(similar=False, visible=False):
-                    _iterate(child)
-
-        _iterate(first)
-        return result
+        return Forest._list_once(first, similar=False, visible=False)
 
     def visible_nodes(self):
         """ Any node that is visible. Ignore the type.
@@ -350,8 +363,8 @@ class Forest(SavedObject):
         def _tree_as_text(tree, node, gap):
             """ Cheapo linearization algorithm for Node structures."""
             l = []
-            if node in tree.sorted_constituents:
-                i = tree.sorted_constituents.index(node)
+            i = tree.constituent_positions().get(node, None)
+            if i is not None:
                 for n in tree.sorted_constituents[i:]:
                     l.append(str(n.syntactic_object))
             return gap.join(l)
@@ -391,22 +404,21 @@ class Forest(SavedObject):
         # self.features[item.key] = item
 
         if isinstance(item, Node):
-            self.poke('nodes')
-            self.nodes[item.uid] = item
+            self.set_item('nodes', item.uid, item)
+            self.structure_edits += 1
             self.free_drawing.node_types.add(item.node_type)
             if item.syntactic_object:
                 # remember to rebuild nodes_by_uid in undo/redo, as it is not
                 #  stored in model
                 self.nodes_from_synobs[item.syntactic_object.uid] = item
         elif isinstance(item, Edge):
-            self.poke('edges')
-            self.edges[item.uid] = item
+            self.set_item('edges', item.uid, item)
+            self.structure_edits += 1
             self.free_drawing.edge_types.add(item.edge_type)
         else:
             key = getattr(item, 'uid', '') or getattr(item, 'key', '')
             if key and key not in self.others:
-                self.poke('others')
-                self.others[key] = item
+                self.set_item('others', key, item)
             else:
                 print('F trying to store broken type:', item.__class__.__name__)
 
@@ -586,6 +598,101 @@ class Forest(SavedObject):
         sc.start_animations()
         ctrl.graph_view.repaint()
 
+    def move_nodes(self):
+        """ Do one frame of movement for all visible nodes and trees. This is the body of
+        animation loop in GraphScene.timerEvent and in settle_layout.
+        :return: (items_have_moved, largest_step), where largest_step is the largest movement
+        (dx + dy) done by any item in this frame
+        """
+        items_have_moved = False
+        can_normalize = True
+        largest_step = 0
+        moved_items = []
+        md = {'sum': (0, 0), 'nodes': []}
+        if self.visualization:
+            md['batch'] = self.visualization.prepare_frame()
+        for node in chain(self.nodes.values(), self.trees):
+            if not node.isVisible():
+                continue
+            # Computed movement
+            old_x, old_y = node.current_position
+            moved, normalizable = node.move(md)
+            new_x, new_y = node.current_position
+            if new_x != old_x or new_y != old_y:
+                moved_items.append(node)
+            if moved:
+                items_have_moved = True
+                step = abs(new_x - old_x) + abs(new_y - old_y)
+                if step > largest_step:
+                    largest_step = step
+            if not normalizable:
+                can_normalize = False
+
+        # normalize movement so that the trees won't glide away
+        ln = len(md['nodes'])
+        if ln and can_normalize:
+            avg = div_xy(md['sum'], ln)
+            if avg != (0, 0):
+                for node in md['nodes']:
+                    node.current_position = sub_xy(node.current_position, avg)
+                moved_items += md['nodes']
+        self.moved_items = moved_items
+        return items_have_moved, largest_step
+
+    def update_moved_paths(self):
+        """ Update paths of edges that are connected to items that moved in the last frame, and
+        shapes of groups that contain them.
+        :return: number of edges whose paths were updated, also available as
+        self.paths_rebuilt
+        """
+        # nodes move also when their parent in graphics item hierarchy moves, e.g. nodes in a
+        # tree or features locked to a constituent
+        moved_nodes = set()
+        stack = list(self.moved_items)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Node):
+                if item in moved_nodes:
+                    continue
+                moved_nodes.add(item)
+            stack += [child for child in item.childItems() if isinstance(child, Node)]
+        edges = set()
+        for node in moved_nodes:
+            edges.update(node.edges_up)
+            edges.update(node.edges_down)
+        for edge in edges:
+            edge.make_path()
+        for group in self.groups.values():
+            if not moved_nodes.isdisjoint(group.selection_with_children):
+                group.update_shape()
+        self.paths_rebuilt = len(edges)
+        return self.paths_rebuilt
+
+    def settle_layout(self, tolerance=0.6, max_iterations=500):
+        """ Run the movement loop until nodes stop moving, without waiting for the animation
+        timer, and then update edges and groups once for the final positions. Use this when
+        printing, exporting or rendering from scripts, where the animation is not wanted.
+        :param tolerance: layout is settled when no item moves more than this (dx + dy) in a frame
+        :param max_iterations: give up after this many frames
+        :return: number of frames computed
+        """
+        for node in chain(self.nodes.values(), self.trees):
+            node.finish_moving()
+        iterations = 0
+        while iterations < max_iterations:
+            iterations += 1
+            items_have_moved, largest_step = self.move_nodes()
+            if not items_have_moved or largest_step <= tolerance:
+                break
+            # some visualizations use edge end points when computing forces
+            for edge in self.edges.values():
+                edge.update_end_points()
+        for edge in self.edges.values():
+            edge.make_path()
+        for group in self.groups.values():
+            group.update_shape()
+        return iterations
+
     def redraw_edges(self, edge_type=None):
         if edge_type:
             for edge in self.edges.values():
@@ -703,6 +810,7 @@ class Forest(SavedObject):
         for tree in self:
             sortable_parents = []
             ltree = tree.sorted_nodes
+            positions = tree.node_positions()
             for node in ltree:
                 if not hasattr(node, 'index'):
                     continue
@@ -712,8 +820,8 @@ class Forest(SavedObject):
                     required_keys.add(node_key)
                     my_parents = []
                     for parent in parents:
-                        if parent in ltree:
-                            i = ltree.index(parent)
+                        i = positions.get(parent, None)
+                        if i is not None:
                             my_parents.append((i, node_key, parent, True))
                     if my_parents:
                         my_parents.sort()
@@ -760,7 +868,7 @@ class Forest(SavedObject):
         once than recursively compute these when updating labels.
         :return:
         """
-        def recursive_width(node):
+        def node_width(node, children):
             if node.is_leaf(only_similar=True, only_visible=True):
                 if node.is_visible():
                     w = node.label_object.width
@@ -768,16 +876,26 @@ class Forest(SavedObject):
                     w = 0
             else:
                 w = node.label_object.left_bracket_width() + node.label_object.right_bracket_width()
-                for n in node.get_children(similar=True, visible=True):
-                    if self.should_we_draw(n, node):
-                        w += recursive_width(n)
+                for n in children:
+                    w += widths[n]
             self.width_map[node.uid] = w
             node.update_label()
             return w
 
+        # Post-order walk with an explicit stack: node's width is computed after its children.
         self.width_map = {}
         for tree in self:
-            recursive_width(tree.top)
+            widths = {}
+            stack = [(tree.top, None)]
+            while stack:
+                node, children = stack.pop()
+                if children is None:
+                    children = [n for n in node.get_children(similar=True, visible=True)
+                                if self.should_we_draw(n, node)]
+                    stack.append((node, children))
+                    stack.extend((n, None) for n in reversed(children))
+                else:
+                    widths[node] = node_width(node, children)
         return self.width_map
 
     # ### Minor updates for forest elements
@@ -183,6 +183,22 @@ class Group(SavedObject, QtWidgets.QGraphicsObject):
             else:
                 ctrl.ui.remove_ui_for(self)
 
+    def add_nodes(self, nodes):
+        """ Add multiple nodes, just to avoid repeated calls to expensive updates
+        :param nodes:
+        :return:
+        """
+        in_selection = set(self.selection)
+        new_nodes = []
+        for node in nodes:
+            if node not in in_selection:
+                in_selection.add(node)
+                new_nodes.append(node)
+        if new_nodes:
+            self.poke('selection')
+            self.update_selection(list(self.selection) + new_nodes)
+            self.update_shape()
+
     def clear(self, remove=True):
         self.selection = set()
         self.selection_with_children = set()
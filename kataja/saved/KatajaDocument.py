@@ -53,6 +53,32 @@ class KatajaDocument(SavedObject):
         self.structures = OrderedDict()
         self.constituents = OrderedDict()
         self.features = OrderedDict()
+        # forests that are placeholders for forests in a save file, forest -> PackReader
+        self.lazy_forests = {}
+
+    def load_lazy_forest(self, forest):
+        """ If forest is only a placeholder for a forest in a save file, load its data now.
+        :param forest: Forest
+        :return: None
+        """
+        reader = self.lazy_forests.pop(forest, None)
+        if not reader:
+            return
+        main = ctrl.main
+        current = main.forest
+        ctrl.disable_undo()
+        reader.restore_forest(forest, main)
+        # restoring a forest makes it the active forest, but the caller decides about that
+        main.forest = current
+        ctrl.resume_undo()
+
+    def load_lazy_forests(self):
+        """ Load all forests that haven't been loaded yet, e.g. before saving in formats that
+        need all of the data.
+        :return: None
+        """
+        for forest in list(self.lazy_forests.keys()):
+            self.load_lazy_forest(forest)
 
     def new_forest(self):
         """ Add a new forest after the current one.
@@ -160,6 +186,7 @@ class KatajaDocument(SavedObject):
         if self.forest:
             self.forest.retire_from_drawing()
         self.forests = []
+        self.lazy_forests = {}
 
         # buildstring is the bracket trees or trees.
         buildstring = []
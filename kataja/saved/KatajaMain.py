@@ -47,7 +47,7 @@ from kataja.GraphScene import GraphScene
 from kataja.GraphView import GraphView
 from kataja.PaletteManager import PaletteManager
 from kataja.SavedField import SavedField
-from kataja.SavedObject import SavedObject
+from kataja.SavedObject import SavedObject, save_objects
 from kataja.Settings import Settings
 from kataja.UIManager import UIManager
 from kataja.saved.Forest import Forest
@@ -340,6 +340,7 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
         self.forest_keepers = [classes.get('KatajaDocument')()]
         self.forest_keeper = self.forest_keepers[0]
         ctrl.call_watchers(self.forest_keeper, 'document_changed')
+        ctrl.label_layouts.clear()
 
     def load_initial_treeset(self):
         """ Loads and initializes a new set of trees. Has to be done before
@@ -362,6 +363,7 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
         self.forest_keepers.append(classes.KatajaDocument(name=name))
         self.forest_keeper = self.forest_keepers[-1]
         ctrl.call_watchers(self.forest_keeper, 'document_changed')
+        ctrl.label_layouts.clear()
         self.change_forest()
         self.ui_manager.update_projects_menu()
         return self.forest_keeper
@@ -370,6 +372,7 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
         self.forest.retire_from_drawing()
         self.forest_keeper = self.forest_keepers[i]
         ctrl.call_watchers(self.forest_keeper, 'document_changed')
+        ctrl.label_layouts.clear()
         self.change_forest()
         self.ui_manager.update_projects_menu()
         return self.forest_keeper
@@ -386,6 +389,7 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
             self.forest.retire_from_drawing()
         if not self.forest_keeper.forest:
             self.forest_keeper.create_forests(clear=True)
+        self.forest_keeper.load_lazy_forest(self.forest_keeper.forest)
         self.forest = self.forest_keeper.forest
         self.settings_manager.set_forest(self.forest)
         if self.forest.is_parsed:
@@ -597,6 +601,7 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
         self.forest_keepers.append(classes.KatajaDocument(clear=True))
         self.forest_keeper = self.forest_keepers[-1]
         self.settings_manager.set_document(self.forest_keeper)
+        ctrl.label_layouts.clear()
         self.forest = None
 
     # ## Other window events
@@ -627,22 +632,8 @@ class KatajaMain(SavedObject, QtWidgets.QMainWindow):
         and circular references stripped out.
         :return: dict
         """
-        savedata = {}
-        open_references = {}
-        savedata['save_scheme_version'] = 0.4
-        self.save_object(savedata, open_references)
-        max_rounds = 10
-        c = 0
-        while open_references and c < max_rounds:
-            c += 1
-            #print(len(savedata))
-            #print('---------------------------')
-            for obj in list(open_references.values()):
-                if hasattr(obj, 'uid'):
-                    obj.save_object(savedata, open_references)
-                else:
-                    print('cannot save open reference object ', obj)
-        assert(c < max_rounds)
+        savedata = {'save_scheme_version': 0.4}
+        save_objects([self], savedata)
         print('total savedata: %s chars in %s items.' % (
         len(str(savedata)), len(savedata)))
         # print(savedata)
@@ -239,7 +239,8 @@ class Movable(SavedObject, QtWidgets.QGraphicsObject):
         5. visualisation algorithm setting it specifically
         (6) or (0) -- places where subclasses can add new movements.
 
-        :param md: movement data dict, collects sum of all movement to help normalize it
+        :param md: movement data dict, collects sum of all movement to help normalize it. If
+        visualization computed the frame in batch, md['batch'] has the movement for each node.
         :return:
         """
         # _high_priority_move can be used together with _move_counter
@@ -283,7 +284,11 @@ class Movable(SavedObject, QtWidgets.QGraphicsObject):
             return True, False
         # Physics move node around only if other movement types have not overridden it
         elif self.use_physics() and self.is_visible():
-            movement = ctrl.forest.visualization.calculate_movement(self)
+            batch = md.get('batch')
+            if batch and self in batch:
+                movement = batch[self]
+            else:
+                movement = ctrl.forest.visualization.calculate_movement(self)
             md['sum'] = add_xy(movement, md['sum'])
             md['nodes'].append(self)
             self.current_position = add_xy(self.current_position, movement)
@@ -347,6 +352,14 @@ class Movable(SavedObject, QtWidgets.QGraphicsObject):
             self.after_move_function = None
         self._move_counter = 0
 
+    def finish_moving(self):
+        """ Skip the rest of move_to animation and put the item directly to its target position.
+        :return: None
+        """
+        if self._move_counter:
+            self.current_position = self.target_position
+            self.stop_moving()
+
     def _current_position_changed(self, value):
         self.setPos(value[0], value[1])
 
@@ -204,6 +204,8 @@ class Node(Movable):
             ctrl.free_drawing.delete_node(self, touch_edges=False, fade=False)
             return
 
+        if 'edges_up' in updated_fields or 'edges_down' in updated_fields:
+            ctrl.forest.tree_manager.nodes_changed(self)
         if 'triangle_stack' in updated_fields:
             print('updating triangle_stack')
             if self.is_triangle_host():
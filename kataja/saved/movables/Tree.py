@@ -51,6 +51,12 @@ class Tree(Movable):
             self.sorted_nodes = [top]
         else:
             self.sorted_nodes = []
+        # positions of nodes in sorted_nodes and sorted_constituents, rebuilt when the lists
+        # change, see node_positions
+        self._node_positions = {}
+        self._node_positions_for = None
+        self._constituent_positions = {}
+        self._constituent_positions_for = None
         self.numeration = numeration
         self.current_position = 100, 100
         self.drag_data = None
@@ -66,7 +72,30 @@ class Tree(Movable):
         return "Tree '%s' and %s nodes.%s" % (self.top, len(self.sorted_nodes), suffix)
 
     def __contains__(self, item):
-        return item in self.sorted_nodes
+        return item in self.node_positions()
+
+    def node_positions(self):
+        """ Positions of nodes in the pre-order of this tree (sorted_nodes). The dict is
+        cached and built again only when sorted_nodes has been replaced or has grown, which
+        happens in update_items, i.e. after forest_edited and TreeManager.update_trees.
+        :return: dict of node -> index in sorted_nodes
+        """
+        nodes = self.sorted_nodes
+        if self._node_positions_for is not nodes or len(self._node_positions) != len(nodes):
+            self._node_positions = {node: i for i, node in enumerate(nodes)}
+            self._node_positions_for = nodes
+        return self._node_positions
+
+    def constituent_positions(self):
+        """ Positions of constituent nodes in sorted_constituents, see node_positions.
+        :return: dict of node -> index in sorted_constituents
+        """
+        nodes = self.sorted_constituents
+        if self._constituent_positions_for is not nodes or \
+                len(self._constituent_positions) != len(nodes):
+            self._constituent_positions = {node: i for i, node in enumerate(nodes)}
+            self._constituent_positions_for = nodes
+        return self._constituent_positions
 
     def after_init(self):
         self.recalculate_top()
@@ -156,7 +185,7 @@ class Tree(Movable):
 
     def add_to_numeration(self, node):
         def add_children(node):
-            if node not in self.sorted_nodes:
+            if node not in self:
                 self.sorted_nodes.append(node)
                 if self not in node.trees:
                     self.add_node(node)
@@ -226,8 +255,9 @@ class Tree(Movable):
         :param node_b:
         :return:
         """
-        if node_a in self and node_b in self:
-            return self.sorted_nodes.index(node_a) < self.sorted_nodes.index(node_b)
+        positions = self.node_positions()
+        if node_a in positions and node_b in positions:
+            return positions[node_a] < positions[node_b]
         else:
             return None
 
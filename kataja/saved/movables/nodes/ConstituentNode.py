@@ -678,10 +678,10 @@ class ConstituentNode(Node):
         """ Implement this if structure is supposed to drag with the node
         :return:
         """
-        children = ctrl.forest.list_nodes_once(self)
+        children = set(ctrl.forest.list_nodes_once(self))
 
         for tree in self.trees:
-            dragged_index = tree.sorted_constituents.index(self)
+            dragged_index = tree.constituent_positions()[self]
             for i, node in enumerate(tree.sorted_constituents):
                 if node is not self and i > dragged_index and node in children:
                     node.start_dragging_tracking(host=False, scene_pos=scene_pos)
@@ -33,12 +33,43 @@ from kataja.singletons import ctrl
 from kataja.utils import time_me
 
 
+class ShownSynobjs:
+    """ Syntactic objects that synobjs_to_nodes has put on display in a forest: objects by uid,
+    uids of objects that each of them refers to and how many references each object has. Next
+    call can compare its syntactic objects to these and update only nodes and edges of objects
+    that have changed.
+    """
+
+    def __init__(self, forest):
+        self.forest = forest
+        self.objects = {}
+        self.refs = {}
+        self.ref_counts = collections.Counter()
+        self.roots = ()
+        self.transferred = ()
+        self.structure_edits = 0
+
+    def is_valid_for(self, forest):
+        """ Nodes, edges and groups of forest should be as synobjs_to_nodes left them. If
+        anything has added or removed them in between, including undo and redo, the comparison
+        can't be trusted.
+        :param forest:
+        :return: bool
+        """
+        return forest is self.forest and forest.structure_edits == self.structure_edits
+
+
 @time_me
 def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, gloss=None,
-                     transferred=None, mover=None):
+                     transferred=None, mover=None, shown=None):
     """ This is a big important function to ensure that Nodes on display are only those that
     are present in syntactic objects. Clean up the residue, create those nodes that are
     missing and create the edges.
+
+    If shown is given, only objects that are not the same objects as in shown are processed,
+    and nodes of objects that are not referred anymore are deleted. This relies on objects not
+    being modified in place: if an object is the same as before, so are the objects it refers
+    to. Derivation steps restored by DerivationStepManager are like this.
     :param forest: forest where everything happens
     :param synobjs: syntactic objects
     :param numeration: list of objects waiting to be processed
@@ -47,15 +78,30 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
     :param gloss: gloss text for the whole forest
     :param transferred: list of items spelt out/transferred. These will form a group
     :param mover: single items to point out as special. This will form a group
-    :return:
+    :param shown: ShownSynobjs from previous call for this forest, or None to check all nodes
+    and edges
+    :return: ShownSynobjs for the next call
     """
     free_drawing = forest.free_drawing
 
     if forest.syntax.display_modes:
         synobjs = forest.syntax.transform_trees_for_display(synobjs)
-
-    node_keys_to_validate = set(forest.nodes.keys())
-    edge_keys_to_validate = set(forest.edges.keys())
+        # transformed objects are new each time
+        shown = None
+    if shown and not shown.is_valid_for(forest):
+        shown = None
+    diff = shown is not None
+    if not diff:
+        shown = ShownSynobjs(forest)
+    synobjs = [tree_root for tree_root in synobjs if tree_root]
+
+    if diff:
+        # nodes and edges to check are found when comparing objects
+        node_keys_to_validate = set()
+        edge_keys_to_validate = set()
+    else:
+        node_keys_to_validate = set(forest.nodes.keys())
+        edge_keys_to_validate = set(forest.edges.keys())
 
     animate = True
 
@@ -85,15 +131,43 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
                 if my_item.uid not in done_nodes:
                     yield my_item
 
+    def is_unchanged(me):
+        return diff and shown.objects.get(me.uid, None) is me
+
+    def add_to_shown(me, refs):
+        """ Remember object and the objects it refers to, and find nodes and edges that may
+        have become unnecessary when the object has changed.
+        """
+        refs = tuple(ref.uid for ref in refs)
+        changed_objects.add(me.uid)
+        if diff:
+            node = forest.get_node(me)
+            if node:
+                changed_nodes.add(node)
+                edge_keys_to_validate.update(edge.uid for edge in node.edges_up)
+                edge_keys_to_validate.update(edge.uid for edge in node.edges_down)
+            for ref in shown.refs.get(me.uid, ()):
+                shown.ref_counts[ref] -= 1
+                unreferred.append(ref)
+            for ref in refs:
+                shown.ref_counts[ref] += 1
+        shown.objects[me.uid] = me
+        shown.refs[me.uid] = refs
+
     def recursive_add_const_node(me, parent_synobj):
         """ First we have to create new nodes close to existing nodes to avoid rubberbanding.
         To help this create a list of missing nodes with known positions.
         """
         done_nodes.add(me.uid)
+        if is_unchanged(me):
+            return
+        add_to_shown(me, list(iter_me(me.parts)) + list(iter_me(me.features)))
         node = forest.get_node(me)
         if node:
             found_nodes.add(node.uid)
             node.label = me.label
+            # restored objects replace the earlier objects with the same uid
+            node.syntactic_object = me
         else:
             cns_to_create.append((me, parent_synobj))
         for part in iter_values(me.parts):
@@ -107,12 +181,23 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
         To help this create a list of missing nodes with known positions.
         """
         done_nodes.add(me.uid)
+        if is_unchanged(me):
+            return
+        refs = []
+        if hasattr(me, 'parts'):
+            refs += iter_me(me.parts)
+        if hasattr(me, 'features'):
+            refs += iter_me(me.features)
+        if getattr(me, 'checks', None):
+            refs.append(me.checks)
+        add_to_shown(me, refs)
         node = forest.get_node(me)
         if node:
             found_nodes.add(node.uid)
             node.name = getattr(me, 'name', '')
             node.value = getattr(me, 'value', '')
             node.family = getattr(me, 'family', '')
+            node.syntactic_object = me
         else:
             fns_to_create.append((me, parent_synobj))
         # we usually don't have feature structure, but lets assume that possibility
@@ -126,13 +211,47 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
             if me.checks and me.checks.uid not in done_nodes:
                 recursive_add_feature_node(me.checks, me)
 
+    def iter_me(listlike):
+        if isinstance(listlike, dict):
+            for my_item in listlike.values():
+                yield my_item
+        elif isinstance(listlike, (list, set, tuple)):
+            for my_item in listlike:
+                yield my_item
+
     cns_to_create = []
     fns_to_create = []
     done_nodes = set()
     found_nodes = set()
+    changed_objects = set()
+    changed_nodes = set()
+    unreferred = []
+    if diff:
+        for tree_root in shown.roots:
+            shown.ref_counts[tree_root] -= 1
+            unreferred.append(tree_root)
+    shown.roots = tuple(tree_root.uid for tree_root in synobjs)
     for tree_root in synobjs:
-        if tree_root:
-            recursive_add_const_node(tree_root, None)
+        shown.ref_counts[tree_root.uid] += 1
+        recursive_add_const_node(tree_root, None)
+    if diff:
+        # objects that nothing refers to anymore are removed with their nodes and edges
+        while unreferred:
+            obj_uid = unreferred.pop()
+            if shown.ref_counts[obj_uid] <= 0 and obj_uid in shown.objects:
+                del shown.objects[obj_uid]
+                del shown.ref_counts[obj_uid]
+                node = forest.nodes_from_synobs.get(obj_uid, None)
+                if node:
+                    node_keys_to_validate.add(node.uid)
+                    edge_keys_to_validate.update(edge.uid for edge in node.edges_up)
+                    edge_keys_to_validate.update(edge.uid for edge in node.edges_down)
+                for ref in shown.refs.pop(obj_uid):
+                    shown.ref_counts[ref] -= 1
+                    unreferred.append(ref)
+    else:
+        for refs in shown.refs.values():
+            shown.ref_counts.update(refs)
     node_keys_to_validate -= found_nodes
     for syn_bare, syn_parent in cns_to_create:
         host = forest.get_node(syn_parent)
@@ -152,6 +271,7 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
         node = free_drawing.create_node(node_type=g.CONSTITUENT_NODE, pos=pos)
         node.set_syntactic_object(syn_bare)
         node.label = syn_bare.label
+        changed_nodes.add(node)
 
     for syn_feat, syn_host in fns_to_create:
         host = forest.get_node(syn_host)
@@ -164,23 +284,18 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
         fnode.name = getattr(syn_feat, 'name', '')
         fnode.value = getattr(syn_feat, 'value', '')
         fnode.family = getattr(syn_feat, 'family', '')
+        changed_nodes.add(fnode)
 
     # ################ Edges & Heads ###################################
 
-    def iter_me(listlike):
-        if isinstance(listlike, dict):
-            for my_item in listlike.values():
-                yield my_item
-        elif isinstance(listlike, (list, set, tuple)):
-            for my_item in listlike:
-                yield my_item
-
     # I guess that ordering of connections will be broken because of making
     # and deleting connections in unruly fashion
     def connect_if_necessary(parent, child, edge_type):
         edge = parent.get_edge_to(child, edge_type)
         if not edge:
             free_drawing.connect_node(parent, child, edge_type=edge_type)
+            changed_nodes.add(parent)
+            changed_nodes.add(child)
         else:
             found_edges.add(edge.uid)
 
@@ -192,7 +307,7 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
         """
         node = forest.get_node(synobj)
         assert(node)
-        if synobj.uid in done_nodes:
+        if synobj.uid in done_nodes or synobj.uid not in changed_objects:
             return node
         done_nodes.add(synobj.uid)
         if node.node_type == g.CONSTITUENT_NODE:
@@ -204,7 +319,8 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
                 nfeature = recursive_create_edges(feature)
                 if nfeature:
                     connect_if_necessary(node, nfeature, g.FEATURE_EDGE)
-            verify_edge_order_for_constituent_nodes(node)
+            if verify_edge_order_for_constituent_nodes(node):
+                forest.tree_manager.nodes_changed(node)
         elif node.node_type == g.FEATURE_NODE:
             if hasattr(synobj, 'parts'):
                 for part in iter_me(synobj.parts):
@@ -224,7 +340,7 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
             return []
         my_label = node.syntactic_object.label
         my_label_parts = [x.strip('() ') for x in my_label.split(',')]
-        if node in done_nodes:
+        if node in done_nodes or (diff and node not in changed_nodes):
             return [('_'.join([x.strip('() ') for x in n.label.split(',')]), n) for n in node.heads]
         done_nodes.add(node)
         heads = []
@@ -251,6 +367,17 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
     for tree_root in synobjs:
         recursive_create_edges(tree_root)
     edge_keys_to_validate -= found_edges
+    if diff:
+        # new nodes and nodes that lose edges need their labels and relations updated too
+        for key in node_keys_to_validate:
+            node = forest.nodes.get(key, None)
+            if node:
+                changed_nodes.add(node)
+        for key in edge_keys_to_validate:
+            edge = forest.edges.get(key, None)
+            if edge:
+                changed_nodes.add(edge.start)
+                changed_nodes.add(edge.end)
 
     done_nodes = set()
     for tree_root in synobjs:
@@ -277,7 +404,11 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
     f_mode = ctrl.settings.get('feature_positioning')
     shape = ctrl.settings.get('label_shape')
     parents = []
-    for node in forest.nodes.values():
+    if diff:
+        nodes = [node for node in changed_nodes if node and node.uid in forest.nodes]
+    else:
+        nodes = forest.nodes.values()
+    for node in nodes:
         node.update_relations(parents, shape=shape, position=f_mode)
         node.update_label()
     for parent in parents:
@@ -291,14 +422,26 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
             result_set = rec_add_item(part, result_set)
         return result_set
 
-    # Update or create groups of transferred items
-    old_groups = [gr for gr in forest.groups.values() if gr.get_label_text().startswith(
-        'Transfer')]
+    # Update or create groups of transferred items. If transferred objects are the same as
+    # before, so are their nodes and groups.
+    transferred_before = shown.transferred
+    shown.transferred = tuple(transferred or ())
+    if diff and len(transferred_before) == len(shown.transferred) and \
+            all(a is b for a, b in zip(transferred_before, shown.transferred)):
+        old_groups = []
+        transferred = None
+    else:
+        old_groups = [gr for gr in forest.groups.values() if gr.get_label_text().startswith(
+            'Transfer')]
     all_new_items = set()
     all_old_items = set()
+    group_of_item = {}
     if old_groups:
         for group in old_groups:
-            all_old_items.update(set(group.selection))
+            all_old_items.update(group.selection)
+            for item in group.selection:
+                if item not in group_of_item:
+                    group_of_item[item] = group
 
     if transferred:
         new_groups = []
@@ -321,15 +464,10 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
                 # find partially matching group
                 for selection in new_groups:
                     group_to_add = None
-                    for item in selection:
-                        for group in old_groups:
-                            if item in group.selection:
-                                group_to_add = group
-                                break
-                        break
+                    if selection:
+                        group_to_add = group_of_item.get(selection[0], None)
                     if group_to_add:
-                        for item in selection:
-                            group_to_add.add_node(item)
+                        group_to_add.add_nodes(selection)
                     else:
                         new_g = free_drawing.create_group()
                         new_g.set_label_text('Transfer')
@@ -341,11 +479,9 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
     if old_groups:
         # Remove items from groups where they don't belong
         items_to_remove = all_old_items - all_new_items
-        to_remove = [[] for x in old_groups]
-        for item in items_to_remove:
-            for i, group in enumerate(old_groups):  # we can ignore newly created groups
-                if item in group.selection:
-                    to_remove[i].append(item)
+        # we can ignore newly created groups
+        to_remove = [[item for item in group.selection if item in items_to_remove]
+                     for group in old_groups]
         for old_group, remove_list in zip(old_groups, to_remove):
             old_group.remove_nodes(remove_list)
 
@@ -380,19 +516,21 @@ def synobjs_to_nodes(forest, synobjs, numeration=None, other=None, msg=None, glo
     forest.update_forest_gloss()
     forest.guessed_projections = False
     #ctrl.graph_scene.fit_to_window(force=True)
+    shown.structure_edits = forest.structure_edits
+    return shown
 
 
 def verify_edge_order_for_constituent_nodes(node):
     """ Verify that relations to children are in same order as in syntactic object. This
     depends on how syntax supports ordering.
-    :return:
+    :return: True if edges were reordered
     """
     def strict_index(flist, feat):
         for i, fitem in enumerate(flist):
             if feat is fitem:
                 return i
 
-
+    reordered = False
     if isinstance(node.syntactic_object.parts, list):
         #  we assume that if parts use lists, then they are implicitly ordered.
         correct_order = node.syntactic_object.parts
@@ -410,6 +548,7 @@ def verify_edge_order_for_constituent_nodes(node):
                     passed.append(edge)
             new_order = [edge for i, edge in sorted(new_order)]
             node.edges_down = new_order + passed
+            reordered = True
     if node.syntactic_object.features and isinstance(node.syntactic_object.features, list):
         #  we assume that if features are in lists, then they are implicitly ordered.
         correct_order = node.syntactic_object.features
@@ -430,5 +569,7 @@ def verify_edge_order_for_constituent_nodes(node):
             print(new_order)
             new_order = [edge for i, edge in sorted(new_order)]
             node.edges_down = passed + new_order
+            reordered = True
+    return reordered
 
 
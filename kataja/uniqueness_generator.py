@@ -22,6 +22,31 @@ def reset_uid_counter():
     uid = 0
 
 
+def reserve_uids(count):
+    """ Reserve a block of uids for objects that are created elsewhere, e.g. in a worker
+    process. Uids given by next_available_uid continue after the block.
+    :param count: size of the block
+    :return: first uid of the block
+    """
+    global uid
+    first = uid + 1
+    uid += count
+    return first
+
+
+def set_uid_counter(value):
+    """ Next uid will be value + 1. Worker processes use this to create objects with uids from
+    the block reserved for them.
+    :param value:
+    """
+    global uid
+    uid = value
+
+
+def current_uid():
+    return uid
+
+
 def next_available_ui_key():
     global ui_key
     ui_key += 1
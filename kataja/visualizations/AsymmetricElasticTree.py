@@ -103,11 +103,19 @@ class AsymmetricElasticTree(BaseVisualization):
     """
     name = 'Asymmetric Elastic Tree'
     hide_edges_if_nodes_overlap = False
+    # repulsion is -3/d, beyond this border distance it is too small to matter
+    repulsion_range = 100
+    max_step = 10
+    # edge pulls are computed from edge magnets, there is no vectorized version of these
+    batch_physics = False
 
     def __init__(self):
         BaseVisualization.__init__(self)
         self.forest = None
 
+    def repulsion_position(self, node):
+        return node.centered_scene_position
+
     def calculate_movement(self, node):
         """ Basic dynamic force net, but instead of computing distances from center of gravity of
          each object (which assumes round nodes, compute distances starting from the boundary
@@ -122,20 +130,21 @@ class AsymmetricElasticTree(BaseVisualization):
         node_x, node_y = node.centered_scene_position  # @UnusedVariable
         node_br = node.boundingRect()
         nw2, nh2 = node_br.width() / 2.0, node_br.height() / 2.0
+        radius = math.hypot(nw2, nh2) + self.spatial_index.max_extent + self.repulsion_range
 
-        for other in self.forest.visible_nodes():
-            other_br = other.boundingRect()
+        for other in self.nearby_nodes(node_x, node_y, radius):
             if other is node:
                 continue
             elif other.locked_to_node is node or node.locked_to_node is other:
                 continue
+            other_br = other.boundingRect()
 
             other_x, other_y = other.centered_scene_position  # @UnusedVariable
 
             d, dx, dy, overlap = border_distance(node_x, node_y, nw2, nh2, other_x, other_y,
                                                  other_br.width() / 2,
                                                  other_br.height() / 2)
-            if d == 0:
+            if d == 0 or d > self.repulsion_range:
                 continue
             l = -3.0 / (d * d)
             xvel += dx * l
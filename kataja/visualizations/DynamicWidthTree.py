@@ -34,6 +34,8 @@ class DynamicWidthTree(DivideAndConquerTree):
 
     """
     name = 'Dynamic width trees'
+    batch_physics = False
+
     def __init__(self):
         super().__init__()
         self.use_gravity = False
@@ -28,6 +28,11 @@ import math
 import kataja.globals as g
 from kataja.Visualization import BaseVisualization
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class EquidistantElasticTree(BaseVisualization):
     """
@@ -36,6 +41,8 @@ class EquidistantElasticTree(BaseVisualization):
     name = 'Equidistant Elastic Tree'
     banned_node_shapes = (g.BRACKETED, g.SCOPEBOX)
     hide_edges_if_nodes_overlap = False
+    repulsion_range = 100
+    max_step = 10
 
     def __init__(self):
         BaseVisualization.__init__(self)
@@ -59,6 +66,9 @@ class EquidistantElasticTree(BaseVisualization):
         """
         super().reset_node(node)
 
+    def repulsion_position(self, node):
+        return node.centered_position
+
     def calculate_movement(self, node):
         # @time_me
         # Sum up all forces pushing this item away.
@@ -70,8 +80,7 @@ class EquidistantElasticTree(BaseVisualization):
         xvel = 0.0
         yvel = 0.0
         node_x, node_y = node.centered_position
-        vn = list(self.forest.visible_nodes())
-        for other in vn:
+        for other in self.nearby_nodes(node_x, node_y, self.repulsion_range):
             other_x, other_y = other.centered_position
             if other is node:
                 continue
@@ -80,7 +89,7 @@ class EquidistantElasticTree(BaseVisualization):
             dist_x = int(node_x - other_x)
             dist_y = int(node_y - other_y)
             dist = math.hypot(dist_x, dist_y)
-            if dist and dist < 100:
+            if dist and dist < self.repulsion_range:
                 l = (70.0 / (dist * dist)) * .5
                 xvel += dist_x * l
                 yvel += dist_y * l
@@ -147,3 +156,44 @@ class EquidistantElasticTree(BaseVisualization):
             elif yvel < -10:
                 yvel = -10
         return xvel, yvel, 0
+
+    def calculate_batch_movement(self, batch):
+        """ Vectorized calculate_movement, see BatchPhysics.
+        :param batch: BatchPhysics with packed nodes
+        :return: xvel array, yvel array
+        """
+        x, y = batch.x, batch.y
+        xvel = np.zeros(len(x))
+        yvel = np.zeros(len(x))
+        for rows, cols, dist_x, dist_y, mask in batch.pairs():
+            dist_x = np.trunc(dist_x)
+            dist_y = np.trunc(dist_y)
+            dist = np.hypot(dist_x, dist_y)
+            pushed = mask & (dist > 0) & (dist < self.repulsion_range)
+            safe_dist = np.where(pushed, dist, 1)
+            l = np.where(pushed, (70.0 / (safe_dist * safe_dist)) * .5, 0)
+            xvel[rows] += (dist_x * l).sum(axis=1)
+            yvel[rows] += (dist_y * l).sum(axis=1)
+
+        s, e = batch.edge_start, batch.edge_end
+        valid = batch.locked_to[e] != s
+        dist_x = batch.edge_start_x - batch.edge_end_x
+        dist_y = batch.edge_start_y - batch.edge_end_y
+        dist = np.hypot(dist_x, dist_y)
+        long = valid & (dist > 30)
+        short = valid & (dist < 20)
+        safe_dist = np.where(long, dist, 1)
+        pull = np.where(long, (safe_dist - 30) / safe_dist * batch.edge_pull, 0)
+        push = np.where(short, batch.edge_pull / -2, 0)
+        force = pull + push
+        # edge end is pulled towards start and start towards end
+        np.add.at(xvel, e, dist_x * force)
+        np.add.at(yvel, e, dist_y * force)
+        np.add.at(xvel, s, -dist_x * force)
+        np.add.at(yvel, s, -dist_y * force)
+
+        # pull to center (0, 0)
+        xvel += x * -0.002
+        yvel += y * -0.002
+        # x is capped only from above, as in calculate_movement
+        return np.minimum(xvel, 10), np.clip(yvel, -10, 10)
@@ -27,6 +27,11 @@ import random
 import kataja.globals as g
 from kataja.Visualization import BaseVisualization
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class SymmetricElasticTree(BaseVisualization):
     """
@@ -34,6 +39,9 @@ class SymmetricElasticTree(BaseVisualization):
     """
     name = 'Dynamic directionless net'
     hide_edges_if_nodes_overlap = False
+    # pushing force is 500 / d^2 beyond the safe zone, after 100 it is too small to matter
+    repulsion_range = 100
+    max_step = 10
 
     def __init__(self):
         BaseVisualization.__init__(self)
@@ -60,6 +68,9 @@ class SymmetricElasticTree(BaseVisualization):
         node.physics_x = True
         node.physics_y = True
 
+    def repulsion_position(self, node):
+        return node.centered_position
+
     def calculate_movement(self, node):
         # Sum up all forces pushing this item away.
         """
@@ -70,7 +81,8 @@ class SymmetricElasticTree(BaseVisualization):
         xvel = 0.0
         yvel = 0.0
         node_x, node_y = node.centered_position  # @UnusedVariable
-        for other in self.forest.visible_nodes():
+        radius = (node.width + self.spatial_index.max_extent) / 2 + self.repulsion_range
+        for other in self.nearby_nodes(node_x, node_y, radius):
             if other is node:
                 continue
             elif other.locked_to_node is node or node.locked_to_node is other:
@@ -82,6 +94,8 @@ class SymmetricElasticTree(BaseVisualization):
             if dist == 0 or dist == safe_zone:
                 continue
             required_dist = dist - safe_zone
+            if required_dist > self.repulsion_range:
+                continue
             pushing_force = 500 / (required_dist * required_dist)
             pushing_force = min(0.6, pushing_force)
 
@@ -132,3 +146,52 @@ class SymmetricElasticTree(BaseVisualization):
         if not node.physics_y:
             yvel = 0
         return xvel, yvel, 0
+
+    def calculate_batch_movement(self, batch):
+        """ Vectorized calculate_movement, see BatchPhysics.
+        :param batch: BatchPhysics with packed nodes
+        :return: xvel array, yvel array
+        """
+        x, y, w = batch.x, batch.y, batch.width
+        xvel = np.zeros(len(x))
+        yvel = np.zeros(len(x))
+        for rows, cols, dist_x, dist_y, mask in batch.pairs():
+            dist_x = np.trunc(dist_x)
+            dist_y = np.trunc(dist_y)
+            safe_zone = (w[rows][:, None] + w[cols][None, :]) / 2
+            dist = np.hypot(dist_x, dist_y)
+            required_dist = dist - safe_zone
+            pushed = mask & (dist != 0) & (dist != safe_zone) & \
+                     (required_dist <= self.repulsion_range)
+            required_dist = np.where(pushed, required_dist, 1)
+            pushing_force = np.minimum(0.6, 500 / (required_dist * required_dist))
+            pushing_force = np.where(pushed, pushing_force / np.where(pushed, dist, 1), 0)
+            xvel[rows] += (pushing_force * dist_x).sum(axis=1)
+            yvel[rows] += (pushing_force * dist_y).sum(axis=1)
+
+        s, e = batch.edge_start, batch.edge_end
+        valid = batch.locked_to[e] != s
+        safe_zone = (w[e] + w[s]) / 2
+        # pull edge start towards end
+        dist_x = np.trunc(x[s] - x[e])
+        dist_y = np.trunc(y[s] - y[e])
+        dist = np.hypot(dist_x, dist_y)
+        pulls = valid & (dist != 0)
+        dist = np.where(pulls, dist, 1)
+        pulling_force = np.where(pulls, (dist - safe_zone) * batch.edge_pull * 0.4 / dist, 0)
+        np.add.at(xvel, s, -dist_x * pulling_force)
+        np.add.at(yvel, s, -dist_y * pulling_force)
+        # pull edge end towards start
+        dist_x = x[e] - x[s]
+        dist_y = y[e] - y[s]
+        dist = np.hypot(dist_x, dist_y)
+        pulls = valid & (dist != 0)
+        dist = np.where(pulls, dist, 1)
+        pulling_force = np.where(pulls, (dist - safe_zone) * batch.edge_pull * 0.4 / dist, 0)
+        np.add.at(xvel, e, -dist_x * pulling_force)
+        np.add.at(yvel, e, -dist_y * pulling_force)
+
+        # pull to center (0, 0)
+        xvel += x * -0.003
+        yvel += y * -0.003
+        return xvel, yvel
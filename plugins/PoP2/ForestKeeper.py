@@ -25,8 +25,10 @@
 from kataja.singletons import ctrl, running_environment
 from kataja.saved.Forest import Forest
 from kataja.saved.KatajaDocument import KatajaDocument
-from PoP2.PoPDeriveK import Generate
+from kataja.uniqueness_generator import reserve_uids
+from PoP2.PoPSyntaxConnection import PoPSyntaxConnection, derive_example, UID_BLOCK_SIZE
 import ast
+import multiprocessing
 
 
 class PoPDocument(KatajaDocument):
@@ -36,6 +38,9 @@ class PoPDocument(KatajaDocument):
     # unique = True
     #
     default_treeset_file = running_environment.plugins_path + '/PoP2/POP.txt'
+    # If > 0, derivations of all examples are computed ahead in a pool of this many worker
+    # processes. Otherwise each derivation is computed when its forest is first shown.
+    derivation_processes = 0
 
     def create_forests(self, filename=None, clear=False):
         """ This will read example sentences in form used by Ginsburg / Fong parser
@@ -62,13 +67,13 @@ class PoPDocument(KatajaDocument):
 
         start = 0
         end = 10
-        ug = Generate()
+        language = None
 
         for line in treelist:
             if "Japanese" in line:
-                ug.language = "Japanese"
+                language = "Japanese"
             elif "English" in line:
-                ug.language = "English"
+                language = "English"
             sentence, lbracket, target_str = line.partition('[')
             if not (sentence and lbracket and target_str):
                 continue
@@ -84,19 +89,39 @@ class PoPDocument(KatajaDocument):
                 continue
             sentence = sentence[2:]  # remove number and the space after it
             # ast.literal_eval is safer eval, so you cannot put destructive python code to POP.txt
-            ug.gloss = sentence
             target_example = ast.literal_eval(lbracket + target_str)
-            ug.out(sentence_number, sentence, target_example)
-            forest = Forest(gloss_text=sentence)
+            # Forests are placeholders, derivation is run when they are shown, see
+            # PoPSyntaxConnection
+            syn = PoPSyntaxConnection((sentence_number, sentence, target_example, language))
+            forest = Forest(gloss_text=sentence, syntax=syn)
             self.forests.append(forest)
-            so = ug.generate_derivation(target_example, forest=forest)
-
-            #forest.derivation_steps.jump_to_derivation_step(0)
-            #forest.mirror_the_syntax([so])
-            #ug.out("MRGOperations", ug.merge_counter)
-            #ug.out("FTInheritanceOp", ug.inheritance_counter)
-            #ug.out("FTCheckOp", ug.feature_check_counter)
+        if self.derivation_processes > 0:
+            self.derive_in_background()
         self.current_index = 0
         self.forest = self.forests[0]
         # allow change tracking (undo) again
         ctrl.resume_undo()
+
+    def derive_in_background(self):
+        """ Start computing derivations of all forests in a pool of worker processes. Results
+        are picked up when forests are shown.
+
+        Workers are not forked from this process: forking a process that has Qt's threads
+        running can leave the child waiting for locks that no thread will release. They are
+        forked from a fresh forkserver process or spawned instead, and import the plugin from
+        sys.path as this process did.
+        """
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context('spawn')
+        pool = context.Pool(self.derivation_processes)
+        for forest in self.forests:
+            syn = forest.syntax
+            if isinstance(syn, PoPSyntaxConnection) and syn.example and not forest.is_parsed:
+                syn.pending_derivation = pool.apply_async(derive_example,
+                                                          (syn.example,
+                                                           reserve_uids(UID_BLOCK_SIZE)))
+        # workers exit when all derivations are done
+        pool.close()
+        self._derivation_pool = pool
@@ -170,6 +170,8 @@ class Generate:
             elif sentence_number < start:
                 continue
             sentence = sentence[2:]  # remove number and the space after it
+            if self.out_writer and self.out_writer.is_done(sentence_number, sentence):
+                continue
             target_example = eval(lbracket + target_str)
             self.out(sentence_number, sentence, target_example)
             so = self.generate_derivation(target_example)
@@ -1300,8 +1302,11 @@ class Generate:
 
 if __name__ == "__main__":
     import ProduceOutput
-    if len(sys.argv) > 1:
-        filename = int(sys.argv[1])
+    # --resume continues the run in ignore/new/, skipping the sentences it has finished
+    resume = '--resume' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--resume']
+    if args:
+        filename = int(args[0])
     else:
         filename = "./POP.txt"
     file = open(filename, 'r')
@@ -1317,7 +1322,7 @@ if __name__ == "__main__":
     print('*****')
     print('*****')
 
-    out = ProduceOutput.ProduceFile('ignore/new/')
+    out = ProduceOutput.ProduceFile('ignore/new/', resume=resume)
     a = Generate(out_writer=out)
     a.load_data(input_data, start, end)
     out.close()
@@ -37,6 +37,9 @@ class Generate:
         self.so_list = []
         self.phi_counter = 0
         self.feature_counter = 0
+        self.merge_counter = 0
+        self.inheritance_counter = 0
+        self.feature_check_counter = 0
         self.in_main = True
         self.lookforward_so = None
         self.over_counter = 0
@@ -66,10 +69,15 @@ class Generate:
             elif sentence_number < start:
                 continue
             sentence = sentence[2:]  # remove number and the space after it
+            if self.out_writer and self.out_writer.is_done(sentence_number, sentence):
+                continue
             self.gloss = sentence
             target_example = eval(lbracket + target_str)
             self.out(sentence_number, sentence, target_example)
             so = self.generate_derivation(target_example)
+            self.out("MRGOperations", self.merge_counter)
+            self.out("FTInheritanceOp", self.inheritance_counter)
+            self.out("FTCheckOp", self.feature_check_counter)
 
     def out(self, first, second, third=None):
         msg = '%s: %s' % (first, second)
@@ -109,6 +117,9 @@ class Generate:
 
         self.phi_counter = 0
         self.feature_counter = 0
+        self.merge_counter = 0
+        self.inheritance_counter = 0
+        self.feature_check_counter = 0
         self.lookforward_so = None
         self.so_list = build_synobj_lists(target_example, [])
         self.forest = forest
@@ -349,10 +360,12 @@ class Generate:
         else:
             label = '_'
         merged = Constituent(label=label, part1=part1, part2=part2)
+        self.merge_counter += 1
         return merged
 
     def remerge(self, merged, remerge):
         merged = Constituent(label=merged.label, part1=remerge, part2=merged)
+        self.merge_counter += 1
         return merged
 
     def remerge_postponed(self, merged, remerge):
@@ -364,6 +377,7 @@ class Generate:
         else:
             assert False
         merged = Constituent(label=label, part1=remerge, part2=merged)
+        self.merge_counter += 1
         return merged
 
     def transfer_check(self, merged):
@@ -860,10 +874,12 @@ class Generate:
 
                     self.out("PhiPassing", "uPhi")
                     feat_checked = True
+                    self.inheritance_counter += 1
                 if feat_checked:
                     break
         if checked_feats:
             self.out("CheckedFeatures", checked_feats)
+            self.feature_check_counter += len(checked_feats)
         return remerge, checked_feats
 
     def pass_features(self, inherit, comp, unvalued_phis):
@@ -919,6 +935,7 @@ class Generate:
                             node.features.append(item)
                         self.out("PassFs", "Pass Features " + inherit.label + " to " + other_label)
                         self.out("FeaturesPassed", unvalued_phis)
+                        self.inheritance_counter += 1
                         found = True
             else:
                 got_it = find_empty_root_leaf(node.part2)
@@ -952,8 +969,11 @@ class Generate:
 
 if __name__ == "__main__":
     import ProduceOutput
-    if len(sys.argv) > 1:
-        filename = int(sys.argv[1])
+    # --resume continues the run in ignore/new/, skipping the sentences it has finished
+    resume = '--resume' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--resume']
+    if args:
+        filename = int(args[0])
     else:
         filename = "./POP.txt"
     file = open(filename, 'r')
@@ -969,7 +989,7 @@ if __name__ == "__main__":
     print('*****')
     print('*****')
 
-    out = ProduceOutput.ProduceFile('ignore/new/')
+    out = ProduceOutput.ProduceFile('ignore/new/', resume=resume)
     a = Generate(out_writer=out)  # out)
     a.load_data(input_data, start, end)
     out.close()
@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+import multiprocessing
+import time
+
+from kataja.SavedField import SavedField
+from kataja.saved.DerivationStep import DerivationStepManager
+from kataja.singletons import ctrl, log
+from kataja.uniqueness_generator import set_uid_counter, current_uid
+from syntax.SyntaxConnection import SyntaxConnection
+from PoP2.PoPDeriveK import Generate
+
+# Objects created for one derivation in a worker process get their uids from a block of this
+# size reserved for it.
+UID_BLOCK_SIZE = 1000000
+
+
+class _StepRecorder:
+    """ Stands for a forest in a worker process: Generate only needs somewhere to push its
+    derivation steps. """
+
+    def __init__(self):
+        self.derivation_steps = DerivationStepManager()
+
+
+def derive_example(example, first_uid):
+    """ Run the derivation of one example in a worker process.
+    :param example: (sentence_number, sentence, target_example, language) -tuple
+    :param first_uid: first uid of the block reserved for objects of this derivation
+    :return: (derivation_steps, frozen_objects, error, seconds). derivation_steps and
+    frozen_objects are in the form DerivationStepManager stores them. If the derivation crashed,
+    steps until the crash are returned. If the uids ran out of their block, no steps are returned.
+    """
+    t0 = time.perf_counter()
+    ctrl.disable_undo()
+    set_uid_counter(first_uid - 1)
+    recorder = _StepRecorder()
+    error = ''
+    try:
+        run_generate(example, recorder)
+    except (Exception, SystemExit) as e:
+        # Generate exits on crashed derivations
+        error = '%s: %s' % (e.__class__.__name__, e)
+    ds = recorder.derivation_steps
+    if current_uid() >= first_uid + UID_BLOCK_SIZE:
+        return [], {}, 'derivation used more than %s uids' % UID_BLOCK_SIZE, \
+               time.perf_counter() - t0
+    return ds.derivation_steps, ds.frozen_objects, error, time.perf_counter() - t0
+
+
+def run_generate(example, forest):
+    """ Run the derivation of an example, pushing its derivation steps to forest.
+    :param example: (sentence_number, sentence, target_example, language) -tuple
+    :param forest: Forest or anything with derivation_steps
+    :return: resulting syntactic object
+    """
+    sentence_number, sentence, target_example, language = example
+    ug = Generate()
+    if language:
+        ug.language = language
+    ug.forest = forest
+    ug.gloss = sentence
+    ug.out(sentence_number, sentence, target_example)
+    return ug.generate_derivation(target_example, forest=forest)
+
+
+class PoPSyntaxConnection(SyntaxConnection):
+    """ Syntax connection for one example of POP.txt. Derivation is run when the forest is first
+    shown, unless it has already been computed in a worker process. """
+    role = "SyntaxConnection"
+    # seconds to wait for a derivation from worker process before deriving it here
+    derivation_timeout = 60
+
+    def __init__(self, example=None):
+        super().__init__()
+        self.example = example
+        if example:
+            self.sentence = example[1]
+        self.pending_derivation = None  # multiprocessing.AsyncResult of derive_example
+
+    def create_derivation(self, forest):
+        """ Use derivation computed in worker process if there is one, otherwise run the
+        derivation now. Derivation is run here also if the worker fails or doesn't finish in
+        derivation_timeout seconds.
+        :param forest:
+        :return:
+        """
+        if not self.example:
+            super().create_derivation(forest)
+            return
+        result = None
+        if self.pending_derivation:
+            # waits only for this example, if its worker is still busy
+            try:
+                result = self.pending_derivation.get(self.derivation_timeout)
+            except multiprocessing.TimeoutError:
+                log.error('Worker process took too long with example %s, deriving it here' %
+                          self.example[0])
+            except Exception as e:
+                log.error('Worker process failed with example %s, deriving it here: %s' %
+                          (self.example[0], e))
+            self.pending_derivation = None
+        ds = forest.derivation_steps
+        if result and result[0]:
+            derivation_steps, frozen_objects, error, seconds = result
+            if error:
+                log.error('Derivation of example %s failed: %s' % (self.example[0], error))
+            ds.frozen_objects = frozen_objects
+            ds.derivation_steps = derivation_steps
+        else:
+            run_generate(self.example, forest)
+        if ds.derivation_steps:
+            ds.jump_to_derivation_step(0)
+
+    # ############## #
+    #                #
+    #  Save support  #
+    #                #
+    # ############## #
+
+    example = SavedField("example")
@@ -1,68 +1,165 @@
+""" Output files of PoP derivations: OutputFull.log, Output.log, TreeViewer.txt and TexOutput.tex.
+
+Derivers push their operations to ProduceFile, which only takes a snapshot of the pushed
+values. Formatting and writing are done in a background thread, with one formatting pass that
+produces the text of all four files. Files are written through buffers.
+
+A run can be resumed: after each finished sentence the sizes of the files, the counters and the
+finished sentences are stored in Output.state. ProduceFile(prefix, resume=True) cuts the files
+back to the last finished sentence and continues from there, and derivers skip the sentences
+that are already done (see is_done). The same is used to append new sentences to an earlier run.
+Derivers take --resume on the command line for this.
+
+If the interpreter exits without close(), e.g. when a deriver calls sys.exit() after a crash,
+everything pushed is still written, but the sentence being derived is not marked finished.
+"""
+import ast
+import atexit
+import json
+import os
+import queue
 import re
+import threading
+
 from ConstituentB import Constituent
 
 Labels = {"V", "T", "C", "C*", "v", "v*", "Adj", "P", "P*", "D", "D*", "Perf", "N", 'Prt'}
 
+file_names = ['OutputFull.log', 'Output.log', 'TreeViewer.txt', 'TexOutput.tex']
+state_file_name = 'Output.state'
+tex_input_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TexInput.tex')
+tex_end = "\\end{itemize}\n\n\n\n\\end{document}"
+buffer_size = 1 << 16
+
+_tex_replacements = {"_": "\\_", "'": "", "~": "$\\sim$"}
+_tex_re = re.compile("[_'~]")
+_tilde_re = re.compile("~")
+_strikethrough_re = re.compile("_([^ ]+)")
+_numbers_re = re.compile("[0-9]")
+
+_tex_preamble = None
+
 
 def texify(line):
-    temp1 = re.sub("_", "\_", line)
-    temp4 = re.sub("'", "", temp1)
-    temp5 = re.sub("\~", "$\sim$", temp4)
-    line = temp5
-    return line
+    return _tex_re.sub(lambda match: _tex_replacements[match.group()], line)
 
 
 def strikethrough(line):
-    ctr = 0
-    newline = str()
-    while ctr < len(line):
-        current = line[ctr]
-        if current == "_":
-            if line[ctr + 1] != " ":
-                newline += "\st{"
-                cont = True
-                ctr += 1
-                while cont:
-                    chunkCur = line[ctr]
-                    if chunkCur == " ":
-                        newline += "}"
-                        newline += chunkCur
-                        cont = False
-                    else:
-                        newline += chunkCur
-                    ctr += 1
-            else:
-                newline += current
-                ctr += 1
-        else:
-            newline += current
-            ctr += 1
-    return newline
+    """ Words starting with '_' are put into \\st{} without the '_' """
+    return _strikethrough_re.sub(lambda match: "\\st{%s}" % match.group(1), line)
 
 
 def remove_numbers(line):
-    return re.sub(r'[0-9]', ' ', line)
+    return _numbers_re.sub(' ', line)
+
+
+def tex_preamble():
+    """ Beginning of TexInput.tex until \\begin{document}, read once.
+    :return: str
+    """
+    global _tex_preamble
+    if _tex_preamble is None:
+        lines = []
+        with open(tex_input_file, 'r') as tex_in:
+            for line in tex_in:
+                lines.append(line)
+                if "begin{document" in line:
+                    break
+        _tex_preamble = ''.join(lines)
+    return _tex_preamble
+
+
+def label_prefix(description):
+    if "Head" in description:
+        return "Label from Head: "
+    elif "Move" in description:
+        return "Label via movement: "
+    elif "SharedFeats" in description:
+        return "Label via shared features: "
+    elif "Strengthened" in description:
+        return "Label (Checked Phi): "
+    elif "None" in description:
+        return "Unlabeled: "
+    return ""
+
+
+def dephase_prefix(description):
+    if " v" in description:
+        return "Root movement (dephase): "
+    elif "DeleteC" in description:
+        return "Delete C (dephase): "
+    return ""
+
+
+# Descriptions are recognized by the first of these that they contain. Operations are checked
+# from the first list, and independently of that, stack operations from the second list.
+operations = ["Label", "merge", "Dephase", "MRGOperations", "FTInheritanceOp", "FTCheckOp",
+              "Transfer", "UnlabeledM", "PassFs", "FeaturesPassed", "CheckedFeatures",
+              "LbAfterMove", "LbM", "PhiPassing"]
+stack_operations = ["Push", "ClearStack", "Unification", "SubStream", "MainStream", "Stack",
+                    "Crash"]
+
+
+def find_kind(description, kinds):
+    for kind in kinds:
+        if kind in description:
+            return kind
+    return None
 
 
 class ProduceFile:
 
-    def __init__(self, path_prefix=''):
+    def __init__(self, path_prefix='', resume=False, threaded=True):
+        """
+        :param path_prefix: prefix for the paths of output files, e.g. a folder
+        :param resume: continue the run whose state is in path_prefix + 'Output.state'
+        :param threaded: format and write in a background thread
+        """
         self.path_prefix = path_prefix
-        self.F1 = open(self.path_prefix + "OutputFull.log", 'w')
-        self.F2 = open(self.path_prefix + "Output.log", 'w')
-        self.F3 = open(self.path_prefix + "TreeViewer.txt", 'w')
-        self.F4 = open(self.path_prefix + "TexOutput.tex", 'w')
+        self.files = None  # opened when the first entry is written
         self.f1_c = 0
         self.f2_c = 0
-        tex_in = open("TexInput.tex", 'r')
-        lines = tex_in.readlines()
-        for line in lines:
-            self.F4.write(line)
-            if "begin{document" in line:
-                break
         self.start_itemize = True
+        self.done = set()  # (sentence number, sentence) -pairs that are finished
+        self.sizes = None  # sizes of files after the last finished sentence
+        self.current_sentence = None
+        self.error = None
+        self.closed = False
+        if resume and os.path.exists(self.path(state_file_name)):
+            with open(self.path(state_file_name)) as f:
+                state = json.load(f)
+            self.f1_c = state['f1_c']
+            self.f2_c = state['f2_c']
+            self.start_itemize = state['start_itemize']
+            self.done = {(number, sentence) for number, sentence in state['done']}
+            self.sizes = state['sizes']
+        self._queue = None
+        self._thread = None
+        if threaded:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+        # derivers call sys.exit() after a crash: write what was pushed before that
+        atexit.register(self._close_at_exit)
+
+    def path(self, file_name):
+        return self.path_prefix + file_name
+
+    def is_done(self, sentence_number, sentence):
+        """ Sentence was finished in the run that is resumed and doesn't need to be derived.
+        :param sentence_number:
+        :param sentence:
+        :return: bool
+        """
+        return (sentence_number, sentence) in self.done
 
     def push(self, x, y, z):
+        """ Take a snapshot of pushed values: constituents may change after this, so they are
+        turned into strings here. The rest is done by the writer.
+        :param x: sentence number or description of operation
+        :param y: sentence or data of operation
+        :param z: numeration for new sentence, None for operations
+        """
         if isinstance(x, Constituent):
             fx = x.featureless_str()
         else:
@@ -75,253 +172,232 @@ class ProduceFile:
             fz = z.featureless_str()
         else:
             fz = z
-        self.print_readable_output(fx, fy, fz)
-        self.print_full_output(x, y, z)
-        self.print_treeviewer_file(fx, fy, fz)
-        self.print_tex_file(fx, fy, fz)
-
-    def close(self):
-        if self.F1:
-            self.F1.close()
-        if self.F2:
-            self.F2.close()
-        if self.F3:
-            self.F3.close()
-        if self.F4:
-            self.F4.write("\\end{itemize}\n\n")
-            self.F4.write("\n\n\\end{document}")
-            self.F4.close()
-
-    def print_treeviewer_file(self, x, y, z):
-        if z:
-            num, sent, numeration = x, y, z
-            self.F3.write("\n%s %s\n" % (num, sent))
+        entry = (bool(z), x, str(fx), str(fy), str(fz), str(x), str(y), str(z))
+        if self._queue:
+            self._queue.put(entry)
         else:
-            description, data_orig = x, y
-            data2 = str(data_orig)
-            if "Label" in description:
-                self.F3.write("%s\n" % data2)
-            elif "Dephase" in description:
-                self.F3.write("%s\n" % data2)
-            elif "UnlabeledM" in description:
-                self.F3.write("%s\n" % data2)
-            elif "LbAfterMove" in description:
-                self.F3.write("%s labels\n" % data2)
-            elif "LbM" in description:
-                self.F3.write("%s\n" % data2)
-
-    def print_full_output(self, x, y, z):
-        if z:
-            # num, sent, numeration = x, y, z
-            self.F1.write("\n------------------------------------\n%s %s\n%s\n\n\n" % (x, y, z))
+            self._write(entry)
+
+    def close(self, finished=True):
+        """ Wait until everything pushed is written and end the files. Closing again does
+        nothing.
+        :param finished: mark the last sentence finished. If not, resuming derives it again.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self._close_at_exit)
+        if self._queue:
+            self._queue.put(finished)
+            self._thread.join()
+            self._queue = None
         else:
-            description, data2 = x, y
-            data2 = str(data2)
-            self.f1_write("%s\n%s" % (description, data2))
-            if "Label" in description:
-                descript = ""
-                if "Head" in description:
-                    descript = "Label from Head: " + data2
-                elif "Move" in description:
-                    descript = "Label via movement: " + data2
-                elif "SharedFeats" in description:
-                    descript = "Label via shared features: " + data2
-                elif "Strengthened" in description:
-                    descript = "Label (Checked Phi): " + data2
-                elif "None" in description:
-                    descript = "Unlabeled: " + data2
-                self.f1_write(descript)
-            elif "Unification" in description:
-                self.f1_write("Unify Features: %s" % data2)
-
-    def f1_write(self, s):
-        self.f1_c += 1
-        self.F1.write("%s. %s\n\n" % (self.f1_c, s))
-
-    def print_readable_output(self, x, y, z):
-
-        if z:
-            self.F2.write("\n------------------------------------\n%s %s\n%s\n\n\n" % (x, y, z))
+            self._finish(finished)
+        if self.error:
+            raise self.error
+
+    def _close_at_exit(self):
+        """ Interpreter is exiting without close(), e.g. after a crash. Sentence that was being
+        derived is written but not marked finished.
+        """
+        self.close(finished=False)
+
+    def _write_loop(self):
+        while True:
+            entry = self._queue.get()
+            is_end = isinstance(entry, bool)
+            if self.error:
+                if is_end:
+                    return
+                continue
+            try:
+                if is_end:
+                    self._finish(entry)
+                    return
+                self._write(entry)
+            except Exception as e:
+                self.error = e
+
+    def _open(self):
+        if self.sizes:
+            for file_name in file_names:
+                path = self.path(file_name)
+                if os.path.exists(path):
+                    os.truncate(path, self.sizes[file_name])
+            self.files = [open(self.path(file_name), 'a', buffering=buffer_size) for file_name in
+                          file_names]
         else:
-            description, data_orig = x, y
-            data2 = str(data_orig)
-            if "Label" in description:
-                if "Head" in description:
-                    s = "Label from Head: "
-                elif "Move" in description:
-                    s = "Label via movement: "
-                elif "SharedFeats" in description:
-                    s = "Label via shared features: "
-                elif "Strengthened" in description:
-                    s = "Label (Checked Phi): "
-                elif "None" in description:
-                    s = "Unlabeled: "
-                self.f2_write(s + data2)
-            elif "merge" in description:
-                self.f2_write(data2)
-            elif "Dephase" in description:
-                if " v" in description:
-                    s = "Root movement (dephase): "
-                elif "DeleteC" in description:
-                    s = "Delete C (dephase): "
-                self.f2_write(s + data2)
-            elif "Transfer" in description:
-                self.f2_write("Transfer: %s" % data2)
-            elif "UnlabeledM" in description:
-                self.f2_write("Unlabeled merge: %s" % data2)
-            elif "PassFs" in description:
-                self.f2_write(data2)
-            elif "FeaturesPassed" in description:
-                self.f2_write("Passed Features: %s" % data2)
-            elif "CheckedFeatures" in description:
-                self.f2_write("Checked Features: %s" % data2)
-            elif "LbAfterMove" in description:
-                self.f2_write("%s labels" % data2)
-            elif "LbM" in description:
-                self.f2_write("Labeled After Move: %s" % data2)
-            elif "PhiPassing" in description:
-                self.f2_write("Phi Passed from N to D")
-            if "Push" in description:
-                self.f2_write("Push: %s" % data2)
-            elif "ClearStack" in description:
-                stack = eval(data_orig)
-                stack.reverse()
-                self.f2_write("Clear Stack:")
-                stack_ctr = 1
-                for elem in stack:
-                    self.f2_write("%s POP: %s" % (stack_ctr, elem))
-                    stack_ctr += 1
-            elif "Unification" in description:
-                self.f2_write("Unify Features: %s" % data_orig)
-            elif "SubStream" in description:
-                self.f2_write("Substream")
-            elif "MainStream" in description:
-                self.f2_write("Main Stream")
-            elif "Stack" in description:
-                stack = eval(data_orig)
-                stack.reverse()
-                if "Transfer" in description:
-                    self.f2_write("Stack after Transfer:")
-                else:
-                    self.f2_write("Stack:")
-                stack_ctr = 1
-                for elem in stack:
-                    self.f2_write("%s: %s" % (stack_ctr, elem))
-
-    def f2_write(self, s):
-        self.f2_c += 1
-        self.F2.write("%s. %s\n\n" % (self.f2_c, s))
-
-    def print_tex_file(self, x, y, z):
-        descript = ""
-        if z:
+            self.files = [open(self.path(file_name), 'w', buffering=buffer_size) for file_name in
+                          file_names]
+            self.files[3].write(tex_preamble())
+
+    def _checkpoint(self):
+        """ Mark current sentence finished and store the state after it.
+        """
+        if self.current_sentence:
+            self.done.add(self.current_sentence)
+        for f in self.files:
+            f.flush()
+        self.sizes = {file_name: f.tell() for file_name, f in zip(file_names, self.files)}
+        state = {'f1_c': self.f1_c, 'f2_c': self.f2_c, 'start_itemize': self.start_itemize,
+                 'done': sorted(self.done), 'sizes': self.sizes}
+        tmp_path = self.path(state_file_name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path(state_file_name))
+
+    def _finish(self, finished=True):
+        if self.files is None:
+            self._open()
+        if finished:
+            self._checkpoint()
+            self.current_sentence = None
+        self.files[3].write(tex_end)
+        for f in self.files:
+            f.close()
+
+    def _write(self, entry):
+        if self.files is None:
+            self._open()
+        if entry[0]:
+            if self.current_sentence:
+                self._checkpoint()
+            number, sentence = entry[1], entry[3]
+            self.current_sentence = (number, sentence)
+        full, readable, treeviewer, tex = self.format_entry(entry)
+        self.files[0].write(full)
+        self.files[1].write(readable)
+        self.files[2].write(treeviewer)
+        self.files[3].write(tex)
+
+    def format_entry(self, entry):
+        """ Texts of all output files for one pushed entry
+        :param entry: snapshot taken by push
+        :return: (full output, readable output, treeviewer output, tex output)
+        """
+        is_sentence, x, fx, fy, fz, sx, sy, sz = entry
+        if is_sentence:
+            full = "\n------------------------------------\n%s %s\n%s\n\n\n" % (sx, sy, sz)
+            readable = "\n------------------------------------\n%s %s\n%s\n\n\n" % (fx, fy, fz)
+            treeviewer = "\n%s %s\n" % (fx, fy)
             if self.start_itemize:
                 self.start_itemize = False
+                tex = ""
             else:
-                self.F4.write("\\end{itemize}\n\n")
-            num, sent, numeration = x, y, z
-            self.F4.write("\\begin{example}\n %s\n%s\n\\end{example}\n\n\\begin{itemize}\n" % (
-                sent, texify(str(numeration))))
-        else:
-            description, data_orig = x, y
-            data2 = str(data_orig)
-            data2 = re.sub("\~", "$\sim$", data2)
-
-            if "Label" in description:
-                if "Head" in description:
-                    descript = "Label from Head: " + data2
-                elif "Move" in description:
-                    descript = "Label via movement: " + data2
-                elif "SharedFeats" in description:
-                    descript = "Label via shared features: " + data2
-                elif "Strengthened" in description:
-                    descript = "Label (Checked Phi): " + data2
-                elif "None" in description:
-                    descript = "Unlabeled: " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "merge" in description:
-                self.F4.write("\\item %s\n\n" % texify(data_orig))
-            elif "Dephase" in description:
-                if " v" in description:
-                    descript = "Root movement (dephase): " + data2
-                elif "DeleteC" in description:
-                    descript = "Delete C (dephase): " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "MRGOperations" in description:
-                descript = "Number of merge Operations: " + data2
-                self.F4.write("%s\n\n" % descript)
-            elif "FTInheritanceOp" in description:
-                descript = "Number of Feature Inheritance Operations: " + data2
-                self.F4.write("%s\n\n" % descript)
-            elif "FTCheckOp" in description:
-                descript = "Number of Feature Checking Operations: " + data2
-                self.F4.write("%s\n\n" % descript)
-            elif "Transfer" in description:
-                descript = "Transfer: " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "UnlabeledM" in description:
-                descript = "Unlabeled merge: " + data2
-                descript = strikethrough(descript)
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "PassFs" in description:
-                descript = data_orig
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "FeaturesPassed" in description:
-                descript = "Passed Features: " + data2
-                descript = remove_numbers(descript)
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "CheckedFeatures" in description:
-                descript = "Checked Features: " + data2
-                descript = remove_numbers(descript)
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "LbAfterMove" in description:
-                descript = data2 + " labels"
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "LbM" in description:
-                descript = "Labeled After Move: " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "PhiPassing" in description:
-                descript = "Phi Passed from N to D"
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            if "Push" in description:
-                descript = "Push: " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "ClearStack" in description:
-                stack = eval(data_orig)
-                stack.reverse()
-                descript = "Clear Stack: "
-                self.F4.write("\\item %s\n\n" % descript)
-                stack_ctr = 1
-                for elem in stack:
-                    print("Elem", elem)
-                    print_elem = str(stack_ctr) + " POP: " + elem
-                    tex_elem = texify(print_elem)
-                    self.F4.write("\\item %s\n\n" % tex_elem)
-                    stack_ctr += 1
-            elif "Unification" in description:
-                descript = "Unify Features: " + data2
-                self.F4.write("\\item %s\n\n" % texify(descript))
-            elif "SubStream" in description:
-                self.F4.write("\\item Substream\n\n")
-            elif "MainStream" in description:
-                self.F4.write("\\item Main Stream\n\n")
-            elif "Stack" in description:
-                stack = eval(data_orig)
-                stack.reverse()
-                if "Transfer" in description:
-                    descript = "Stack after Transfer: "
-                else:
-                    descript = "Stack: "
-                self.F4.write("\\item %s\n\n" % descript)
-                stack_ctr = 1
-                for elem in stack:
-                    print_elem = str(stack_ctr) + ": " + elem
-                    self.F4.write("\\item %s\n\n" % texify(print_elem))
-                    stack_ctr += 1
-            elif "Crash" in description:
-                if "Unchecked Feature" in description:
-                    descript = "Crash (Unchecked Feature): " + data2
-                    self.F4.write("\\item %s\n\n" % texify(descript))
-                elif "Unlabeled" in description:
-                    descript = "Crash (Unlabeled): " + data2
-                    self.F4.write("\\item %s\n\n" % texify(descript))
+                tex = "\\end{itemize}\n\n"
+            tex += "\\begin{example}\n %s\n%s\n\\end{example}\n\n\\begin{itemize}\n" % (
+                fy, texify(fz))
+            return full, readable, treeviewer, tex
+
+        description = fx
+        data = fy
+        kind = find_kind(description, operations)
+        stack_kind = find_kind(description, stack_operations)
+        full = []
+        readable = []
+        treeviewer = ""
+        tex = []
+
+        def f1_write(s):
+            self.f1_c += 1
+            full.append("%s. %s\n\n" % (self.f1_c, s))
+
+        def f2_write(s):
+            self.f2_c += 1
+            readable.append("%s. %s\n\n" % (self.f2_c, s))
+
+        def tex_item(s):
+            tex.append("\\item %s\n\n" % texify(s))
+
+        # full output
+        f1_write("%s\n%s" % (sx, sy))
+        if "Label" in description:
+            f1_write(label_prefix(description) + sy if label_prefix(description) else "")
+        elif "Unification" in description:
+            f1_write("Unify Features: %s" % sy)
+
+        # treeviewer
+        if kind in ("Label", "Dephase", "UnlabeledM", "LbM"):
+            treeviewer = "%s\n" % data
+        elif kind == "LbAfterMove":
+            treeviewer = "%s labels\n" % data
+
+        # readable output and tex
+        tex_data = _tilde_re.sub("$\\\\sim$", data)
+        if kind == "Label":
+            prefix = label_prefix(description)
+            f2_write(prefix + data)
+            tex_item(prefix + tex_data if prefix else "")
+        elif kind == "merge":
+            f2_write(data)
+            tex_item(data)
+        elif kind == "Dephase":
+            prefix = dephase_prefix(description)
+            f2_write(prefix + data)
+            tex_item(prefix + tex_data if prefix else "")
+        elif kind == "MRGOperations":
+            tex.append("Number of merge Operations: %s\n\n" % tex_data)
+        elif kind == "FTInheritanceOp":
+            tex.append("Number of Feature Inheritance Operations: %s\n\n" % tex_data)
+        elif kind == "FTCheckOp":
+            tex.append("Number of Feature Checking Operations: %s\n\n" % tex_data)
+        elif kind == "Transfer":
+            f2_write("Transfer: %s" % data)
+            tex_item("Transfer: " + tex_data)
+        elif kind == "UnlabeledM":
+            f2_write("Unlabeled merge: %s" % data)
+            tex_item(strikethrough("Unlabeled merge: " + tex_data))
+        elif kind == "PassFs":
+            f2_write(data)
+            tex_item(data)
+        elif kind == "FeaturesPassed":
+            f2_write("Passed Features: %s" % data)
+            tex_item(remove_numbers("Passed Features: " + tex_data))
+        elif kind == "CheckedFeatures":
+            f2_write("Checked Features: %s" % data)
+            tex_item(remove_numbers("Checked Features: " + tex_data))
+        elif kind == "LbAfterMove":
+            f2_write("%s labels" % data)
+            tex_item(tex_data + " labels")
+        elif kind == "LbM":
+            f2_write("Labeled After Move: %s" % data)
+            tex_item("Labeled After Move: " + tex_data)
+        elif kind == "PhiPassing":
+            f2_write("Phi Passed from N to D")
+            tex_item("Phi Passed from N to D")
+
+        if stack_kind == "Push":
+            f2_write("Push: %s" % data)
+            tex_item("Push: " + tex_data)
+        elif stack_kind == "ClearStack":
+            stack = ast.literal_eval(data)
+            stack.reverse()
+            f2_write("Clear Stack:")
+            tex.append("\\item Clear Stack: \n\n")
+            for stack_ctr, elem in enumerate(stack, start=1):
+                f2_write("%s POP: %s" % (stack_ctr, elem))
+                tex_item("%s POP: %s" % (stack_ctr, elem))
+        elif stack_kind == "Unification":
+            f2_write("Unify Features: %s" % data)
+            tex_item("Unify Features: " + tex_data)
+        elif stack_kind == "SubStream":
+            f2_write("Substream")
+            tex.append("\\item Substream\n\n")
+        elif stack_kind == "MainStream":
+            f2_write("Main Stream")
+            tex.append("\\item Main Stream\n\n")
+        elif stack_kind == "Stack":
+            stack = ast.literal_eval(data)
+            stack.reverse()
+            title = "Stack after Transfer:" if "Transfer" in description else "Stack:"
+            f2_write(title)
+            tex.append("\\item %s \n\n" % title)
+            for stack_ctr, elem in enumerate(stack, start=1):
+                f2_write("%s: %s" % (stack_ctr, elem))
+                tex_item("%s: %s" % (stack_ctr, elem))
+        elif stack_kind == "Crash":
+            if "Unchecked Feature" in description:
+                tex_item("Crash (Unchecked Feature): " + tex_data)
+            elif "Unlabeled" in description:
+                tex_item("Crash (Unlabeled): " + tex_data)
+        return ''.join(full), ''.join(readable), treeviewer, ''.join(tex)
@@ -1,4 +1,5 @@
 
+import ast
 import sys
 #sys.setrecursionlimit(10000)
 
@@ -8,11 +9,11 @@ new = open('deriveG.log', 'r')
 
 originals = []
 for line in original.readlines():
-    originals.append(eval(line))
+    originals.append(ast.literal_eval(line))
 
 news = []
 for line in new.readlines():
-    news.append(eval(line))
+    news.append(ast.literal_eval(line))
 
 def norm_feature(feat):
     """ Remove number from the end """
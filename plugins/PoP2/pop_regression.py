@@ -0,0 +1,266 @@
+""" Regression and benchmark runner for the PoP derivers (PoPDeriveG ... PoPDeriveL).
+
+Runs each deriver headlessly over example files, records the merge, feature inheritance and
+feature check counters and wall time of each example and compares the resulting structures
+against a stored baseline. Structures are normalized as in compare_logs.py: numbering of
+features is removed, feature sets are sorted and Copy -features are ignored. Baseline is a JSON
+file, so reading it never evaluates code. Exit status is 1 if results differ from baseline.
+Examples that have become slower are reported, but they affect exit status only with
+--fail-slower, as times depend on the machine.
+
+pop_baseline.json has the results of the derivers before they were optimized, with counters added
+to PoPDeriveK. Times in it are from the machine where it was made.
+
+Run in this folder:
+python3 pop_regression.py --save            # store current results as baseline
+python3 pop_regression.py                   # compare current results to baseline
+python3 pop_regression.py -d K L -c POP2.txt --reference K   # compare L to stored K
+python3 pop_regression.py --fail-slower     # baseline was saved on this machine, check times too
+"""
+import argparse
+import ast
+import contextlib
+import importlib
+import json
+import os
+import sys
+import time
+
+derivers = ['PoPDeriveG', 'PoPDeriveI', 'PoPDeriveJ', 'PoPDeriveK', 'PoPDeriveL']
+corpora = ['POP.txt', 'POP2.txt']
+counters = ['merge_counter', 'inheritance_counter', 'feature_check_counter']
+default_baseline = 'pop_baseline.json'
+# example is reported as slower if it takes this much longer than in baseline, and at least
+# min_slowdown seconds longer
+slowdown_ratio = 1.5
+min_slowdown = 0.01
+
+
+def read_examples(filename):
+    """ Read examples in the form 'number sentence [target list]', other lines are skipped.
+    :param filename:
+    :return: list of (number, sentence, target) -tuples
+    """
+    examples = []
+    with open(filename) as f:
+        for line in f:
+            sentence, lbracket, target_str = line.partition('[')
+            sentence = sentence.strip()
+            if not (sentence and lbracket and target_str):
+                continue
+            number, space, sentence = sentence.partition(' ')
+            if not number.isdigit():
+                continue
+            try:
+                target = ast.literal_eval(lbracket + target_str)
+            except (SyntaxError, ValueError):
+                continue
+            examples.append((int(number), sentence.strip(), target))
+    return examples
+
+
+def norm_feature(feat):
+    """ Remove number from the end """
+    return feat.rstrip('0123456789:')
+
+
+def norm_so(so):
+    if any(isinstance(x, list) for x in so):
+        # not a feature set
+        return [norm_feature(item) if isinstance(item, str) else norm_so(item) for item in so]
+    return sorted({norm_feature(item) for item in so})
+
+
+def featureless(so):
+    if isinstance(so, str):
+        return so
+    if len(so) == 2 and isinstance(so[0], str) and isinstance(so[1], list):
+        return so[0]
+    return [featureless(o) for o in so]
+
+
+def copyless(so):
+    if isinstance(so, str):
+        return so
+    if len(so) == 2 and isinstance(so[0], str) and isinstance(so[1], list):
+        return [so[0], [f for f in so[1] if f != 'Copy']]
+    return [copyless(o) for o in so]
+
+
+def normalize(so):
+    return copyless(norm_so(so))
+
+
+def run_example(module, target):
+    """ Derive one example with a fresh Generate.
+    :param module: deriver module
+    :param target: target example list
+    :return: dict with status, seconds, counters and normalized structure
+    """
+    ug = module.Generate()
+    ug.dump_to_file = lambda synobj: None  # don't write deriveG.log
+    result = {}
+    t0 = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+            so = ug.generate_derivation(target)
+        result['status'] = 'ok'
+        result['structure'] = normalize(so.model10_string())
+    except SystemExit:
+        # derivers exit when derivation crashes
+        result['status'] = 'crash'
+    except Exception as e:
+        result['status'] = 'error: %s: %s' % (e.__class__.__name__, e)
+    result['seconds'] = time.perf_counter() - t0
+    for counter in counters:
+        if hasattr(ug, counter):
+            result[counter] = getattr(ug, counter)
+    return result
+
+
+def run_deriver(name, corpus, rounds=1):
+    """ Derive all examples of a corpus.
+    :param name: module name of the deriver
+    :param corpus: example file
+    :param rounds: examples are derived this many times, the fastest time is kept
+    :return: dict of example number (as str, like in JSON) -> result dict, or a dict with
+    'error' and 'detail' if the deriver can't be imported. Only 'error' is compared, 'detail'
+    has e.g. line numbers that change with unrelated edits.
+    """
+    try:
+        module = importlib.import_module(name)
+    except Exception as e:
+        return {'error': 'import failed: %s' % e.__class__.__name__, 'detail': str(e)}
+    results = {}
+    for number, sentence, target in read_examples(corpus):
+        best = None
+        for i in range(rounds):
+            result = run_example(module, target)
+            if best is None or result['seconds'] < best['seconds']:
+                best = result
+        best['sentence'] = sentence
+        results[str(number)] = best
+    return results
+
+
+def compare(old, new):
+    """ Compare results of one deriver and corpus to baseline.
+    :param old: results from baseline
+    :param new: current results
+    :return: list of report lines, empty if nothing changed. Times are not compared here, see
+    slowdowns.
+    """
+    if 'error' in old or 'error' in new:
+        if old.get('error') != new.get('error'):
+            return ['was: %s, now: %s' % (old.get('error', 'ok'), new.get('error', 'ok'))]
+        return []
+    lines = []
+    for number, result in new.items():
+        base = old.get(number)
+        if not base:
+            lines.append('%s: new example' % number)
+            continue
+        if base['status'] != result['status']:
+            lines.append('%s: status was %s, now %s' % (number, base['status'],
+                                                        result['status']))
+        elif result['status'] == 'ok' and base['structure'] != result['structure']:
+            if featureless(base['structure']) != featureless(result['structure']):
+                lines.append('%s: structural mismatch' % number)
+            else:
+                lines.append('%s: feature mismatch' % number)
+            lines.append('    baseline: %s' % base['structure'])
+            lines.append('    now:      %s' % result['structure'])
+        for counter in counters:
+            if counter in base and base[counter] != result.get(counter):
+                lines.append('%s: %s was %s, now %s' % (number, counter, base.get(counter),
+                                                        result.get(counter)))
+    for number in old:
+        if number not in new:
+            lines.append('%s: missing' % number)
+    return lines
+
+
+def slowdowns(old, new):
+    """ Find examples that take clearly longer than in baseline.
+    :param old: results from baseline
+    :param new: current results
+    :return: list of report lines
+    """
+    if 'error' in old or 'error' in new:
+        return []
+    lines = []
+    for number, result in new.items():
+        base = old.get(number)
+        if base and result['seconds'] > base['seconds'] * slowdown_ratio and \
+                result['seconds'] - base['seconds'] > min_slowdown:
+            lines.append('%s: slower, %.3f s -> %.3f s' % (number, base['seconds'],
+                                                          result['seconds']))
+    return lines
+
+
+def summary(results):
+    if 'error' in results:
+        return '%s: %s' % (results['error'], results['detail'])
+    ok = sum(1 for r in results.values() if r['status'] == 'ok')
+    seconds = sum(r['seconds'] for r in results.values())
+    line = '%s/%s derived in %.3f s' % (ok, len(results), seconds)
+    for counter in counters:
+        values = [r[counter] for r in results.values() if counter in r]
+        if values:
+            line += ', %s %s' % (counter[:-len('_counter')].replace('_', ' '), sum(values))
+    return line
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Run PoP derivers and compare them to baseline.')
+    ap.add_argument('-d', '--derivers', nargs='+', default=derivers,
+                    help='deriver modules, e.g. PoPDeriveK or just K')
+    ap.add_argument('-c', '--corpora', nargs='+', default=corpora, help='example files')
+    ap.add_argument('-b', '--baseline', default=default_baseline, help='baseline file')
+    ap.add_argument('-r', '--rounds', type=int, default=3,
+                    help='derive each example this many times and keep the fastest time')
+    ap.add_argument('--reference', default=None,
+                    help='compare all derivers to baseline of this deriver')
+    ap.add_argument('--save', action='store_true', help='store results as baseline')
+    ap.add_argument('--fail-slower', action='store_true',
+                    help='count slower examples as changes, use if baseline is from this machine')
+    args = ap.parse_args(argv)
+
+    def module_name(name):
+        return name if name.startswith('PoPDerive') else 'PoPDerive' + name
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {}
+    changed = 0
+    for deriver in [module_name(d) for d in args.derivers]:
+        results[deriver] = {}
+        for corpus in args.corpora:
+            current = run_deriver(deriver, corpus, rounds=args.rounds)
+            results[deriver][corpus] = current
+            print('%s %s: %s' % (deriver, corpus, summary(current)))
+            ref = module_name(args.reference) if args.reference else deriver
+            old = baseline.get(ref, {}).get(corpus)
+            if old is None:
+                if not args.save:
+                    print('    no baseline')
+                continue
+            lines = compare(old, current)
+            slower = slowdowns(old, current)
+            if lines or (slower and args.fail_slower):
+                changed += 1
+            for line in lines + slower:
+                print('    ' + line)
+    if args.save:
+        for deriver, by_corpus in results.items():
+            baseline.setdefault(deriver, {}).update(by_corpus)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+    return changed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
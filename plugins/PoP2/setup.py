@@ -3,6 +3,7 @@ from PoP2.ConstituentB import Constituent
 from PoP2.FeatureB import Feature
 from PoP2.PoPDeriveK import Generate
 from PoP2.ForestKeeper import PoPDocument
+from PoP2.PoPSyntaxConnection import PoPSyntaxConnection
 
 # see ExamplePlugin/readme.txt and ExamplePlugin/plugin.json
 
@@ -13,7 +14,7 @@ from PoP2.ForestKeeper import PoPDocument
 # them here, you have to put class definitions *before* the plugin_parts -line.
 
 # plugin_parts = [PythonClass,...]
-plugin_parts = [Constituent, Feature, Generate, PoPDocument]
+plugin_parts = [Constituent, Feature, Generate, PoPDocument, PoPSyntaxConnection]
 
 # When a plugin is enabled it will try to rebuild the instances of all replaced classes. It is a
 # risky process, and all replaced classes can have their own _on_rebuild and _on_teardown methods
@@ -0,0 +1,186 @@
+""" Batch parsing of sentence files. Each sentence is parsed independently, so sentences are
+divided between a pool of worker processes. Workers compile the grammar once when they start,
+parse quietly (no tracing, no checkpoints) and send back plain data, which is turned back into
+derivation nodes in the receiving process. parse_corpus gives results in the order they are
+finished, start_parsing gives a pending result for each sentence without waiting for any of them.
+
+Run in this folder:
+python3 BatchParser.py sentences.txt [-g mg0.txt] [-j processes] [-t time_limit] [-o output]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+try:
+    from mgtdbpE.Parser import Parser, DerivationNode, Feature, compile_grammar, TRACE_OFF
+    from mgtdbpE.Constituent import Constituent
+    from mgtdbpE.OutputTrees import pptree
+except ImportError:
+    from Parser import Parser, DerivationNode, Feature, compile_grammar, TRACE_OFF
+    from Constituent import Constituent
+    from OutputTrees import pptree
+
+default_grammar_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mg0.txt')
+
+
+class ParseResult(namedtuple('ParseResult', ('index', 'sentence', 'success', 'timed_out',
+                                             'error', 'seconds', 'steps', 'dnodes'))):
+    """ Result of parsing one sentence. dnodes are (path, label, features, terminal) -tuples
+    where features are (name, value) -pairs, so that results can be sent between processes
+    regardless of which Feature class the parser uses. """
+
+    @property
+    def status(self):
+        if self.error:
+            return 'error'
+        elif self.timed_out:
+            return 'timed out'
+        elif self.success:
+            return 'parse found'
+        return 'no parse found'
+
+    def derivation_nodes(self):
+        """ :return: list of DerivationNodes of the last derivation """
+        return [DerivationNode(path, label, [Feature(name, value) for name, value in features],
+                               terminal=terminal)
+                for path, label, features, terminal in self.dnodes]
+
+
+# Set for each worker process by _init_worker
+_worker_lexicon = None
+_worker_options = None
+
+
+def _init_worker(grammar_file, options):
+    global _worker_lexicon, _worker_options
+    _worker_lexicon = compile_grammar(grammar_file)
+    _worker_options = options
+
+
+def _parse_job(job):
+    index, sentence = job
+    options = dict(_worker_options)
+    start = options.pop('start')
+    t0 = time.perf_counter()
+    parser = Parser(_worker_lexicon, trace_level=TRACE_OFF, checkpoint_every=0, **options)
+    try:
+        success, dnodes = parser.parse(sentence=sentence, start=start)
+        error = ''
+    except RuntimeError as e:
+        success = False
+        dnodes = []
+        error = str(e)
+    seconds = time.perf_counter() - t0
+    plain_dnodes = [(dn.path, dn.label, [(f.name, f.value) for f in dn.features], dn.terminal)
+                    for dn in dnodes]
+    return ParseResult(index, sentence, success, parser.timed_out, error, seconds,
+                       parser.stats.steps, plain_dnodes)
+
+
+def read_sentences(filename):
+    """ One sentence per line, empty lines and lines starting with '#' are skipped.
+    :param filename:
+    :return: list of sentences
+    """
+    with open(filename) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def start_parsing(sentences, grammar_file=default_grammar_file, processes=None, time_limit=None,
+                  start='C', min_p=-0.0001, beam_size=None, context=multiprocessing):
+    """ Start parsing sentences in a pool of worker processes and return without waiting.
+    Parameters are as in parse_corpus.
+    :param context: multiprocessing context used to start the workers
+    :return: (pool, list of multiprocessing.AsyncResults of ParseResults in the order of
+    sentences). Pool is closed, its workers exit when all sentences are parsed.
+    """
+    options = dict(start=start, min_p=min_p, beam_size=beam_size, time_limit=time_limit)
+    pool = context.Pool(processes, initializer=_init_worker, initargs=(grammar_file, options))
+    pending = [pool.apply_async(_parse_job, (job,)) for job in enumerate(sentences)]
+    pool.close()
+    return pool, pending
+
+
+def parse_corpus(sentences, grammar_file=default_grammar_file, processes=None, time_limit=None,
+                 start='C', min_p=-0.0001, beam_size=None):
+    """ Parse sentences in a pool of worker processes.
+    :param sentences: list of sentences
+    :param grammar_file: grammar that each worker compiles
+    :param processes: number of worker processes, default is number of cpus. With 1 the
+    sentences are parsed in this process.
+    :param time_limit: optional time limit for each sentence in seconds
+    :param start: category that parses should end up in
+    :param min_p: parses that are less probable than this are discarded
+    :param beam_size: optional maximum number of parses kept in the beam
+    :return: iterator of ParseResults, in the order they are finished. ParseResult.index is the
+    index of the sentence.
+    """
+    options = dict(start=start, min_p=min_p, beam_size=beam_size, time_limit=time_limit)
+    jobs = list(enumerate(sentences))
+    if processes == 1 or len(jobs) < 2:
+        _init_worker(grammar_file, options)
+        for job in jobs:
+            yield _parse_job(job)
+        return
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(grammar_file, options)) as pool:
+        yield from pool.imap_unordered(_parse_job, jobs)
+
+
+def write_result(out, result):
+    """ Write timing and pretty-printed derivation tree of a result into a text file
+    :param out: writable file
+    :param result: ParseResult
+    """
+    out.write('# %s: %s, %s, %.3f s, %s steps\n' % (result.index, result.sentence,
+                                                     result.status, result.seconds, result.steps))
+    if result.error:
+        out.write('# %s\n' % result.error)
+    elif result.success:
+        # failed and timed out parses have only parts of the derivation
+        dtree = Constituent.dnodes_to_dtree(result.derivation_nodes(), all_features=True)
+        pptree(out, dtree.as_list_tree())
+    out.write('\n')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Parse a file of sentences in parallel.')
+    ap.add_argument('sentence_file', help='one sentence per line')
+    ap.add_argument('-g', '--grammar', default=default_grammar_file, help='grammar file')
+    ap.add_argument('-j', '--processes', type=int, default=None,
+                    help='number of worker processes, default is number of cpus')
+    ap.add_argument('-t', '--time-limit', type=float, default=None,
+                    help='time limit for each sentence in seconds')
+    ap.add_argument('-b', '--beam-size', type=int, default=None)
+    ap.add_argument('-s', '--start', default='C', help='start category')
+    ap.add_argument('-o', '--output', default=None,
+                    help='file where derivation trees are written')
+    args = ap.parse_args(argv)
+
+    sentences = read_sentences(args.sentence_file)
+    out = open(args.output, 'w') if args.output else None
+    t0 = time.perf_counter()
+    parse_time = 0
+    found = 0
+    for result in parse_corpus(sentences, grammar_file=args.grammar, processes=args.processes,
+                               time_limit=args.time_limit, start=args.start,
+                               beam_size=args.beam_size):
+        parse_time += result.seconds
+        if result.success:
+            found += 1
+        print('%4d %8.3f s %6d steps  %-14s %s' % (result.index, result.seconds, result.steps,
+                                                    result.status, result.sentence))
+        if out:
+            write_result(out, result)
+    wall_time = time.perf_counter() - t0
+    if out:
+        out.close()
+    print('%s/%s parsed in %.3f s, %.3f s of parsing time' % (found, len(sentences), wall_time,
+                                                             parse_time))
+
+
+if __name__ == '__main__':
+    main()
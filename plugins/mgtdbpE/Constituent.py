@@ -242,4 +242,5 @@ class Constituent(BaseConstituent):
     def __hash__(self):
         return hash(self.index_str)
 
-    secondary_label = SavedField("secondary_label")
\ No newline at end of file
+    if in_kataja:
+        secondary_label = SavedField("secondary_label")
\ No newline at end of file
@@ -22,10 +22,13 @@
 #
 # ############################################################################
 
+import multiprocessing
+
 from kataja.singletons import ctrl, running_environment
 from kataja.saved.Forest import Forest
 from kataja.saved.KatajaDocument import KatajaDocument
 from mgtdbpE.Parser import Parser, load_grammar
+from mgtdbpE.BatchParser import start_parsing
 from kataja.singletons import classes
 
 class Document(KatajaDocument):
@@ -35,6 +38,11 @@ class Document(KatajaDocument):
     # unique = True
     #
     default_treeset_file = running_environment.plugins_path + '/mgtdbpE/sentences.txt'
+    grammar_file = running_environment.plugins_path + '/mgtdbpE/mg0.txt'
+    # If > 0, all sentences are parsed when forests are created, in a pool of this many
+    # processes. Otherwise each forest parses its sentence when it is first shown.
+    batch_processes = 0
+    batch_time_limit = None  # seconds for each sentence in batch parsing
 
     def create_forests(self, filename=None, clear=False):
         """ This will read sentences to parse. One sentence per line, no periods etc.
@@ -54,7 +62,7 @@ class Document(KatajaDocument):
             self.forest.retire_from_drawing()
         self.forests = []
 
-        grammar = load_grammar(filename=running_environment.plugins_path + '/mgtdbpE/mg0.txt')
+        grammar = load_grammar(filename=self.grammar_file)
 
         for line in treelist:
             sentence = line.strip()
@@ -65,7 +73,30 @@ class Document(KatajaDocument):
             syn.lexicon = grammar
             forest = Forest(gloss_text=sentence, syntax=syn)
             self.forests.append(forest)
+        if self.batch_processes > 0:
+            self.parse_forests_in_batch()
         self.current_index = 0
         self.forest = self.forests[0]
         # allow change tracking (undo) again
         ctrl.resume_undo()
+
+    def parse_forests_in_batch(self):
+        """ Start parsing sentences of all forests in a process pool. Syntax connections of
+        forests get pending results, and when a forest is shown it waits only for its own
+        sentence.
+
+        Workers are not forked from this process: forking a process that has Qt's threads
+        running can leave the child waiting for locks that no thread will release. They are
+        forked from a fresh forkserver process or spawned instead.
+        """
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context('spawn')
+        sentences = [forest.syntax.sentence for forest in self.forests]
+        pool, pending = start_parsing(sentences, grammar_file=self.grammar_file,
+                                      processes=self.batch_processes,
+                                      time_limit=self.batch_time_limit, context=context)
+        for forest, pending_parse in zip(self.forests, pending):
+            forest.syntax.pending_parse = pending_parse
+        self._batch_pool = pool
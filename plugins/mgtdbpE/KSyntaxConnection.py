@@ -1,7 +1,10 @@
+import multiprocessing
+
 from kataja.SavedObject import SavedObject
-from kataja.singletons import ctrl, classes
+from kataja.singletons import ctrl, classes, log
 from syntax.SyntaxConnection import SyntaxConnection
 from mgtdbpE.Parser import load_grammar, Parser
+from mgtdbpE.Constituent import Constituent
 from mgtdbpE.OutputTrees import StateTree, BareTree, TracelessXBarTree
 
 
@@ -12,6 +15,8 @@ class KSyntaxConnection(SyntaxConnection):
     supports_editable_lexicon = True
     supports_secondary_labels = True
     display_modes = ['Derivation tree', 'State tree', 'Bare tree', 'XBar tree']
+    # seconds to wait for the result of batch parsing before parsing here
+    batch_timeout = 60
 
     def __init__(self):
         SavedObject.__init__(self)
@@ -24,6 +29,7 @@ class KSyntaxConnection(SyntaxConnection):
         self.rules = {}
         self.sentence = ''
         self.parser = None
+        self.pending_parse = None  # multiprocessing.AsyncResult of BatchParser.ParseResult
         self.syntax_display_mode = 2
         for key, value in self.options.items():
             self.rules[key] = value.get('default')
@@ -65,9 +71,27 @@ class KSyntaxConnection(SyntaxConnection):
         :return:
         """
         print('create_derivation: ', self.lexicon)
-        self.parser = Parser(self.lexicon, -0.0001, forest=forest)
-        # parser doesn't return anything, it pushes derivation steps to forest
-        self.parser.parse(sentence=self.sentence, start='C')
+        result = None
+        if self.pending_parse:
+            # waits only for this sentence, if its worker is still busy
+            try:
+                result = self.pending_parse.get(self.batch_timeout)
+            except multiprocessing.TimeoutError:
+                log.error('Batch parsing took too long with "%s", parsing it here' %
+                          self.sentence)
+            except Exception as e:
+                log.error('Batch parsing failed with "%s", parsing it here: %s' %
+                          (self.sentence, e))
+            self.pending_parse = None
+        if result and result.success:
+            # parsed in batch, there is only the final derivation step
+            dtree = Constituent.dnodes_to_dtree(result.derivation_nodes(), all_features=True)
+            forest.derivation_steps.save_and_create_derivation_step([dtree])
+        else:
+            # failed and timed out batch parses have only parts of the derivation, parse again
+            self.parser = Parser(self.lexicon, -0.0001, forest=forest)
+            # parser doesn't return anything, it pushes derivation steps to forest
+            self.parser.parse(sentence=self.sentence, start='C')
         ds = forest.derivation_steps
         ds.derivation_step_index = len(ds.derivation_steps) - 1
         ds.jump_to_derivation_step(ds.derivation_step_index)
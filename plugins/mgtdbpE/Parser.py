@@ -13,6 +13,18 @@ file: mgtdbpD.py
    sorting and new parses are inserted close to their final resting place.
    mgtdbpD -- Combined DerivationTree and DerivationNode. As names tell, they were quite similar.
    Sortable indices are strings instead of lists. Easier for output and almost as fast.
+   mgtdbpE -- Derivation stack is a heap again, but with plain heapq. Ties are broken in favour
+   of the most recent parse, so the parses come out in the same order as with sorted list.
+   Optional beam_size bounds the number of parses kept in the beam. Grammar is compiled into
+   Lexicon, where features have integer ids, LexTreeNodes find their subtrees from dicts and
+   know beforehand which operations they allow. Compiled grammar files are cached next to them.
+   Predictions, derivations and derivation nodes are persistent: they are never changed in
+   place after they are copied, so copies share their data with the original and expansions
+   allocate only what they change.
+   Parser output goes through trace events that are filtered by trace_level, and checkpoints
+   can be sampled with checkpoint_every or turned off. ParseStats counts expansions, discarded
+   and pruned parses, beam size at each step and time spent in each operation. Parses can
+   have a time limit, BatchParser uses it to parse sentence files in a process pool.
 
    Refactoring by Jukka Purma                                      || 11/21/16 
    mgtdbp-dev Modified for py3.1 compatibility by: Erik V Arrieta. || Last modified: 9/15/12
@@ -20,9 +32,12 @@ file: mgtdbpD.py
    
 Comments welcome: jukka.purma--at--gmail.com
 """
+import heapq
+import os
+import pickle
 import time
 import pprint
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 
 try:
     from kataja.saved.Forest import Forest
@@ -50,16 +65,29 @@ class LexItem(namedtuple('LexItem', ('words', 'features'))):
         return f'{words} :: {feats}'
 
 
+# Operations that predictions can be expanded with, decided by the first feature of LexTreeNode
+NO_EXPANSION, MERGE_TERMINAL, MERGE_NONTERMINAL, MOVE, INVALID = range(5)
+
+
 class LexTreeNode:
-    def __init__(self, feature):
+    def __init__(self, feature, feature_id=None):
         self.feature = feature
+        self.feature_id = feature_id
+        self.category = feature.name if feature else None
         self.subtrees = []  # LexTreeNodes
         self.terminals = []
+        self.children = {}  # feature id -> subtree
+        self.by_category = {}  # feature name -> first subtree with that name
+        self.operation = NO_EXPANSION
 
     def subtree_with_feature(self, name):
-        for subtree in self.subtrees:
-            if subtree.feature and subtree.feature.name == name:
-                return subtree
+        return self.by_category.get(name, None)
+
+    def add_subtree(self, subtree):
+        self.subtrees.append(subtree)
+        self.children[subtree.feature_id] = subtree
+        if subtree.category not in self.by_category:
+            self.by_category[subtree.category] = subtree
 
     def __repr__(self):
         if self.subtrees:
@@ -68,6 +96,151 @@ class LexTreeNode:
             return '[%s, %s]' % (self.feature, self.terminals)
 
 
+class Lexicon:
+    """ Grammar compiled into a LexTree for parsing. Features are interned as integer ids,
+    so building the tree doesn't need to compare Feature objects, and each LexTreeNode knows
+    which merge or move operations can be predicted from it. """
+    version = 1  # increase when compiled format changes, to invalidate cached files
+
+    def __init__(self, lex_items):
+        self.lex_items = lex_items
+        self.feature_ids = {}  # (name, value) -> id
+        self.root = LexTreeNode(None)
+        self.lex = OrderedDict()
+        for lex_item in lex_items:
+            # Build LexTrees
+            node = self.root
+            for f in reversed(lex_item.features):
+                fid = self.feature_id(f)
+                subtree = node.children.get(fid, None)
+                if subtree is None:
+                    subtree = LexTreeNode(f, fid)
+                    node.add_subtree(subtree)
+                node = subtree
+            node.terminals.append(lex_item.words)
+        stack = list(self.root.subtrees)
+        while stack:
+            node = stack.pop()
+            node.operation = self.operation_for(node)
+            stack += node.subtrees
+        for node in self.root.subtrees:
+            self.lex[node.feature.name] = node  # dict for quick access to starting categories
+
+    def feature_id(self, feature):
+        key = feature.name, feature.value
+        fid = self.feature_ids.get(key, None)
+        if fid is None:
+            fid = len(self.feature_ids)
+            self.feature_ids[key] = fid
+        return fid
+
+    @staticmethod
+    def operation_for(node):
+        value = node.feature.value
+        if value == '=':
+            if node.terminals:
+                return MERGE_TERMINAL
+            elif node.subtrees:
+                return MERGE_NONTERMINAL
+            return NO_EXPANSION
+        elif value == '+':
+            return MOVE
+        return INVALID
+
+
+def compile_grammar(filename, use_cache=True):
+    """ Load grammar file and compile it to Lexicon. Compiled grammar is stored next to the
+    grammar file (e.g. mg0.txt.compiled) and used instead as long as the grammar file hasn't
+    changed.
+    :param filename: grammar file
+    :param use_cache: use and write cached file. In Kataja features are saved objects and are
+    not cached.
+    :return: Lexicon
+    """
+    cache_file = filename + '.compiled'
+    use_cache = use_cache and not in_kataja
+    if use_cache:
+        try:
+            if os.path.getmtime(cache_file) >= os.path.getmtime(filename):
+                with open(cache_file, 'rb') as f:
+                    lexicon = pickle.load(f)
+                if getattr(lexicon, 'version', None) == Lexicon.version:
+                    return lexicon
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass
+    lexicon = Lexicon(load_grammar(filename=filename))
+    if use_cache:
+        try:
+            with open(cache_file, 'wb') as f:
+                pickle.dump(lexicon, f, protocol=4)
+        except OSError:
+            pass
+    return lexicon
+
+
+# Trace levels. Events of given level and above are passed to trace handler.
+TRACE_OPERATIONS = 10  # every prediction and every expansion created from it
+TRACE_STEPS = 20  # derivation steps, scans and checkpointed trees
+TRACE_RESULTS = 30  # start and result of a parse
+TRACE_OFF = 100
+
+
+def print_event(level, event, text, fields):
+    """ Default trace handler, prints the text of the event.
+    :param level: trace level of the event
+    :param event: name of the event, e.g. 'merge1' or 'step'
+    :param text: human readable form of the event
+    :param fields: dict of event data
+    """
+    print(text)
+
+
+class ParseStats:
+    """ Counters for one parse """
+
+    def __init__(self):
+        self.steps = 0  # derivations taken from beam
+        self.expansions = 0  # predictions expanded
+        self.new_parses = 0  # parses created by expansions
+        self.scans = 0
+        self.discarded = 0  # parses discarded as improbable
+        self.pruned = 0  # parses dropped from beam because of beam_size
+        self.checkpoints = 0
+        self.beam_sizes = []  # beam size at each step
+        self.operation_counts = defaultdict(int)
+        self.operation_times = defaultdict(float)
+
+    def time_operation(self, name, t0):
+        self.operation_counts[name] += 1
+        self.operation_times[name] += time.perf_counter() - t0
+
+    def report(self):
+        """ :return: counters as a multiline string """
+        lines = ['steps: %s, expansions: %s, new parses: %s, scans: %s, discarded: %s, '
+                 'pruned: %s, checkpoints: %s, peak beam: %s' %
+                 (self.steps, self.expansions, self.new_parses, self.scans, self.discarded,
+                  self.pruned, self.checkpoints, max(self.beam_sizes, default=0))]
+        for name in sorted(self.operation_times, key=self.operation_times.get, reverse=True):
+            lines.append('  %s: %s calls, %.3f ms' % (name, self.operation_counts[name],
+                                                      self.operation_times[name] * 1000))
+        return '\n'.join(lines)
+
+
+def without(d, key):
+    """ Copy of dict without key. Dicts of predictions and derivation nodes are shared between
+    copies, so they are replaced instead of changed in place. """
+    d = d.copy()
+    del d[key]
+    return d
+
+
+def with_item(d, key, value):
+    """ Copy of dict with key set to value, see without. """
+    d = d.copy()
+    d[key] = value
+    return d
+
+
 class Prediction:
     def __init__(self, head, movers=None, head_path=None, mover_paths=None, tree=None):
         self.head = head
@@ -85,7 +258,8 @@ class Prediction:
         self._min_index = min([self.head_path] + [x for x in self.mover_paths.values()])
 
     def copy(self):
-        return Prediction(self.head, self.movers.copy(), self.head_path, self.mover_paths.copy(),
+        """ Copy shares movers and mover_paths with the original. """
+        return Prediction(self.head, self.movers, self.head_path, self.mover_paths,
                           self.tree.copy())
 
     def __repr__(self):
@@ -117,23 +291,44 @@ class Prediction:
 
 
 class Derivation:
+    """ Derivation shares its input, predictions and results with the derivation it was copied
+    from. Input list is replaced instead of changed, predictions are a sorted tuple and
+    results are a linked list of (node, previous link) -pairs, where each derivation adds its
+    results in front of the results of its parent. """
+
     def __init__(self, p, inpt, iqs, results):
         self.probability = p
         self.input = inpt
-        self.predictions = iqs
-        self.results = results
+        self.predictions = tuple(iqs)
+        self._results = None
+        for result in results:
+            self.add_result(result)
+
+    def add_result(self, node):
+        self._results = (node, self._results)
+
+    @property
+    def results(self):
+        results = []
+        link = self._results
+        while link:
+            results.append(link[0])
+            link = link[1]
+        results.reverse()
+        return results
 
     def __getitem__(self, key):
         return (self.probability, self.input, self.predictions, self.results)[key]
 
     def __str__(self):
         return '(%s, %s, %s, [%s])' % \
-               (self.probability, ' '.join(self.input), str(self.predictions),
+               (self.probability, ' '.join(self.input), str(list(self.predictions)),
                 ', '.join([str(x) for x in self.results]))
 
     def copy(self):
-        return Derivation(self.probability, self.input.copy(), self.predictions.copy(),
-                          self.results.copy())
+        d = Derivation(self.probability, self.input, self.predictions, ())
+        d._results = self._results
+        return d
 
     def __lt__(self, other):
         return self.probability < other.probability
@@ -153,8 +348,9 @@ class DerivationNode:
         self.terminal = terminal
 
     def copy(self):
-        return DerivationNode(self.path, self.label.copy(), self.features.copy(),
-                              self.moving_features.copy(), self.terminal)
+        """ Copy shares label, features and moving_features with the original. """
+        return DerivationNode(self.path, self.label, self.features, self.moving_features,
+                              self.terminal)
 
     def __repr__(self):
         return 'DerivationNode(path=%r, label=%r, features=%r)' % \
@@ -186,12 +382,38 @@ class DerivationNode:
 
 
 class Parser:
-    def __init__(self, lex_items, min_p, forest=None, syntax_connection=None):
-        print('****** Starting Parser *******')
-        self.d = lex_items
+    def __init__(self, lex_items, min_p, forest=None, syntax_connection=None, beam_size=None,
+                 trace_level=TRACE_OPERATIONS, trace_handler=None, checkpoint_every=1,
+                 time_limit=None):
+        """
+        :param lex_items: list of LexItems or compiled Lexicon
+        :param min_p: parses that are less probable than this are discarded
+        :param forest: optional kataja forest where to push trees
+        :param syntax_connection:
+        :param beam_size: optional maximum number of parses kept in the beam. When the beam
+        grows to twice this size, it is pruned back to beam_size most probable parses.
+        :param trace_level: only trace events of this level and above are sent to trace_handler,
+        TRACE_OFF for quiet parsing.
+        :param trace_handler: function(level, event, text, fields), default prints the text.
+        :param checkpoint_every: checkpoint every nth derivation step, 0 to not checkpoint at all.
+        :param time_limit: optional time limit for a parse in seconds. Parse that takes longer is
+        stopped and fails with timed_out set.
+        """
+        self.trace_level = trace_level
+        self.trace_handler = trace_handler or print_event
+        self.checkpoint_every = checkpoint_every
+        self.time_limit = time_limit
+        self.timed_out = False
+        self.stats = ParseStats()
+        self.trace(TRACE_RESULTS, 'start', '****** Starting Parser *******')
         self.min_p = min_p
-        self.lex = OrderedDict()
+        self.beam_size = beam_size
+        # derivation_stack is a heap of (probability, -insertion count, derivation) -tuples.
+        # Probabilities are negative, so the most probable parse is at the top, and among
+        # equally probable parses the latest one.
         self.derivation_stack = []
+        self.insertions = 0
+        self.peak_beam = 0
         self.new_parses = []
         self.results = {}
         self.forest = forest  # optional kataja forest where to push trees
@@ -199,29 +421,28 @@ class Parser:
         self.dtrees = {}  # store resulting structures across parsing rounds so that nodes 'grow'
         #                   instead of starting from a blank slate at each iteration.
 
-        # Read LIs and features from grammar.
-        base = LexTreeNode(None)
-        for lex_item in lex_items:
-            # Build LexTrees
-            node = base
-            for f in reversed(lex_item.features):
-                found = False
-                for subtree in node.subtrees:
-                    if subtree.feature == f:
-                        found = True
-                        node = subtree
-                        break
-                if not found:
-                    new_node = LexTreeNode(f)
-                    node.subtrees.append(new_node)
-                    node = new_node
-            node.terminals.append(lex_item.words)
-        for node in base.subtrees:
-            self.lex[node.feature.name] = node  # dict for quick access to starting categories
+        # Read LIs and features from grammar, unless they are already compiled
+        if isinstance(lex_items, Lexicon):
+            lexicon = lex_items
+        else:
+            lexicon = Lexicon(lex_items)
+        self.d = lexicon.lex_items
+        self.lex = lexicon.lex
 
     def __str__(self):
         return str(self.d)
 
+    def trace(self, level, event, text, **fields):
+        """ Send trace event to trace handler if it is of high enough level. Callers in hot
+        paths should check trace_level themselves before building the text.
+        :param level: one of TRACE_ levels
+        :param event: name of the event
+        :param text: human readable form of the event
+        :param fields: event data
+        """
+        if level >= self.trace_level:
+            self.trace_handler(level, event, text, fields)
+
     def parse(self, start, sentence):
         # Prepare prediction queue. We have a prediction that the derivation will finish
         # in a certain kind of category, e.g. 'C'
@@ -230,45 +451,71 @@ class Parser:
         prediction = Prediction(topmost_head, tree=DerivationNode('', features=final_features))
 
         inpt = sentence.split()
-        print('inpt =' + str(inpt))
+        self.trace(TRACE_RESULTS, 'input', 'inpt =' + str(inpt), input=inpt)
 
         # Prepare derivation queue. It gets expanded by derive.
-        self.derivation_stack = [Derivation(-1.0, inpt, [prediction], [DerivationNode('')])]
+        self.derivation_stack = []
+        self.insertions = 0
+        self.peak_beam = 0
+        self.stats = ParseStats()
+        self.timed_out = False
+        self.push_parse(Derivation(-1.0, inpt, [prediction], [DerivationNode('')]))
 
         # The work is done by derive.
         t0 = time.time()
         success, dnodes = self.derive()
         t1 = time.time()
         if success:
-            print('parse found')
+            self.trace(TRACE_RESULTS, 'result', 'parse found', success=True)
         else:
-            print('no parse found')
-        print(str(t1 - t0) + "seconds")
+            self.trace(TRACE_RESULTS, 'result', 'no parse found', success=False)
+        self.trace(TRACE_RESULTS, 'time', str(t1 - t0) + "seconds", seconds=t1 - t0)
         return success, dnodes
 
     def derive(self):
         d = None
+        stats = self.stats
+        deadline = self.time_limit and time.perf_counter() + self.time_limit
         while self.derivation_stack:
-            d = self.derivation_stack.pop()
-            self.checkpoint(d)
-            print('#########################################')
-            print('# of parses in beam=%s, p(best parse)=%s' %
-                  (len(self.derivation_stack) + 1, -1 * d.probability))
-            print('')
+            stats.beam_sizes.append(len(self.derivation_stack))
+            d = heapq.heappop(self.derivation_stack)[2]
+            stats.steps += 1
+            if deadline and time.perf_counter() > deadline:
+                self.timed_out = True
+                self.trace(TRACE_RESULTS, 'timeout', 'time limit exceeded',
+                           time_limit=self.time_limit)
+                break
+            if self.checkpoint_every and stats.steps % self.checkpoint_every == 0:
+                t0 = time.perf_counter()
+                self.checkpoint(d)
+                stats.time_operation('checkpoint', t0)
+            if self.trace_level <= TRACE_STEPS:
+                beam = len(self.derivation_stack) + 1
+                self.trace(TRACE_STEPS, 'step',
+                           '#########################################\n'
+                           '# of parses in beam=%s, p(best parse)=%s\n' %
+                           (beam, -1 * d.probability), beam=beam, probability=d.probability)
             if not (d.predictions or d.input):
                 return True, d.results  # success
             elif d.predictions:
-                prediction = d.predictions.pop(0)
+                prediction = d.predictions[0]
+                d.predictions = d.predictions[1:]
                 self.new_parses = []
                 self.create_expansions(prediction)
                 if self.new_parses:
                     new_p = d.probability / len(self.new_parses)
                     if new_p < self.min_p:
+                        t0 = time.perf_counter()
                         self.insert_new_parses(d, new_p)
+                        stats.time_operation('insert', t0)
                     else:
-                        print('improbable parses discarded')
+                        stats.discarded += len(self.new_parses)
+                        self.trace(TRACE_STEPS, 'discard', 'improbable parses discarded',
+                                   count=len(self.new_parses))
                 else:
+                    t0 = time.perf_counter()
                     self.scan_and_insert_terminals(prediction, d)
+                    stats.time_operation('scan', t0)
         return False, d.results  # fail
 
     def create_expansions(self, prediction):
@@ -281,20 +528,38 @@ class Parser:
          """
 
         # e.g. if current head is C, nodes are =V, -wh
-        print('---prediction now: ', prediction.compact())
+        if self.trace_level <= TRACE_OPERATIONS:
+            self.trace(TRACE_OPERATIONS, 'prediction',
+                       '---prediction now:  ' + str(prediction.compact()))
+        stats = self.stats
+        stats.expansions += 1
+        clock = time.perf_counter
         for node in prediction.head.subtrees:
-            if node.feature.value == '=':
-                if node.terminals:
-                    self.merge1(node, prediction)  # merge a (non-moving) complement
-                    self.merge3(node, prediction)  # merge a (moving) complement
-                elif node.subtrees:
-                    self.merge2(node, prediction)  # merge a (non-moving) specifier
-                    self.merge4(node, prediction)  # merge a (moving) specifier
-            elif node.feature.value == '+':
+            operation = node.operation
+            if operation == MERGE_TERMINAL:
+                t0 = clock()
+                self.merge1(node, prediction)  # merge a (non-moving) complement
+                t1 = clock()
+                stats.time_operation('merge1', t0)
+                self.merge3(node, prediction)  # merge a (moving) complement
+                stats.time_operation('merge3', t1)
+            elif operation == MERGE_NONTERMINAL:
+                t0 = clock()
+                self.merge2(node, prediction)  # merge a (non-moving) specifier
+                t1 = clock()
+                stats.time_operation('merge2', t0)
+                self.merge4(node, prediction)  # merge a (moving) specifier
+                stats.time_operation('merge4', t1)
+            elif operation == MOVE:
+                t0 = clock()
                 self.move1(node, prediction)
+                t1 = clock()
+                stats.time_operation('move1', t0)
                 self.move2(node, prediction)
-            else:
+                stats.time_operation('move2', t1)
+            elif operation == INVALID:
                 raise RuntimeError('no possible expansions from current state -- parse failed')
+        stats.new_parses += len(self.new_parses)
 
     def scan_and_insert_terminals(self, prediction, derivation):
         for words in prediction.head.terminals:
@@ -307,12 +572,15 @@ class Parser:
                 new_parse = derivation.copy()
                 new_pred.tree.label = words
                 new_pred.tree.terminal = True
-                new_parse.results.append(new_pred.tree)
+                new_parse.add_result(new_pred.tree)
                 if new_parse.input[:len(words)] == words:
                     new_parse.input = new_parse.input[len(words):]
-                print('||| scanned and found: ', words)
-                self.derivation_stack.append(new_parse)
-                self.derivation_stack.sort(reverse=True)
+                self.stats.scans += 1
+                if self.trace_level <= TRACE_STEPS:
+                    self.trace(TRACE_STEPS, 'scan', '||| scanned and found:  ' + str(words),
+                               words=words)
+                self.push_parse(new_parse)
+                self.prune_beam()
                 break  # there is only one match for word+features in lexicon
 
     # These operations reverse familiar minimalist operations: external merges, moves and select.
@@ -329,13 +597,13 @@ class Parser:
         """
         # print('doing merge1')
         # print(node)
-        category = node.feature.name
+        category = node.category
         pr0 = prediction.copy()  # no movers to lexical head
         pr0.head = node  # one part of the puzzle is given, the other part is deduced from this
         pr0.head_path += '0'  # left
         pr0.movers = {}  # this is external merge, doesn't bring any movers
         pr0.mover_paths = {}
-        pr0.tree.features.append(Feature(category, '=')) # =D, =N,...
+        pr0.tree.features = pr0.tree.features + [Feature(category, '=')] # =D, =N,...
         pr0.tree.path += '0'  # left
         pr0.tree.moving_features = {}
 
@@ -344,8 +612,8 @@ class Parser:
         pr1.head_path += '1'  # right
         pr1.tree.features = [Feature(category, '')] # D, N,...
         pr1.tree.path += '1'  # right
-        print('merge1, pr0:', pr0.compact())
-        print('merge1, pr1:', pr1.compact())
+        if self.trace_level <= TRACE_OPERATIONS:
+            self.trace_expansion('merge1', pr0, pr1)
         self.new_parses.append((pr0, pr1))
 
     # merge a (non-moving) specifier
@@ -358,11 +626,11 @@ class Parser:
         """
         # print('doing merge2')
         # print(node)
-        category = node.feature.name
+        category = node.category
         pr0 = prediction.copy()  # pr0 receives movers from prediction.
         pr0.head = node
         pr0.head_path += '1'  # right?
-        pr0.tree.features.append(Feature(category, '='))  # =D, =N,...
+        pr0.tree.features = pr0.tree.features + [Feature(category, '=')]  # =D, =N,...
         pr0.tree.path += '0'  # left?
 
         pr1 = prediction.copy()
@@ -373,8 +641,8 @@ class Parser:
         pr1.tree.features = [Feature(category, '')]  # D, N,...
         pr1.tree.path += '1'
         pr1.tree.moving_features = {}
-        print('merge2, pr0:', pr0.compact())
-        print('merge2, pr1:', pr1.compact())
+        if self.trace_level <= TRACE_OPERATIONS:
+            self.trace_expansion('merge2', pr0, pr1)
         self.new_parses.append((pr0, pr1))
 
     # merge a (moving) complement
@@ -385,7 +653,7 @@ class Parser:
         {node} is terminal
         ..=X:root * ..X(-mover).. => prediction (with mover)
         """
-        cat = node.feature.name
+        cat = node.category
         for mover_cat, mover in prediction.movers.items():  # look into movers
             matching_tree = mover.subtree_with_feature(cat)  # matching tree is a child of mover
             if matching_tree:
@@ -395,23 +663,22 @@ class Parser:
                 pr0.head = node  # head path is not changing. wonder why?
                 pr0.movers = {}
                 pr0.mover_paths = {}
-                pr0.tree.features.append(Feature(cat, '=')) # =D, =N
+                pr0.tree.features = pr0.tree.features + [Feature(cat, '=')] # =D, =N
                 pr0.tree.path += '0'
                 pr0.tree.moving_features = {}
 
                 # pr1 doesn't have certain movers that higher prediction has
                 pr1 = prediction.copy()  # movers passed to complement
                 pr1.head = matching_tree
-                del pr1.movers[mover_cat]  # we used the licensee, so now empty
+                pr1.movers = without(pr1.movers, mover_cat)  # we used the licensee, so now empty
                 pr1.head_path = pr1.mover_paths[mover_cat]
-                del pr1.mover_paths[mover_cat]
-                pr1.tree.features = pr1.tree.moving_features[mover_cat].copy()  # movers to
-                # complement
-                pr1.tree.features.append(Feature(cat, ''))
+                pr1.mover_paths = without(pr1.mover_paths, mover_cat)
+                # movers to complement
+                pr1.tree.features = pr1.tree.moving_features[mover_cat] + [Feature(cat, '')]
                 pr1.tree.path += '1'
-                del pr1.tree.moving_features[mover_cat]
-                print('merge3, pr0:', pr0.compact())
-                print('merge3, pr1:', pr1.compact())
+                pr1.tree.moving_features = without(pr1.tree.moving_features, mover_cat)
+                if self.trace_level <= TRACE_OPERATIONS:
+                    self.trace_expansion('merge3', pr0, pr1)
                 self.new_parses.append((pr0, pr1))
 
     # merge a (moving) specifier
@@ -422,7 +689,7 @@ class Parser:
         {node} is non-terminal
         ..=X(-mover).. * ..LexMX(mover).. => prediction (with mover)
         """
-        cat = node.feature.name
+        cat = node.category
         for mover_cat, mover in prediction.movers.items():
             matching_tree = mover.subtree_with_feature(cat)
             if matching_tree:
@@ -430,23 +697,23 @@ class Parser:
                 # print(node)
                 pr0 = prediction.copy()  # has most of the movers that prediction has
                 pr0.head = node
-                del pr0.movers[mover_cat]  # we used the "next" licensee, so now empty
-                del pr0.mover_paths[mover_cat]
-                pr0.tree.features.append(Feature(cat, '='))
+                # we used the "next" licensee, so now empty
+                pr0.movers = without(pr0.movers, mover_cat)
+                pr0.mover_paths = without(pr0.mover_paths, mover_cat)
+                pr0.tree.features = pr0.tree.features + [Feature(cat, '=')]
                 pr0.tree.path += '0'
-                del pr0.tree.moving_features[mover_cat]
+                pr0.tree.moving_features = without(pr0.tree.moving_features, mover_cat)
 
                 pr1 = prediction.copy()  # movers passed to complement
                 pr1.head = matching_tree
                 pr1.movers = {}
                 pr1.head_path = pr1.mover_paths[mover_cat]
                 pr1.mover_paths = {}
-                pr1.tree.features = pr1.tree.moving_features[mover_cat].copy()
-                pr1.tree.features.append(Feature(cat, ''))
+                pr1.tree.features = pr1.tree.moving_features[mover_cat] + [Feature(cat, '')]
                 pr1.tree.path += '1'
                 pr1.tree.moving_features = {}
-                print('merge4, pr0:', pr0.compact())
-                print('merge4, pr1:', pr1.compact())
+                if self.trace_level <= TRACE_OPERATIONS:
+                    self.trace_expansion('merge4', pr0, pr1)
                 self.new_parses.append((pr0, pr1))
 
     def move1(self, node, prediction):
@@ -455,75 +722,99 @@ class Parser:
         {prediction.movers}
 
         """
-        cat = node.feature.name
+        cat = node.category
         if cat not in prediction.movers:  # note that it is 'not in'. We're establishing a mover.
             pr0 = prediction.copy()
             pr0.head = node  # node is remainder of head branch
-            pr0.movers[cat] = self.lex[cat]
+            pr0.movers = with_item(pr0.movers, cat, self.lex[cat])
             pr0.head_path += '1'
-            pr0.mover_paths[cat] = prediction.head_path
-            pr0.mover_paths[cat] += '0'
-            pr0.tree.features.append(Feature(cat, '+'))  # trunk has '+'
+            pr0.mover_paths = with_item(pr0.mover_paths, cat, prediction.head_path + '0')
+            pr0.tree.features = pr0.tree.features + [Feature(cat, '+')]  # trunk has '+'
             pr0.tree.path += '0'
-            pr0.tree.moving_features[cat] = [Feature(cat, '-')]  # mover has '-'
-            print('move1, pr0:', pr0.compact())
+            # mover has '-'
+            pr0.tree.moving_features = with_item(pr0.tree.moving_features, cat,
+                                                 [Feature(cat, '-')])
+            if self.trace_level <= TRACE_OPERATIONS:
+                self.trace_expansion('move1', pr0)
             self.new_parses.append((pr0, None))
 
     def move2(self, node, prediction):
         """ Move and keep on moving? Examples don't seem to use this. """
-        cat = node.feature.name
+        cat = node.category
         for mover_cat, mover in prediction.movers.items():  # <-- look into movers
             matching_tree = mover.subtree_with_feature(
                 cat)  # ... for category shared with prediction
             if matching_tree:
                 root_f = matching_tree.feature.name # value of rootLabel
                 assert (root_f == cat)
-                print(root_f, mover_cat)
                 if root_f == mover_cat or root_f not in prediction.movers:  # SMC
-                    print('doing move2')
-                    print(node)
-                    # print('doing move2')
                     mts = matching_tree  # matchingTree[1:][:] <-- not sure what to do here
                     pr0 = prediction.copy()
                     pr0.head = node
-                    del pr0.movers[mover_cat]  # we used the "next" licensee, so now empty
-                    pr0.movers[root_f] = mts
-                    pr0.mover_paths[root_f] = pr0.mover_paths[mover_cat].copy()
-                    del pr0.mover_paths[mover_cat]
-                    pr0.tree.moving_features[root_f] = pr0.tree.moving_features[mover_cat].copy()
-                    pr0.tree.moving_features[root_f].append(
-                        Feature(cat, '-'))  # extend prev features of mover with (neg cat)
-                    del pr0.tree.moving_features[mover_cat]
-                    pr0.tree.features.append(Feature(cat, '+'))
+                    # we used the "next" licensee, so now empty
+                    pr0.movers = with_item(without(pr0.movers, mover_cat), root_f, mts)
+                    pr0.mover_paths = with_item(without(pr0.mover_paths, mover_cat), root_f,
+                                                pr0.mover_paths[mover_cat])
+                    # extend prev features of mover with (neg cat)
+                    moving_features = pr0.tree.moving_features[mover_cat] + [Feature(cat, '-')]
+                    pr0.tree.moving_features = with_item(
+                        without(pr0.tree.moving_features, mover_cat), root_f, moving_features)
+                    pr0.tree.features = pr0.tree.features + [Feature(cat, '+')]
                     pr0.tree.path += '0'
-                    print('move2, pr0:', pr0.compact())
+                    if self.trace_level <= TRACE_OPERATIONS:
+                        self.trace_expansion('move2', pr0)
                     self.new_parses.append((pr0, None))
 
+    def trace_expansion(self, operation, pr0, pr1=None):
+        self.trace(TRACE_OPERATIONS, operation, '%s, pr0: %s' % (operation, pr0.compact()),
+                   pr0=pr0)
+        if pr1:
+            self.trace(TRACE_OPERATIONS, operation, '%s, pr1: %s' % (operation, pr1.compact()),
+                       pr1=pr1)
+
     def insert_new_parses(self, derivation, new_p):
         for pred0, pred1 in self.new_parses:
             new_parse = derivation.copy()
-            new_parse.results.append(pred0.tree)
+            new_parse.add_result(pred0.tree)
             pred0.update_ordering()
-            new_parse.predictions.append(pred0)
             if pred1:
-                new_parse.results.append(pred1.tree)
+                new_parse.add_result(pred1.tree)
                 pred1.update_ordering()
-                new_parse.predictions.append(pred1)
-            new_parse.predictions.sort()
+                predictions = derivation.predictions + (pred0, pred1)
+            else:
+                predictions = derivation.predictions + (pred0,)
+            new_parse.predictions = tuple(sorted(predictions))
             new_parse.probability = new_p
-            self.derivation_stack.append(new_parse)
-        self.derivation_stack.sort(reverse=True)
+            self.push_parse(new_parse)
+        self.prune_beam()
+
+    def push_parse(self, derivation):
+        self.insertions += 1
+        heapq.heappush(self.derivation_stack,
+                       (derivation.probability, -self.insertions, derivation))
+        if len(self.derivation_stack) > self.peak_beam:
+            self.peak_beam = len(self.derivation_stack)
+
+    def prune_beam(self):
+        """ If beam has grown to twice the beam_size, keep only beam_size most probable parses.
+        Pruning only after the beam has doubled keeps the cost of pruning per inserted parse low.
+        """
+        if self.beam_size and len(self.derivation_stack) >= 2 * self.beam_size:
+            # sorted list is also a valid heap
+            self.stats.pruned += len(self.derivation_stack) - self.beam_size
+            self.derivation_stack = heapq.nsmallest(self.beam_size, self.derivation_stack)
 
     def checkpoint(self, derivation):
         """ Here we can output, pause or otherwise intercept the parsing process """
+        self.stats.checkpoints += 1
         dtree = DTree.dnodes_to_dtree(derivation.results, all_features=True, dtrees=self.dtrees)
         #input()
         if in_kataja:
             self.forest.derivation_steps.save_and_create_derivation_step([dtree])
-            pprint.pprint(dtree)
-        else:
-            print('******* dtree *******')
-            pprint.pprint(dtree)
+        elif self.trace_level <= TRACE_STEPS:
+            self.trace(TRACE_STEPS, 'checkpoint', '******* dtree *******', dtree=dtree)
+        if self.trace_level <= TRACE_STEPS:
+            self.trace(TRACE_STEPS, 'checkpoint', pprint.pformat(dtree), dtree=dtree)
 
 
 def load_grammar(g='', filename=''):
@@ -551,7 +842,7 @@ def load_grammar(g='', filename=''):
 ############################################################################################
 
 if __name__ == '__main__':
-    g = load_grammar(filename='mg0.txt')
+    g = compile_grammar('mg0.txt')
 
     sentences = ["the king prefers the beer",
                  "which king says which queen knows which king says which wine the queen prefers",
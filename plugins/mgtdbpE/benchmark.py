@@ -0,0 +1,68 @@
+""" Benchmark for the beam parser. Parses sentences from sentences.txt with grammar mg0.txt and
+reports parses per second, the peak size of the beam and the peak memory used by a parse.
+Parser runs without tracing and checkpoints, and counters of the last parse of each sentence
+are printed after it. With --verbose, parser traces everything and checkpoints every step,
+as it does by default, but the output is thrown away.
+
+Run in this folder:
+python3 benchmark.py [rounds] [beam_size] [--verbose]
+"""
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+from Parser import Parser, compile_grammar, TRACE_OFF, TRACE_OPERATIONS
+
+
+def run(rounds=5, beam_size=None, grammar_file='mg0.txt', sentence_file='sentences.txt',
+        verbose=False):
+    g = compile_grammar(grammar_file)
+    with open(sentence_file) as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    parse_time = 0
+    parses = 0
+    derivations = 0
+    peak_beam = 0
+    peak_memory = 0
+    if verbose:
+        options = dict(trace_level=TRACE_OPERATIONS, checkpoint_every=1)
+    else:
+        options = dict(trace_level=TRACE_OFF, checkpoint_every=0)
+    # in verbose mode parser is very talkative, keep it quiet while measuring
+    quiet = open(os.devnull, 'w')
+    for s in sentences:
+        found = False
+        t = time.time()
+        for i in range(rounds):
+            with contextlib.redirect_stdout(quiet):
+                pr = Parser(g, -0.0001, beam_size=beam_size, **options)
+                found, dnodes = pr.parse(sentence=s, start='C')
+            derivations += pr.insertions
+            peak_beam = max(peak_beam, pr.peak_beam)
+        elapsed = time.time() - t
+        parse_time += elapsed
+        parses += rounds
+        # memory is measured with a separate untimed parse, as tracing slows down the parser
+        tracemalloc.start()
+        with contextlib.redirect_stdout(quiet):
+            Parser(g, -0.0001, beam_size=beam_size, **options).parse(sentence=s, start='C')
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peak_memory = max(peak_memory, memory)
+        print('%s: %s, %.1f parses/s, peak beam %s, peak memory %.1f kB' % (
+            s, 'parse found' if found else 'no parse found', rounds / elapsed, pr.peak_beam,
+            memory / 1024))
+        print(pr.stats.report())
+    print('total: %s parses in %.3f s, %.1f parses/s, %.0f derivations/s, peak beam %s, '
+          'peak memory %.1f kB' % (parses, parse_time, parses / parse_time,
+                                   derivations / parse_time, peak_beam, peak_memory / 1024))
+    quiet.close()
+
+
+if __name__ == '__main__':
+    verbose = '--verbose' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--verbose']
+    run(rounds=int(args[0]) if len(args) > 0 else 5,
+        beam_size=int(args[1]) if len(args) > 1 else None, verbose=verbose)
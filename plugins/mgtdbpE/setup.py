@@ -26,7 +26,7 @@ plugin_parts = [Constituent, Parser, Document, KSyntaxConnection]
 
 # reload_order = ['myplugin.SyntaxConnection', 'myplugin.KDocument', 'myplugin.setup']
 reload_order = ['mgtdbpE.Constituent',
-                'mgtdbpE.Parser', 'mgtdbpE.KSyntaxConnection',
+                'mgtdbpE.Parser', 'mgtdbpE.BatchParser', 'mgtdbpE.KSyntaxConnection',
                 'mgtdbpE.ForestKeeper', 'mgtdbpE.setup']  # put here 'myplugin.goodg'
 
 
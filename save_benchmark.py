@@ -0,0 +1,61 @@
+""" Benchmark for Kataja's save/restore engine. Builds a derivation step of a deep constituent
+tree, freezes it with the save system like derivation steps do, and restores it back.
+
+Run from Kataja's root folder:
+python3 save_benchmark.py [number of constituents]
+"""
+import pickle
+import sys
+import time
+
+from kataja.singletons import ctrl, classes
+from kataja.saved.DerivationStep import DerivationStepManager
+
+__author__ = 'purma'
+
+
+def build_tree(n):
+    """ Right-branching tree with n constituents, every second one is a leaf. Right branching is
+    the worst case for recursive walkers as the depth of the tree grows with its size.
+    :param n: number of constituents
+    :return: root constituent
+    """
+    Constituent = classes.get('Constituent')
+    top = Constituent(label='w%s' % n)
+    count = 1
+    while count + 2 <= n:
+        leaf = Constituent(label='w%s' % count)
+        top = Constituent(label='x%s' % count, parts=[leaf, top])
+        count += 2
+    return top
+
+
+def run(n=10000, rounds=3):
+    classes.late_init()
+    ctrl.disable_undo()
+    root = build_tree(n)
+    print('Saving and restoring a derivation step with %s constituents' % n)
+    for i in range(rounds):
+        dsm = DerivationStepManager()
+        t = time.time()
+        dsm.save_and_create_derivation_step([root])
+        save_time = time.time() - t
+        step = dsm.derivation_steps[-1]
+        uid, hashes, msg = step
+        # step refers to object states by their hash, the states are shared in frozen_objects
+        size = len(pickle.dumps((hashes, dsm.frozen_objects), protocol=4))
+        t = time.time()
+        d_step, restored = dsm._restore_step(step, {})
+        load_time = time.time() - t
+        assert d_step.synobjs[0] is not root
+        print('round %s: save %.3f s, restore %.3f s, %s objects, %s frozen states, '
+              '%s bytes pickled' % (i + 1, save_time, load_time, len(hashes),
+                                    len(dsm.frozen_objects), size))
+    ctrl.resume_undo()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -28,6 +28,8 @@ from configparser import ConfigParser
 import re
 from BaseConstituent import BaseConstituent as Constituent
 
+from syntax.Linearization import Linearization, linearize
+from syntax.StructureIndex import StructureIndex
 from syntax.utils import time_me
 
 
@@ -58,6 +60,10 @@ feature= ConfigurableFeature
 class ConstituentStructures:
     """ This is a collection of axioms and definitions from Carnie (2010) Constituent Structures.
     These are not used yet, but keep them in case we find a way to use them.
+
+    Predicates that are given a structure look the relations up from a StructureIndex of the
+    structure. Index of the latest structure is kept, call forget_index if that structure is
+    modified in place.
      """
 
     def __init__(self, config_path='kataja.cfg'):
@@ -70,6 +76,26 @@ class ConstituentStructures:
         # self.structure=None
 
         self.dominates = self.undefined
+        self._index = None
+        self._indexed_structure = None
+
+    def index(self, structure) -> StructureIndex:
+        """ Index of dominance and other relations of the structure. Repeated calls with the
+        same structure return the same index.
+        :param structure: root constituent or a collection of constituents
+        :return: StructureIndex
+        """
+        if self._index is None or self._indexed_structure is not structure:
+            self._index = StructureIndex(structure)
+            self._indexed_structure = structure
+        return self._index
+
+    def forget_index(self):
+        """ Have the index rebuilt on next use, e.g. after the indexed structure has changed.
+        :return: None
+        """
+        self._index = None
+        self._indexed_structure = None
 
     def undefined(self, *args, **kw):
         """
@@ -108,32 +134,22 @@ class ConstituentStructures:
         :param a: Constituent
         :param structure: Constituent structure where the analysis is done.
         """
-        for b in structure:
-            if not self.dominates(a, b):
-                return False
-            if b != a and self.dominates(b, a):
-                return False
-        return True
+        index = self.index(structure)
+        return len(index.roots) == 1 and index.roots[0] is a and not index.cyclic
 
     def is_terminal_node(self, a, structure) -> bool:
         """ (5b) Terminal node: A node that dominates nothing except itself. (Carnie 2010, p. 30)
         :param a:
         :param structure:
         """
-        for B in structure:
-            if a != B and self.dominates(a, B):
-                return False
-        return True
+        return self.index(structure).is_terminal(a)
 
     def is_non_terminal_node(self, node, structure) -> bool:
         """ (5c) Non-terminal node: A node that dominates something except itself. (Carnie 2010, p. 30)
         :param node:
         :param structure:
         """
-        for B in structure:
-            if node != B and self.dominates(node, B):
-                return True
-        return False
+        return not self.index(structure).is_terminal(node)
 
 
     # ## Dominance Axioms
@@ -143,6 +159,7 @@ class ConstituentStructures:
 
         :param structure:
         """
+        self.forget_index()
         print('Reflexivity Axiom:', self.reflexivity_axiom(structure))
         print('Single Root Axiom:', self.single_root_axiom(structure))
         print('Dominance Transitivity Axiom:', self.dominance_transitivity_axiom(structure))
@@ -153,8 +170,9 @@ class ConstituentStructures:
         """ (A1) all:x belonging to N, x dominates x. (Carnie 2010, p. 31)
         :param structure:
         """
-        for node in structure:
-            if not self.dominates(node, node):
+        index = self.index(structure)
+        for node in index.nodes:
+            if not index.dominates(node, node):
                 return False
         return True
 
@@ -163,28 +181,19 @@ class ConstituentStructures:
         """ (A2) exists:x, all:y belonging to N that x dominates y. (Carnie 2010, p. 31)
         :param structure:
         """
-        for node in list(structure):
-            found = False
-            for other_node in structure:
-                if self.dominates(other_node, node):
-                    found = True
-            if not found:
-                return True
-        return False
+        index = self.index(structure)
+        return len(index.roots) == 1 and not index.cyclic
 
     def dominance_transitivity_axiom(self, structure):
         """ (A3) all: x,y,z belonging to N: (x dominates y) & (y dominates z) -> (x dominates z) (Carnie 2010, p. 33)
         :param structure:
         """
-        for x in structure:
-            ys = [y for y in structure if self.dominates(x, y)]
-            zetas = []
-            for y in ys:
-                for z in structure:
-                    if self.dominates(y, z):
-                        zetas.append(z)
-            for obj in zetas:
-                if not self.dominates(x, obj):
+        # dominance in index is containment of intervals, which is transitive, if every node is
+        # within its mothers.
+        index = self.index(structure)
+        for y in index.nodes:
+            for x in index.mothers(y):
+                if not index.dominates(x, y):
                     return False
         return True
 
@@ -192,13 +201,8 @@ class ConstituentStructures:
         """ (A4) all: x,y belonging to N: (x dominates y) & (y dominates x) -> (x = y) (Carnie 2010, p. 31)
         :param structure:
         """
-        for x in structure:
-            dominated = [y for y in structure if self.dominates(x, y)]
-            ys = [y for y in dominated if self.dominates(y, x)]
-            for y in ys:
-                if x != y:
-                    return False
-        return True
+        # x and y dominating each other would require a cycle in structure
+        return not self.index(structure).cyclic
 
 
     def no_multiple_mothers_axiom(self, structure):
@@ -206,13 +210,15 @@ class ConstituentStructures:
         (Carnie 2010, p. 34)
         :param structure:
         """
-        for z in structure:
-            for y in structure:
-                if self.dominates(y, z):
-                    for x in structure:
-                        if self.dominates(x, z):
-                            if not (self.dominates(x, y) or self.dominates(y, x)):
-                                return False
+        # nodes dominating z are z and the nodes dominating its mothers, so they are in one line
+        # if mothers of each node are.
+        index = self.index(structure)
+        for z in index.nodes:
+            mothers = index.mothers(z)
+            for i, x in enumerate(mothers):
+                for y in mothers[i + 1:]:
+                    if not (index.dominates(x, y) or index.dominates(y, x)):
+                        return False
         return True
 
     # Immediate dominance
@@ -277,10 +283,7 @@ class ConstituentStructures:
         :param structure:
         """
         # hmm, this allows A to be sister of A
-        for C in structure:
-            if self.immediate_dominance(C, A, structure) and self.immediate_dominance(C, B, structure):
-                return True
-        return False
+        return self.index(structure).is_sister(A, B)
 
     def is_sister_chomsky(self, A, B, structure):
         """ ...Chomsky (1986b) gives a much broader description of sisterhood, where sisters include all material
@@ -352,10 +355,9 @@ class ConstituentStructures:
         :param B:
         :param structure:
         """
-        for M in structure:
-            if self.immediate_dominance(M, A, structure) and self.immediate_dominance(M, B,
-                                                                                      structure) and self.is_left_edge(
-                    A, B, M):
+        index = self.index(structure)
+        for M in index.mothers(A):
+            if index.immediately_dominates(M, B) and self.is_left_edge(A, B, M):
                 return True
         return False
 
@@ -368,15 +370,7 @@ class ConstituentStructures:
         :param B:
         :param structure:
         """
-        if self.dominates(A, B) or self.dominates(B, A):
-            return False
-        Es = [E for E in structure if self.dominates(E, A)]
-        Fs = [F for F in structure if self.dominates(F, B)]
-        for E in Es:
-            for F in Fs:
-                if self.sister_precedence(E, F, structure):
-                    return True
-        return False
+        return self.index(structure).precedes(A, B)
 
     def immediate_precedence(self, A, B, structure):
         """(27) A immediately precedes B if A precedes B and there is no node G that follows A but precedes B.
@@ -385,12 +379,13 @@ class ConstituentStructures:
         :param B:
         :param structure:
         """
-        if not self.precedence(A, B, structure):
+        index = self.index(structure)
+        if not index.precedes(A, B):
             return False
-        for G in structure:
+        for G in index.nodes:
             if G is A or G is B:
                 continue
-            if self.precedence(A, G, structure) and self.precedence(G, B, structure):
+            if index.precedes(A, G) and index.precedes(G, B):
                 return False
         return True
 
@@ -403,6 +398,7 @@ class ConstituentStructures:
         """
         :param structure:
         """
+        self.forget_index()
         print('Precedence Transitivity Axiom: ', self.precedence_transitivity_axiom(structure))
         print('Precedence Asymmetry Axiom: ', self.precedence_asymmetry_axiom(structure))
         print('Precedence Irreflexivity Axiom: ', self.precedence_irreflexivity_axiom(structure))
@@ -414,12 +410,13 @@ class ConstituentStructures:
         (Carnie 2010, p. 42)
         :param structure:
         """
-        for x in structure:
-            for y in structure:
-                for z in structure:
-                    if self.precedes(x, y, structure) and self.precedes(y, z, structure):
-                        if not self.precedes(x, z, structure):
-                            return False
+        index = self.index(structure)
+        followers = {id(x): [y for y in index.nodes if index.precedes(x, y)] for x in index.nodes}
+        for x in index.nodes:
+            for y in followers[id(x)]:
+                for z in followers[id(y)]:
+                    if not index.precedes(x, z):
+                        return False
         return True
 
     def precedence_asymmetry_axiom(self, structure):
@@ -427,19 +424,20 @@ class ConstituentStructures:
         (Carnie 2010, p. 43)
         :param structure:
         """
-        for x in structure:
-            for y in structure:
-                if self.precedes(x, y, structure):
-                    if self.precedes(y, x, structure):
-                        return False
+        index = self.index(structure)
+        for x in index.nodes:
+            for y in index.nodes:
+                if index.precedes(x, y) and index.precedes(y, x):
+                    return False
         return True
 
     def precedence_irreflexivity_axiom(self, structure):
         """ (T1) P is irreflexive: for all x in N [ not x precedes x] (Carnie 2010, p.43)
         :param structure:
         """
-        for x in structure:
-            if self.precedes(x, x, structure):
+        index = self.index(structure)
+        for x in index.nodes:
+            if index.precedes(x, x):
                 return False
         return True
 
@@ -448,10 +446,11 @@ class ConstituentStructures:
         (Carnie 2010, p. 43)
         :param structure:
         """
-        for x in structure:
-            for y in structure:
-                if self.precedes(x, y, structure) or self.precedes(y, x, structure):
-                    if self.dominates(x, y) or self.dominates(y, x):
+        index = self.index(structure)
+        for x in index.nodes:
+            for y in index.nodes:
+                if index.precedes(x, y) or index.precedes(y, x):
+                    if index.dominates(x, y) or index.dominates(y, x):
                         return False
         return True
 
@@ -460,16 +459,15 @@ class ConstituentStructures:
         (Carnie 2010, p. 43)
         :param structure:
         """
-
-        for w in structure:
-            for x in structure:
-                if self.precedes(w, x, structure):
-                    for y in structure:
-                        if self.dominates(w, y):
-                            for z in structure:
-                                if self.dominates(x, z):
-                                    if not self.precedes(y, z, structure):
-                                        return False
+        index = self.index(structure)
+        for w in index.nodes:
+            ys = index.dominated_by(w)
+            for x in index.nodes:
+                if index.precedes(w, x):
+                    for y in ys:
+                        for z in index.dominated_by(x):
+                            if not index.precedes(y, z):
+                                return False
         return True
 
 
@@ -502,13 +500,7 @@ class ConstituentStructures:
         :param B:
         :param structure:
         """
-        if self.dominates(A, B) or self.dominates(B, A):
-            return False
-        for g in structure:
-            if self.properly_dominates(g, A):
-                if not self.properly_dominates(g, B):
-                    return False
-        return True
+        return self.index(structure).c_commands(A, B)
 
     def symmetric_c_command(self, A, B, structure):
         """ (17) A symmetrically c-commands B, if A c-commands B and B c-commands A. (Carnie 2010, p. 52)
@@ -965,66 +957,54 @@ class ConstituentStructures:
         d(A) is an image of A, where each edge is described by their corresponding terminals.
             Carnie is a bit unspecific with this, I cannot say what should be done when there are several terminals
              dominated by a node. It seems that they are omitted from d(A), so I do so.
+        See lca for the pairs that prevent linear ordering.
         :param structure:
+        :return: list of terminals in linear order, or empty list if d(A) is not a linear ordering
         """
+        linearization = self.lca(structure)
+        if not linearization:
+            print(linearization.report())
+            return []
+        return linearization.order
 
-        def get_terminals(x):
-            """
+    def lca(self, structure) -> Linearization:
+        """ Linearize terminals by d(A) as in linear_correspondence_axiom. d(A) is built once as
+        a graph of terminals and sorted topologically.
+        :param structure:
+        :return: Linearization, with unresolved and symmetric pairs of terminals if d(A) is
+        not a linear ordering.
+        """
+        index = self.index(structure)
 
-            :param x:
-            :return:
-            """
-            terminals = []
-            for t in structure:
-                if self.dominates(x, t) and self.is_terminal_node(t, structure):
-                    terminals.append(t)
-            return terminals
-
-
-        T = set()
-        for t in structure:
-            if self.is_terminal_node(t, structure):
-                T.add(t)
-
-        A = set()
-        for a in structure:
-            seconds = self.asymmetric_immediate_dominance_c_command(A, structure)
-            for s in seconds:
-                A.add((a, s))
-
-        dA = set()
-        for (a, b) in A:
-            at = get_terminals(a)
-            if len(at) > 1:
+        # the terminal of each node that dominates exactly one terminal, None for others
+        sole_terminal = {}
+        for node in index.bottom_up():
+            daughters = index.daughters(node)
+            if not daughters:
+                sole_terminal[id(node)] = node
                 continue
-            bt = get_terminals(b)
-            if len(bt) > 1:
-                continue
-            dA.add((at[0], bt[0]))
-
-        # now we have sorted pairs of terminals. now these need to be sorted into one list,
-        # and check if there are unresolved orderings.
-
-        def sort_func(x, y):
-            """
-
-            :param x:
-            :param y:
-            :return: :raise ValueError:
-            """
-            for first, second in dA:
-                if first == x and second == y:
-                    return -1
-                elif first == y and second == x:
-                    return 1
-            print("failed to sort '%s' and '%s'" % (x, y))
-            raise ValueError
+            terminals = [sole_terminal.get(id(d)) for d in daughters]
+            first = terminals[0]
+            sole_terminal[id(node)] = first if all(t is first for t in terminals) else None
+
+        # c-commanded nodes are found under the mother, collect candidates once for each mother
+        candidates = {}
+
+        def dA():
+            for a in index.nodes:
+                x = sole_terminal[id(a)]
+                mothers = index.mothers(a)
+                if x is None or not mothers:
+                    continue
+                mother = mothers[0]
+                if id(mother) not in candidates:
+                    candidates[id(mother)] = [b for b in index.dominated_by(mother) if
+                                              sole_terminal[id(b)] is not None]
+                for b in candidates[id(mother)]:
+                    if index.c_commands(a, b) and not index.c_commands(b, a):
+                        yield x, sole_terminal[id(b)]
 
-        try:
-            result = sorted(T, sort_func)
-        except ValueError:
-            result = []
-        return result
+        return linearize(index.terminals, dA())
 
 
     def excludes(self, X, Y, structure):
@@ -1135,39 +1115,23 @@ class ConstituentStructures:
         return delta
 
     def bare_phrase_lca(self, structure):
-        """
-
+        """ Terminals ordered by asymmetric c-command. Terminals that don't c-command each other
+        stay in their order in structure.
         :param structure:
         :return: list[Constituent]
         :raise ValueError:
         """
-        equals = []
-
-        def sorting_function(x, y):
-            """
-
-            :param x:
-            :param y:
-            :return:
-            """
-            xy = self.c_command(x, y, structure)
-            yx = self.c_command(y, x, structure)
-            if xy and yx:
-                equals.append((x, y))
-                return 0
-            elif xy:
-                return -1
-            elif yx:
-                return 1
-            return 0
-
-        T = [n for n in structure if self.is_terminal(n, structure)]
-        T.sort(sorting_function)
+        index = self.index(structure)
+        T = index.terminals
+        pairs = [(x, y) for x in T for y in index.c_commanded(x) if index.is_terminal(y)]
+        linearization = linearize(T, pairs, total=False)
+        if linearization.cyclic:
+            raise ValueError(linearization.report())
         # make sure that if elements are symmetrically commanded at least another of them is silent anyways
-        for x, y in equals:
+        for x, y in linearization.symmetric:
             if not (self.isSilent(x, structure) or self.isSilent(y, structure)):
-                raise ValueError
-        return T
+                raise ValueError(linearization.report())
+        return linearization.order
 
 
     def feature_check(self, left, right):
@@ -1220,10 +1184,10 @@ class ConstituentStructures:
         :param B:
         :param context:
             my implementation of FL tries to do without constituents having access to their parents """
-        closest_parents = _closest_parents(A, context, parent_list=[])
+        index = self.index(context)
         # if 'closest_parent' for B is found within (other edge of) closest_parent, B sure is dominated by it.
-        for parent in closest_parents:
-            if B in parent:
+        for parent in index.mothers(A):
+            if index.dominates(parent, B):
                 return True
         return False
 
@@ -1243,7 +1207,7 @@ class ConstituentStructures:
         :param A:
         :param context:
         """
-        closest_parents = _closest_parents(A, context, parent_list=[])
+        closest_parents = self.index(context).mothers(A)
         result = []
         for p in closest_parents:
             if p.left == A:
@@ -1258,18 +1222,14 @@ class ConstituentStructures:
         :param context:
         """
         result = []
+        index = self.index(context)
 
         def _downward(item, A, result):
-            if item.left:
-                if not self.CCommands(item.left, A, context):
-                    result.append(item.left)
-                else:
-                    result = _downward(item.left, A, result)
-            if item.right:
-                if not self.CCommands(item.right, A, context):
-                    result.append(item.right)
+            for child in index.daughters(item):
+                if not self.CCommands(child, A, context):
+                    result.append(child)
                 else:
-                    result = _downward(item.right, A, result)
+                    result = _downward(child, A, result)
             return result
 
         ccommanded = self.getCCommanded(A, context)
@@ -1389,12 +1349,12 @@ class ConstituentStructures:
 def _closest_parents(A, context, is_not=None, parent_list=None):
     if not parent_list:
         parent_list = []
-    if context.left == A or context.right == A:
-        parent_list.append(context)
-    if context.left and not context.left == is_not:
-        parent_list = _closest_parents(A, context.left, is_not=is_not, parent_list=parent_list)
-    if context.right and not context.right == is_not:
-        parent_list = _closest_parents(A, context.right, is_not=is_not, parent_list=parent_list)
+    index = StructureIndex(context)
+    for parent in index.mothers(A):
+        # parts of context under is_not are not looked into
+        if is_not is not None and is_not is not context and index.dominates(is_not, parent):
+            continue
+        parent_list.append(parent)
     return parent_list
 
 
@@ -0,0 +1,110 @@
+# coding=utf-8
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+
+from collections import deque
+
+
+class Linearization:
+    """ Result of linearizing terminals. If ordering pairs don't make a linear order, the pairs
+    and terminals that prevent it are listed instead of the whole linearization failing.
+    """
+
+    def __init__(self, order, symmetric, unresolved, cyclic):
+        self.order = order  # terminals in linear order, as far as they could be ordered
+        self.symmetric = symmetric  # (x, y) -pairs that are ordered both ways
+        self.unresolved = unresolved  # (x, y) -pairs that are not ordered either way
+        self.cyclic = cyclic  # terminals in or after a cycle of orderings, missing from order
+
+    def is_linear(self) -> bool:
+        """ Ordering pairs are a linear ordering of the terminals, as LCA requires.
+        :return: bool
+        """
+        return not (self.symmetric or self.unresolved or self.cyclic)
+
+    __bool__ = is_linear
+
+    def report(self) -> str:
+        """
+        :return: str, description of problems, empty if there are none
+        """
+        lines = []
+        for x, y in self.symmetric:
+            lines.append("'%s' and '%s' are ordered both ways" % (x, y))
+        for x, y in self.unresolved:
+            lines.append("failed to sort '%s' and '%s'" % (x, y))
+        if self.cyclic:
+            lines.append('ordering of %s is cyclic' % ', '.join("'%s'" % x for x in self.cyclic))
+        return '\n'.join(lines)
+
+
+def linearize(items, pairs, total=True) -> Linearization:
+    """ Sort items topologically by ordering pairs. Takes O(V+E) time, except that finding
+    unresolved pairs takes O(V^2) when there are any.
+    Pairs that are ordered both ways are reported as symmetric and left out of sorting.
+    Items that have no order between them are kept in their given order.
+    :param items: items to sort, e.g. terminals in their order in structure. Items are
+    recognized by identity.
+    :param pairs: iterable of (x, y) -pairs, where x should precede y
+    :param total: each pair of items should be ordered. If not, unordered pairs are not
+    reported as unresolved.
+    :return: Linearization
+    """
+    keys = {id(item): i for i, item in enumerate(items)}
+    edges = {}  # dict keeps the pairs in given order
+    for x, y in pairs:
+        if x is not y:
+            edges[keys[id(x)], keys[id(y)]] = True
+    symmetric = []
+    succ = [[] for item in items]
+    in_degree = [0] * len(items)
+    related = 0
+    for x, y in edges:
+        if (y, x) in edges:
+            if x < y:
+                symmetric.append((items[x], items[y]))
+                related += 1
+            continue
+        succ[x].append(y)
+        in_degree[y] += 1
+        related += 1
+
+    order = []
+    queue = deque(i for i, degree in enumerate(in_degree) if not degree)
+    while queue:
+        x = queue.popleft()
+        order.append(items[x])
+        for y in succ[x]:
+            in_degree[y] -= 1
+            if not in_degree[y]:
+                queue.append(y)
+    cyclic = [items[i] for i, degree in enumerate(in_degree) if degree]
+
+    unresolved = []
+    n = len(items)
+    if total and related < n * (n - 1) // 2:
+        for x in range(n):
+            for y in range(x + 1, n):
+                if (x, y) not in edges and (y, x) not in edges:
+                    unresolved.append((items[x], items[y]))
+    return Linearization(order, symmetric, unresolved, cyclic)
@@ -0,0 +1,307 @@
+# coding=utf-8
+# ############################################################################
+#
+# *** Kataja - Biolinguistic Visualization tool ***
+#
+# Copyright 2013 Jukka Purma
+#
+# This file is part of Kataja.
+#
+# Kataja is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Kataja is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Kataja.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ############################################################################
+
+from bisect import bisect_left, bisect_right
+
+
+def get_children(node):
+    """ Children of constituent in their order: parts of constituents that have parts, left and
+    right of older binary constituents.
+    :param node:
+    :return: list
+    """
+    parts = getattr(node, 'parts', None)
+    if parts is not None:
+        return list(parts)
+    return [child for child in (getattr(node, 'left', None), getattr(node, 'right', None)) if
+            child]
+
+
+def is_constituent(structure):
+    return hasattr(structure, 'parts') or hasattr(structure, 'left')
+
+
+class StructureIndex:
+    """ Dominance, sisterhood, c-command and precedence relations of a constituent structure,
+    computed in one left-to-right walk. Each position of a node in the walk gets an interval
+    (enter, exit), and A dominates B iff an interval of B is inside an interval of A. A node that
+    is merged in several positions is walked in each of them, like in set containment, so it has
+    one interval for each position. For ordinary trees the queries are O(1).
+
+    Nodes are recognized by identity, not by equality.
+
+    Structure can be the root constituent or a collection of constituents. In the latter case
+    the nodes that are not children of other nodes in the collection are roots, and they are
+    walked in the given order.
+    """
+
+    def __init__(self, structure, children=get_children):
+        self.children = children
+        self.nodes = []  # in the order of their first position
+        self.terminals = []  # in the order of their first position, i.e. left to right
+        self.roots = []
+        self.cyclic = False  # a node was found to contain itself, such parts are not walked
+        self._intervals = {}  # id -> list of (enter, exit, root number), one for each position
+        self._mothers = {}  # id -> list of mothers, in the order they were met
+        self._mother_ids = {}  # id -> set of ids of mothers
+        self._daughters = {}  # id -> list of children
+        self._depth = {}  # id -> depth of the shallowest position
+        self._enters = []  # enter of each position, ascending
+        self._positions = []  # node in each position, parallel to _enters
+        if is_constituent(structure):
+            self.roots = [structure]
+        else:
+            items = list(structure)
+            child_ids = {id(child) for item in items for child in children(item)}
+            self.roots = [item for item in items if id(item) not in child_ids]
+            if items and not self.roots:
+                self.cyclic = True
+                self.roots = [items[0]]
+        self._build()
+
+    def _build(self):
+        counter = 0
+        for root_n, root in enumerate(self.roots):
+            self._add_position(root, None, 0, counter)
+            stack = [(root, 0, counter, iter(self._daughters[id(root)]))]
+            on_path = {id(root)}
+            counter += 1
+            while stack:
+                node, depth, enter, children = stack[-1]
+                child = next(children, None)
+                if child is not None:
+                    if id(child) in on_path:
+                        self.cyclic = True
+                        continue
+                    self._add_position(child, node, depth + 1, counter)
+                    on_path.add(id(child))
+                    stack.append((child, depth + 1, counter, iter(self._daughters[id(child)])))
+                    counter += 1
+                else:
+                    stack.pop()
+                    on_path.discard(id(node))
+                    self._intervals[id(node)].append((enter, counter, root_n))
+                    counter += 1
+
+    def _add_position(self, node, mother, depth, enter):
+        key = id(node)
+        if key not in self._intervals:
+            self.nodes.append(node)
+            self._intervals[key] = []
+            self._mothers[key] = []
+            self._mother_ids[key] = set()
+            self._daughters[key] = self.children(node)
+            self._depth[key] = depth
+            if not self._daughters[key]:
+                self.terminals.append(node)
+        elif depth < self._depth[key]:
+            self._depth[key] = depth
+        if mother is not None and id(mother) not in self._mother_ids[key]:
+            self._mothers[key].append(mother)
+            self._mother_ids[key].add(id(mother))
+        self._enters.append(enter)
+        self._positions.append(node)
+
+    def __contains__(self, node):
+        return id(node) in self._intervals
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # ## Dominance
+
+    def dominates(self, a, b) -> bool:
+        """ Reflexive dominance: a dominates b if b is a or b is inside a.
+        :param a:
+        :param b:
+        """
+        if a is b:
+            return True
+        ia = self._intervals.get(id(a))
+        ib = self._intervals.get(id(b))
+        if not (ia and ib):
+            return False
+        if len(ia) == 1 and len(ib) == 1:
+            a_enter, a_exit, a_root = ia[0]
+            b_enter, b_exit, b_root = ib[0]
+            return a_enter < b_enter and b_exit < a_exit
+        for a_enter, a_exit, a_root in ia:
+            for b_enter, b_exit, b_root in ib:
+                if a_enter < b_enter and b_exit < a_exit:
+                    return True
+        return False
+
+    def properly_dominates(self, a, b) -> bool:
+        """
+        :param a:
+        :param b:
+        """
+        return a is not b and self.dominates(a, b)
+
+    def immediately_dominates(self, a, b) -> bool:
+        """ a is a mother of b
+        :param a:
+        :param b:
+        """
+        return id(a) in self._mother_ids.get(id(b), ())
+
+    def mothers(self, node) -> list:
+        """
+        :param node:
+        :return: list of nodes that immediately dominate node
+        """
+        return self._mothers.get(id(node), [])
+
+    def daughters(self, node) -> list:
+        """
+        :param node:
+        :return: list of children of node, in order
+        """
+        key = id(node)
+        if key in self._daughters:
+            return self._daughters[key]
+        return self.children(node)
+
+    def depth(self, node) -> int:
+        """
+        :param node:
+        :return: distance of node from its root, or None if node is not in structure
+        """
+        return self._depth.get(id(node), None)
+
+    def is_terminal(self, node) -> bool:
+        """
+        :param node:
+        """
+        return not self.daughters(node)
+
+    def dominated_by(self, node) -> list:
+        """ Nodes dominated by node, including itself, in the order of their first position
+        within node.
+        :param node:
+        :return: list
+        """
+        found = []
+        done = set()
+        for enter, exit_, root_n in self._intervals.get(id(node), ()):
+            start = bisect_left(self._enters, enter)
+            end = bisect_right(self._enters, exit_)
+            for other in self._positions[start:end]:
+                if id(other) not in done:
+                    done.add(id(other))
+                    found.append(other)
+        return found
+
+    def bottom_up(self) -> list:
+        """ Nodes so that each node comes after all of the nodes it dominates.
+        :return: list
+        """
+        found = []
+        done = set()
+        # in reversed walk, inner positions of a node's last position are met before it
+        for node in reversed(self._positions):
+            if id(node) not in done:
+                done.add(id(node))
+                found.append(node)
+        return found
+
+    def terminals_of(self, node) -> list:
+        """
+        :param node:
+        :return: terminals dominated by node, left to right
+        """
+        return [other for other in self.dominated_by(node) if not self.daughters(other)]
+
+    # ## Sisterhood
+
+    def is_sister(self, a, b) -> bool:
+        """ a and b are immediately dominated by the same node. Like in Carnie's definition, any
+        node that has a mother is a sister of itself.
+        :param a:
+        :param b:
+        """
+        ma = self._mother_ids.get(id(a))
+        mb = self._mother_ids.get(id(b))
+        return bool(ma and mb and not ma.isdisjoint(mb))
+
+    def sisters(self, node) -> list:
+        """
+        :param node:
+        :return: other children of the mothers of node
+        """
+        found = []
+        for mother in self.mothers(node):
+            for daughter in self.daughters(mother):
+                if daughter is not node and daughter not in found:
+                    found.append(daughter)
+        return found
+
+    # ## C-command
+
+    def c_commands(self, a, b) -> bool:
+        """ (Carnie 2010, p. 54) Every node properly dominating a also properly dominates b,
+        and neither a nor b dominates the other. It is enough to look at mothers of a.
+        :param a:
+        :param b:
+        """
+        if self.dominates(a, b) or self.dominates(b, a):
+            return False
+        for mother in self.mothers(a):
+            if not self.dominates(mother, b):
+                return False
+        return True
+
+    def asymmetrically_c_commands(self, a, b) -> bool:
+        """
+        :param a:
+        :param b:
+        """
+        return self.c_commands(a, b) and not self.c_commands(b, a)
+
+    def c_commanded(self, node) -> list:
+        """ All nodes c-commanded by node. Nodes in other trees of a collection are not included.
+        :param node:
+        :return: list
+        """
+        mothers = self.mothers(node)
+        if not mothers:
+            return []
+        return [other for other in self.dominated_by(mothers[0]) if self.c_commands(node, other)]
+
+    # ## Precedence
+
+    def precedes(self, a, b) -> bool:
+        """ (Carnie 2010, p. 40) Neither a nor b dominates the other and some node dominating a
+        sister-precedes some node dominating b: a position of a is walked before a position of b
+        in the same tree.
+        :param a:
+        :param b:
+        """
+        if self.dominates(a, b) or self.dominates(b, a):
+            return False
+        for a_enter, a_exit, a_root in self._intervals.get(id(a), ()):
+            for b_enter, b_exit, b_root in self._intervals.get(id(b), ()):
+                if a_root == b_root and a_exit < b_enter:
+                    return True
+        return False
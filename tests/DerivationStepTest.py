@@ -0,0 +1,247 @@
+import random
+import sys
+import unittest
+
+from PyQt5 import QtWidgets, QtGui
+
+import kataja.globals as g
+from kataja.singletons import ctrl, classes, prefs, qt_prefs, running_environment, log
+from kataja.SavedObject import SavedObject
+from kataja.SavedField import SavedField
+
+__author__ = 'purma'
+
+
+class DisplayUI:
+    """ Stands for UIManager: forest drawing asks it about selections and ui items of nodes """
+    selection_group = None
+
+    def update_position_for(self, item):
+        pass
+
+    def remove_ui_for(self, item):
+        pass
+
+    def add_message(self, msg, level=None):
+        pass
+
+
+class DisplayMain(SavedObject):
+    """ Stands for KatajaMain: graph scene, settings and forest without the main window and
+    its panels """
+    unique = True
+
+    def __init__(self):
+        from kataja.saved.Forest import Forest
+        from kataja.saved.KatajaDocument import KatajaDocument
+        from kataja.Settings import Settings
+        from kataja.PaletteManager import PaletteManager
+        from kataja.GraphScene import GraphScene
+        from kataja.GraphView import GraphView
+        super().__init__()
+        self.forest = None
+        self.forest_keeper = None
+        self.fontdb = QtGui.QFontDatabase()
+        self.color_manager = PaletteManager()
+        self.settings_manager = Settings()
+        ctrl.late_init(self)
+        classes.late_init()
+        prefs.import_node_classes(classes)
+        prefs.load_preferences(disable=True)
+        qt_prefs.late_init(running_environment, prefs, self.fontdb, log)
+        self.settings_manager.set_prefs(prefs)
+        self.graph_scene = GraphScene(main=self, graph_view=None)
+        self.graph_view = GraphView(main=self, graph_scene=self.graph_scene)
+        self.graph_scene.graph_view = self.graph_view
+        self.ui_manager = DisplayUI()
+        self.forest_keeper = KatajaDocument()
+        self.settings_manager.set_document(self.forest_keeper)
+        self.forest = Forest()
+        self.settings_manager.set_forest(self.forest)
+
+    forest_keeper = SavedField("forest_keeper")
+    forest = SavedField("forest")
+
+
+def build_derivation(dsm, steps, seed=1):
+    """ Random derivation where new lexical items are merged to the tree, parts of the tree
+    are merged again, features check each other and sometimes a second tree is built.
+    Objects are edited in place between steps, as plugins do.
+    :param dsm: DerivationStepManager
+    :param steps: number of derivation steps
+    :param seed:
+    :return: None
+    """
+    rnd = random.Random(seed)
+    Constituent = classes.get('Constituent')
+    Feature = classes.get('Feature')
+    counter = [0]
+
+    def lexical_item():
+        counter[0] += 1
+        features = [Feature(name=rnd.choice(['D', 'N', 'V', 'case', 'phi']),
+                            value=rnd.choice(['', '=', 'u'])) for i in range(rnd.randint(0, 2))]
+        return Constituent(label='w%s' % counter[0], features=features)
+
+    def parts_of(tree):
+        result = [tree]
+        for part in tree.parts:
+            result += parts_of(part)
+        return result
+
+    trees = [lexical_item()]
+    for step in range(steps):
+        action = rnd.random()
+        tree = trees[-1]
+        if action < 0.5:
+            other = lexical_item()
+            parts = [other, tree] if rnd.random() < 0.5 else [tree, other]
+            trees[-1] = Constituent(label=other.label, parts=parts)
+        elif action < 0.65 and tree.parts:
+            mover = rnd.choice(parts_of(tree)[1:])
+            trees[-1] = Constituent(label=tree.label, parts=[mover, tree])
+        elif action < 0.8:
+            # moved parts are in the tree more than once
+            features = list({id(f): f for part in parts_of(tree) for f in part.features}.values())
+            if len(features) > 1:
+                checker, checked = rnd.sample(features, 2)
+                checker.checks = checked
+        elif action < 0.9:
+            tree.label = tree.label + "'"
+        elif len(trees) < 2:
+            trees.append(lexical_item())
+        else:
+            first, second = trees
+            trees = [Constituent(label=second.label, parts=[first, second])]
+        dsm.save_and_create_derivation_step(list(trees), msg='step %s' % step)
+
+
+def node_key(node):
+    if node.syntactic_object:
+        return node.node_type, str(node.syntactic_object.uid)
+    # gloss and such
+    return node.node_type, ''
+
+
+def snapshot(forest):
+    """ Nodes, edges and heads of the forest in a comparable form
+    :param forest:
+    :return: tuple
+    """
+    nodes = sorted(node_key(node) for node in forest.nodes.values())
+    edges = sorted((edge.edge_type, node_key(edge.start), node_key(edge.end)) for edge in
+                   forest.edges.values())
+    heads = sorted((node_key(node), tuple(sorted(node_key(head) for head in node.heads))) for
+                   node in forest.nodes.values() if node.node_type == g.CONSTITUENT_NODE)
+    return nodes, edges, heads
+
+
+class TestDerivationStepDiff(unittest.TestCase):
+    """ Moving between derivation steps updates only nodes of objects that have changed.
+    Result should be the same as when all nodes and edges are checked. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+        cls._main = DisplayMain()
+
+    def setUp(self):
+        self._old_main = ctrl.main
+        ctrl.main = self._main
+        ctrl.disable_undo()
+        self.steps = 24
+        self.expected = {}
+        forest = self.new_forest()
+        build_derivation(forest.derivation_steps, self.steps)
+        # expected results are computed from the whole forest in a forest of their own
+        self.frozen = forest.derivation_steps.derivation_steps, \
+            forest.derivation_steps.frozen_objects
+        for i in range(self.steps):
+            forest.derivation_steps._shown = None
+            forest.derivation_steps.jump_to_derivation_step(i)
+            self.expected[i] = snapshot(forest)
+
+    def tearDown(self):
+        ctrl.resume_undo()
+        ctrl.main = self._old_main
+
+    def new_forest(self):
+        from kataja.saved.Forest import Forest
+        forest = Forest()
+        self._main.forest = forest
+        self._main.settings_manager.set_forest(forest)
+        return forest
+
+    def step_through(self, path, edit=None):
+        """ Show steps of path in a new forest, comparing each to the expected result
+        :param path: list of step indices
+        :param edit: optional function to call with the forest after each step
+        :return: None
+        """
+        forest = self.new_forest()
+        dsm = forest.derivation_steps
+        dsm.derivation_steps, dsm.frozen_objects = self.frozen
+        for i in path:
+            dsm.jump_to_derivation_step(i)
+            self.assertEqual(snapshot(forest), self.expected[i], 'step %s' % i)
+            dsm._prefetch_neighbours()
+            if edit:
+                edit(forest)
+
+    def test_forward(self):
+        self.step_through(range(self.steps))
+
+    def test_backward(self):
+        self.step_through(reversed(range(self.steps)))
+
+    def test_random(self):
+        rnd = random.Random(2)
+        self.step_through([rnd.randrange(self.steps) for i in range(60)])
+
+    def test_delete_and_create_between_steps(self):
+        """ Replacing a leaf with a new node keeps the number of nodes and edges the same, but
+        they are no longer as the previous step left them """
+
+        def replace_leaf(forest):
+            for node in list(forest.nodes.values()):
+                if node.node_type == g.CONSTITUENT_NODE and len(node.edges_up) == 1 and \
+                        not node.edges_down:
+                    parent = node.edges_up[0].start
+                    forest.free_drawing.delete_node(node, fade=False)
+                    new_node = forest.free_drawing.create_node(node_type=g.CONSTITUENT_NODE,
+                                                               pos=(0, 0))
+                    forest.free_drawing.connect_node(parent, new_node)
+                    return
+
+        self.step_through(range(self.steps), edit=replace_leaf)
+
+    def test_edited_objects_are_restored_again(self):
+        """ Objects edited while their step is shown are restored from their frozen state when
+        the step is shown again, whether undo manager has taken a snapshot of the edit or it is
+        still in undo pile """
+        forest = self.new_forest()
+        dsm = forest.derivation_steps
+        dsm.derivation_steps, dsm.frozen_objects = self.frozen
+
+        def labels():
+            return {node.syntactic_object.uid: node.syntactic_object.label for node in
+                    forest.nodes.values() if node.node_type == g.CONSTITUENT_NODE}
+
+        for take_snapshot in (True, False):
+            dsm.jump_to_derivation_step(10)
+            original = labels()
+            ctrl.resume_undo()
+            for node in forest.nodes.values():
+                if node.node_type == g.CONSTITUENT_NODE:
+                    node.syntactic_object.label += ' edited'
+            if take_snapshot:
+                forest.undo_manager.take_snapshot('edit labels')
+            ctrl.disable_undo()
+            dsm.jump_to_derivation_step(11)
+            dsm.jump_to_derivation_step(10)
+            self.assertEqual(labels(), original)
+        forest.undo_manager.flush_pile()
+
+
+if __name__ == '__main__':
+    unittest.main()
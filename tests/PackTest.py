@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from kataja.singletons import ctrl, classes
+from kataja.SavedObject import SavedObject
+from kataja.SavedField import SavedField
+from kataja.KatajaPack import save_pack, PackReader
+
+__author__ = 'purma'
+
+
+class PackMain(SavedObject):
+    """ Stands for KatajaMain: the root of saved objects, without the user interface """
+    unique = True
+
+    def __init__(self):
+        super().__init__()
+        self.forest = None
+        self.forest_keeper = None
+
+    forest_keeper = SavedField("forest_keeper")
+    forest = SavedField("forest")
+
+
+class TestPackRoundTrip(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        classes.late_init()
+
+    def setUp(self):
+        self._old_main = ctrl.main
+        ctrl.disable_undo()
+        fd, self.filename = tempfile.mkstemp(suffix='.kpack')
+        os.close(fd)
+
+    def tearDown(self):
+        ctrl.resume_undo()
+        ctrl.main = self._old_main
+        os.remove(self.filename)
+
+    def save_document(self):
+        from kataja.saved.KatajaDocument import KatajaDocument
+        from kataja.saved.Forest import Forest
+        main = PackMain()
+        ctrl.main = main
+        document = KatajaDocument()
+        main.forest_keeper = document
+        document.forests.append(Forest())
+        word = classes.get('Constituent')(label='word')
+        document.lexicon = {'word': word}
+        for forest in document.forests:
+            # forest record refers to an object that is saved in the header
+            forest.others = {word.uid: word}
+            forest.gloss_text = 'gloss %s' % forest.uid
+        save_pack(self.filename, main)
+        return main
+
+    def open_document(self, uid):
+        main = PackMain()
+        main.uid = uid
+        ctrl.main = main
+        reader = PackReader(self.filename)
+        placeholders = reader.restore_header(main)
+        main.forest_keeper.lazy_forests = {forest: reader for forest in placeholders.values()}
+        return main
+
+    def test_lazy_forest_keeps_references_to_header(self):
+        old_main = self.save_document()
+        old_document = old_main.forest_keeper
+        main = self.open_document(old_main.uid)
+        document = main.forest_keeper
+        self.assertIsNot(document, old_document)
+        self.assertEqual(len(document.forests), 2)
+        word = document.lexicon['word']
+        self.assertEqual(word.label, 'word')
+        for old_forest, forest in zip(old_document.forests, document.forests):
+            self.assertIn(forest, document.lazy_forests)
+            self.assertEqual(forest.gloss_text, '')
+            document.load_lazy_forest(forest)
+            self.assertNotIn(forest, document.lazy_forests)
+            self.assertEqual(forest.gloss_text, old_forest.gloss_text)
+            self.assertIs(forest.others[word.uid], word)
+
+
+if __name__ == '__main__':
+    unittest.main()
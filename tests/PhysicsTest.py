@@ -0,0 +1,127 @@
+import random
+import unittest
+
+from kataja.singletons import prefs
+from kataja.BatchPhysics import BatchPhysics
+from kataja.visualizations.SymmetricElasticTree import SymmetricElasticTree
+from kataja.visualizations.EquidistantElasticTree import EquidistantElasticTree
+
+__author__ = 'purma'
+
+
+class PhysicsNode:
+    """ Has the attributes of Node that physics reads """
+
+    def __init__(self, x, y, width, height):
+        self.current_position = (x, y)
+        self.centered_position = (x, y)
+        self.width = width
+        self.height = height
+        self.physics_x = True
+        self.physics_y = True
+        self._gravity = 0
+        self.edges_up = []
+        self.edges_down = []
+        self.locked_to_node = None
+
+    def use_physics(self):
+        return (self.physics_x or self.physics_y) and not self.locked_to_node
+
+
+class PhysicsEdge:
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.pull = 0.4
+        start.edges_down.append(self)
+        end.edges_up.append(self)
+
+    @property
+    def start_point(self):
+        return self.start.centered_position
+
+    @property
+    def end_point(self):
+        return self.end.centered_position
+
+
+class PhysicsForest:
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def visible_nodes(self):
+        return iter(self.nodes)
+
+
+def build_forest(count, seed=1):
+    """ Random binary tree with nodes scattered so that many of them overlap or are within
+    repulsion range of each other.
+    :param count: number of nodes
+    :param seed:
+    :return: PhysicsForest
+    """
+    rnd = random.Random(seed)
+    nodes = [PhysicsNode(rnd.uniform(-300, 300), rnd.uniform(-200, 200), rnd.choice([20, 30, 40]),
+                         rnd.choice([16, 20])) for i in range(count)]
+    for i, node in enumerate(nodes[1:], 1):
+        PhysicsEdge(nodes[(i - 1) // 2], node)
+    nodes[5].locked_to_node = nodes[2]
+    nodes[7].physics_x = False
+    return PhysicsForest(nodes)
+
+
+@unittest.skipUnless(BatchPhysics.available(), 'batch physics requires NumPy')
+class TestBatchPhysics(unittest.TestCase):
+    """ Batch movement should be the same as scalar movement computed for each node from the
+    same positions. BaseVisualization is not compared: its scalar version moves the node
+    between attraction and repulsion. """
+
+    def setUp(self):
+        self._batch_physics = prefs.batch_physics
+
+    def tearDown(self):
+        prefs.batch_physics = self._batch_physics
+
+    def compare(self, visualization_class, block_size):
+        forest = build_forest(60)
+        vis = visualization_class()
+        vis.forest = forest
+        prefs.batch_physics = False
+        self.assertIsNone(vis.prepare_frame())
+        scalar = {node: vis.calculate_movement(node) for node in forest.nodes}
+        batch = BatchPhysics(vis)
+        batch.block_size = block_size
+        result = batch.step(forest.nodes)
+        for node in forest.nodes:
+            sx, sy, sz = scalar[node]
+            bx, by, bz = result[node]
+            self.assertAlmostEqual(sx, bx, places=6)
+            self.assertAlmostEqual(sy, by, places=6)
+
+    def test_symmetric_all_pairs(self):
+        self.compare(SymmetricElasticTree, 512)
+
+    def test_symmetric_grid(self):
+        self.compare(SymmetricElasticTree, 8)
+
+    def test_equidistant_all_pairs(self):
+        self.compare(EquidistantElasticTree, 512)
+
+    def test_equidistant_grid(self):
+        self.compare(EquidistantElasticTree, 8)
+
+    def test_no_physics(self):
+        forest = build_forest(60)
+        for node in forest.nodes:
+            node.physics_x = node.physics_y = False
+        vis = SymmetricElasticTree()
+        vis.forest = forest
+        prefs.batch_physics = True
+        self.assertEqual(vis.prepare_frame(), {})
+        self.assertIsNone(vis._batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import random
+import sys
+import unittest
+
+from PyQt5 import QtWidgets
+
+import kataja.globals as g
+from kataja.errors import ForestError
+from kataja.singletons import ctrl
+from tests.DerivationStepTest import DisplayMain
+
+__author__ = 'purma'
+
+
+def structure(forest):
+    """ Nodes, edges and their connections in a comparable form
+    :param forest:
+    :return: tuple
+    """
+    nodes = sorted((node.uid, tuple(edge.uid for edge in node.edges_up),
+                    tuple(edge.uid for edge in node.edges_down)) for node in
+                   forest.nodes.values())
+    edges = sorted((edge.uid, edge.start and edge.start.uid, edge.end and edge.end.uid) for
+                   edge in forest.edges.values())
+    return nodes, edges
+
+
+class TestUndoRoundTrip(unittest.TestCase):
+    """ Undoing every step and redoing them again passes through the same states as the
+    original edits. One undo step may delete an edge and nodes on both of its ends,
+    and their edge lists are restored in the same step. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+        cls._main = DisplayMain()
+
+    def setUp(self):
+        self._old_main = ctrl.main
+        ctrl.main = self._main
+
+    def tearDown(self):
+        ctrl.main = self._old_main
+
+    def edit_randomly(self, seed, steps=20):
+        """ Create, connect and delete nodes and edges in a new forest, taking undo snapshot
+        after each edit
+        :param seed:
+        :param steps: number of edits
+        :return: list of structures, first is the empty forest
+        """
+        from kataja.saved.Forest import Forest
+        ctrl.disable_undo()
+        forest = Forest()
+        self._main.forest = forest
+        self._main.settings_manager.set_forest(forest)
+        forest.undo_manager.flush_pile()
+        ctrl.resume_undo()
+        free_drawing = forest.free_drawing
+        rnd = random.Random(seed)
+        states = [structure(forest)]
+        for i in range(steps):
+            nodes = list(forest.nodes.values())
+            action = rnd.random()
+            if action < 0.35 or len(nodes) < 2:
+                free_drawing.create_node(node_type=g.CONSTITUENT_NODE,
+                                         pos=(rnd.randint(0, 200), 0))
+            elif action < 0.7:
+                try:
+                    free_drawing.connect_node(*rnd.sample(nodes, 2))
+                except ForestError:
+                    continue
+            elif action < 0.85 and forest.edges:
+                free_drawing.delete_edge(rnd.choice(list(forest.edges.values())), fade=False)
+            else:
+                free_drawing.delete_node(rnd.choice(nodes), fade=False)
+            forest.undo_manager.take_snapshot('edit %s' % i)
+            states.append(structure(forest))
+        return states
+
+    def test_undo_and_redo(self):
+        for seed in range(12):
+            states = self.edit_randomly(seed)
+            forest = ctrl.forest
+            for i in reversed(range(len(states) - 1)):
+                forest.undo_manager.undo()
+                self.assertEqual(structure(forest), states[i], 'seed %s, undo to %s' % (seed, i))
+            for i in range(1, len(states)):
+                forest.undo_manager.redo()
+                self.assertEqual(structure(forest), states[i], 'seed %s, redo to %s' % (seed, i))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-import os, csv, itertools
+import argparse, os, csv
 # Fully automated version from semi-automated path analyser in Evelina Leivada's dissertation 
 # (2015, The nature and limits of variation across languages and pathologies 
 # (Doctoral dissertation, Universitat de Barcelona).
@@ -8,6 +8,10 @@ import os, csv, itertools
 # (Longobardi & Guardiano 2009: 1697), build networks of dependant parameters defined there and
 # finally build all of the possible routes to each parameter, 'setability paths' in Leivada's 
 # Appendix S2.
+# This can be imported: read_data gives the parameters and language data, and PathEngine the
+# paths and the languages where they are realized.
+
+default_data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parameterdata.csv')
 
 
 class Path:
@@ -144,64 +148,9 @@ class Parameter:
         self.parent = connect(self, self.parent)
 
 
-def recursive_build(my_path, node):
-    my_path.append(node)
-    if isinstance(node, Parameter):
-        if not node.parent:
-            return my_path
-        my_path = recursive_build(my_path, node.parent)
-        return my_path
-    elif isinstance(node, OrPath):
-        divide = []
-        for item in node.paths:
-            res = recursive_build([], item)
-            if res and isinstance(res[0], list):
-                divide += res
-            elif res:
-                divide.append(res)
-        my_path = [my_path.copy() + new_p for new_p in divide]
-        return my_path
-    elif isinstance(node, AndPath):
-        new_paths = []
-        parts = []
-        for item in node.paths:
-            res = recursive_build([], item)
-            if res and isinstance(res[0], list):
-                parts.append(res)
-            else:
-                parts.append([res])
-        path_endings = itertools.product(*parts)
-        for tupleitem in path_endings:
-            new_path = my_path.copy()            
-            for item in tupleitem:
-                if isinstance(item, list):
-                    new_path += item
-                else:
-                    new_path.append(item)
-            new_paths.append(new_path)
-        return new_paths
-
-
-def turn_to_valued_paths(paths, params):
-    valpaths = []
-    for path in paths:
-        revpath = list(reversed(path))
-        valpath = []
-        parent_node = None
-        for node in revpath:
-            if parent_node:
-                if node in parent_node.plus_path:
-                    valpath.append((parent_node.index, '+'))
-                elif node in parent_node.minus_path:
-                    valpath.append((parent_node.index, '-'))
-            if isinstance(node, Parameter):
-                parent_node = node
-        valpaths.append(list(reversed(valpath)))
-    valpaths.sort(key=len)
-    return valpaths
-
-
 def scan_child_path(langdata, path_tuples):
+    """ Test one path against one language. PathEngine does the same for all languages at once
+    with bitmasks. """
     for key, value in path_tuples:
         if isinstance(key, str) and key.startswith('~'):
             if value == langdata[int(key[1:]) - 1]:
@@ -211,59 +160,161 @@ def scan_child_path(langdata, path_tuples):
     return True
 
 
-#### Preparing data 
-
-file = open('parameterdata.csv')
-header, *reader = list(csv.reader(file, delimiter=';'))
-lang_names = header[3:]
-lang_data = [[] for x in lang_names]
-params = [None] # spend the index 0, so parameter numbering and their indexes match 
+#### Preparing data
 
-for n, name, dependency_string, *row in reader:
-    new_param = Parameter(n, name, dependency_string, row)
-    params.append(new_param)
-    for i, value in enumerate(row):
-        lang_data[i].append(value)
+def read_data(filename=default_data_file):
+    """ Read parameters and language data from csv and connect parameters by their dependency
+    strings ("+7, -22, ( -25, +26 )  or +27, +42 or +45 or -50" in csv).
+    :param filename:
+    :return: (params, lang_names, lang_data). params[i] is parameter i, params[0] is None.
+    lang_data has a list of parameter values for each language.
+    """
+    with open(filename) as file:
+        header, *reader = list(csv.reader(file, delimiter=';'))
+    lang_names = header[3:]
+    lang_data = [[] for x in lang_names]
+    params = [None] # spend the index 0, so parameter numbering and their indexes match
 
-lang_dict = dict(zip(lang_names, lang_data))
+    for n, name, dependency_string, *row in reader:
+        new_param = Parameter(n, name, dependency_string, row)
+        params.append(new_param)
+        for i, value in enumerate(row):
+            lang_data[i].append(value)
 
-### Parsing dependency strings ("+7, -22, ( -25, +26 )  or +27, +42 or +45 or -50" in csv)
-for param in params:
-    if param and param.dependency_string and not param.parent:
-        param.build_paths()
-        param.connect_paths(params)
+    for param in params:
+        if param and param.dependency_string and not param.parent:
+            param.build_paths()
+            param.connect_paths(params)
+    return params, lang_names, lang_data
+
+
+class PathEngine:
+    """ Figures all possible paths to set each parameter and tests them against languages.
+
+    A path is a tuple of (parameter index, value) -conditions. Paths are expanded from the
+    parameter towards the roots of the dependency network, and expansions of shared parents
+    are memoized, so each part of the network is expanded once.
+
+    Language data is packed into bitmasks: for each (parameter index, value) there is an int
+    where bit j is set if language j has that value. Mask of a path is the AND of masks of its
+    conditions, and it is computed along the expansion, so testing a path against all
+    languages is a single lookup.
+
+    Dependencies on something that is not a parameter (e.g. '+A-Compl') can't be tested: as
+    an alternative of 'or' they are left out, as a part of 'and' they are ignored.
+    """
+
+    def __init__(self, params, lang_names, lang_data):
+        self.params = params
+        self.lang_names = lang_names
+        self.all_languages = (1 << len(lang_names)) - 1
+        self.masks = {}  # (parameter index, value) -> bitmask of languages
+        for j, values in enumerate(lang_data):
+            for i, value in enumerate(values, start=1):
+                self.masks[i, value] = self.masks.get((i, value), 0) | (1 << j)
+        self._routes = {}  # memoized expansions
+
+    def paths(self, param):
+        """ All possible paths to set the parameter, shortest first, each with its bitmask
+        :param param: Parameter
+        :return: list of (conditions, mask) -pairs
+        """
+        if not param.parent:
+            return []
+        routes = self._routes_through(param.parent, param) or []
+        unique = {}
+        for conditions, mask in routes:
+            unique.setdefault(frozenset(conditions), (conditions, mask))
+        return sorted(unique.values(), key=lambda route: len(route[0]))
+
+    def _routes_through(self, node, child):
+        """ Routes from roots to child, when child depends on node
+        :param node: Parameter, AndPath, OrPath or str for unknown dependencies
+        :param child: Parameter, AndPath or OrPath
+        :return: list of (conditions, mask) -pairs, or None if node can't be tested
+        """
+        if isinstance(node, Parameter):
+            if child in node.plus_path:
+                value = '+'
+            elif child in node.minus_path:
+                value = '-'
+            else:
+                return None
+            key = (id(node), value)
+        elif isinstance(node, (AndPath, OrPath)):
+            key = id(node)
+        else:
+            return None
+        if key in self._routes:
+            return self._routes[key]
+
+        if isinstance(node, Parameter):
+            condition = (node.index, value)
+            condition_mask = self.masks.get(condition, 0)
+            if node.parent:
+                above = self._routes_through(node.parent, node) or []
+            else:
+                above = [((), self.all_languages)]
+            routes = [(conditions + (condition,), mask & condition_mask)
+                      for conditions, mask in above]
+        elif isinstance(node, OrPath):
+            routes = []
+            for item in node.paths:
+                routes += self._routes_through(item, node) or []
+        else:
+            routes = [((), self.all_languages)]
+            for item in node.paths:
+                item_routes = self._routes_through(item, node)
+                if item_routes is None:
+                    continue
+                routes = [(conditions + tuple(c for c in item_conditions if c not in conditions),
+                           mask & item_mask)
+                          for conditions, mask in routes
+                          for item_conditions, item_mask in item_routes]
+        self._routes[key] = routes
+        return routes
+
+    def languages(self, mask):
+        """
+        :param mask: bitmask of languages
+        :return: names of languages in mask
+        """
+        return [name for j, name in enumerate(self.lang_names) if mask >> j & 1]
 
-## Figuring all possible paths to set each parameter
-for param in params:
-    if param: 
-        tree = recursive_build([], param)
-        if tree and isinstance(tree[0], list):
-            param.paths_to_test = turn_to_valued_paths(tree, params)
 
 # Actual testing
-def test_parameter(param):
+def test_parameter(engine, param):
     print(' ****************** Param %s : %s *******************' % (param.index, param.name))
     s = []
-    for lang_name in lang_names:
+    for lang_name in engine.lang_names:
         s.append(lang_name.center(5))
     print(''.join(s))
-    for path in param.paths_to_test:        
+    for path, mask in engine.paths(param):
         s = []
-        for lang_name in lang_names:
-            lang = lang_dict[lang_name]
-            if scan_child_path(lang, path):
+        for j in range(len(engine.lang_names)):
+            if mask >> j & 1:
                 s.append('  1  ')
             else:
                 s.append('  .  ')
         print(''.join(s))
 
-test_only = 0
-if test_only:
-    test_parameter(params[test_only])
-else:
-    for param in params:
-        if param and param.paths_to_test: 
-            if len(param.paths_to_test) > 20:
-                continue
-            test_parameter(param)
 
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Test setability paths of parameters.')
+    ap.add_argument('params', nargs='*', type=int,
+                    help='numbers of parameters to test, default is all of them')
+    ap.add_argument('-f', '--file', default=default_data_file, help='parameter data csv')
+    args = ap.parse_args(argv)
+    params, lang_names, lang_data = read_data(args.file)
+    engine = PathEngine(params, lang_names, lang_data)
+    if args.params:
+        to_test = [params[i] for i in args.params]
+    else:
+        to_test = [param for param in params if param]
+    for param in to_test:
+        if engine.paths(param):
+            test_parameter(engine, param)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+""" Benchmark for LCA linearization in syntax/ConstituentStructures.py.
+
+Generates binary trees of increasing depth and linearizes their terminals with
+ConstituentStructures.lca, which sorts d(A) topologically. For small trees the result and time
+are compared to the earlier approach: pairwise asymmetric c-command by set containment, then
+sorting with a comparator that scans d(A).
+
+Trees are either 'kayne' trees, where each phrase has a head and a phrase and the lowest phrase
+has a unary branch, so that d(A) is a linear ordering, or 'random' binary trees, where LCA
+usually fails and unresolved or symmetric pairs are reported.
+
+Run in the root folder of Kataja:
+python3 tools/lca_benchmark.py [-d 4 8 16 32 64 128 256] [--naive-limit 32]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from functools import cmp_to_key
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'syntax'))
+sys.path.insert(0, root)
+
+from syntax.ConstituentStructures import ConstituentStructures
+
+
+class Node:
+    def __init__(self, label, parts=None):
+        self.label = label
+        self.parts = parts or []
+
+    def __str__(self):
+        return self.label
+
+    def __contains__(self, c):
+        if self is c:
+            return True
+        for part in self.parts:
+            if c in part:
+                return True
+        return False
+
+
+def kayne_tree(depth):
+    """ [XP x [YP y ... [ZP z [WP w]]]] with specifiers and complements in random order
+    :param depth: number of phrases
+    :return: Node
+    """
+    tree = Node('WP', [Node('w')])
+    for i in range(depth):
+        head = Node('h%s' % i)
+        parts = [head, tree] if random.random() < 0.5 else [tree, head]
+        tree = Node('%sP' % head.label, parts)
+    return tree
+
+
+def random_tree(depth):
+    """ Binary tree where branches end randomly before given depth
+    :param depth:
+    :return: Node
+    """
+    counter = [0]
+
+    def grow(d):
+        counter[0] += 1
+        if d == 0 or (d < depth and random.random() < 0.3):
+            return Node('t%s' % counter[0])
+        return Node('n%s' % counter[0], [grow(d - 1), grow(d - 1)])
+
+    return grow(depth)
+
+
+def naive_lca(tree):
+    """ Earlier implementation: d(A) from pairwise c-command by containment, then sorting with a
+    comparator that scans d(A) for each comparison.
+    :param tree:
+    :return: list of terminals or [] if they couldn't be sorted
+    """
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(reversed(node.parts))
+
+    def c_command(a, b):
+        if b in a or a in b:
+            return False
+        for g in nodes:
+            if g is not a and a in g and (g is b or b not in g):
+                return False
+        return True
+
+    def terminals_of(x):
+        return [t for t in nodes if not t.parts and t in x]
+
+    T = [n for n in nodes if not n.parts]
+    dA = set()
+    for a in nodes:
+        at = terminals_of(a)
+        if len(at) != 1:
+            continue
+        for b in nodes:
+            if c_command(a, b) and not c_command(b, a):
+                bt = terminals_of(b)
+                if len(bt) == 1:
+                    dA.add((at[0], bt[0]))
+
+    def sort_func(x, y):
+        for first, second in dA:
+            if first is x and second is y:
+                return -1
+            elif first is y and second is x:
+                return 1
+        raise ValueError
+
+    try:
+        return sorted(T, key=cmp_to_key(sort_func))
+    except ValueError:
+        return []
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmark LCA linearization.')
+    ap.add_argument('-d', '--depths', nargs='+', type=int,
+                    default=[4, 8, 16, 32, 64, 128, 256])
+    ap.add_argument('-s', '--shape', choices=['kayne', 'random'], default='kayne')
+    ap.add_argument('--naive-limit', type=int, default=32,
+                    help='compare to earlier implementation up to this depth')
+    ap.add_argument('--seed', type=int, default=1)
+    args = ap.parse_args(argv)
+    random.seed(args.seed)
+    make_tree = kayne_tree if args.shape == 'kayne' else random_tree
+    cs = ConstituentStructures(config_path=os.devnull)
+    print('%6s %8s %10s %10s  %s' % ('depth', 'nodes', 'lca (s)', 'naive (s)', 'result'))
+    for depth in args.depths:
+        if args.shape == 'random' and depth > 16:
+            print('%6s skipped, random trees of this depth are too large' % depth)
+            continue
+        tree = make_tree(depth)
+        cs.forget_index()
+        t0 = time.perf_counter()
+        linearization = cs.lca(tree)
+        lca_time = time.perf_counter() - t0
+        node_count = len(cs.index(tree))
+        if linearization:
+            result = 'linear, %s terminals' % len(linearization.order)
+        else:
+            result = '%s symmetric, %s unresolved pairs' % (len(linearization.symmetric),
+                                                           len(linearization.unresolved))
+        naive_time = ''
+        if depth <= args.naive_limit:
+            t0 = time.perf_counter()
+            naive_order = naive_lca(tree)
+            naive_time = '%10.4f' % (time.perf_counter() - t0)
+            expected = linearization.order if linearization else []
+            if [id(t) for t in naive_order] != [id(t) for t in expected]:
+                result += ', DIFFERS FROM EARLIER IMPLEMENTATION'
+        print('%6s %8s %10.4f %10s  %s' % (depth, node_count, lca_time, naive_time, result))
+
+
+if __name__ == '__main__':
+    main()